@@ -0,0 +1,48 @@
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import sequence_ops
+
+
+# Previous implementations (NCBIdna.reverse_complement, check_primer.is_valid_dna), kept here as the reference
+def old_reverse_complement(dna_sequence):
+    DNA_code = ["A", "T", "C", "G", "N", "a", "t", "c", "g", "n"]
+    if not all(char in DNA_code for char in dna_sequence):
+        isdna = 'Please use only A T G C'
+        return isdna
+    complement_dict = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
+    reverse_sequence = dna_sequence[::-1].upper()
+    complement_sequence = ''.join(complement_dict.get(base, base) for base in reverse_sequence)
+    return complement_sequence
+
+
+def old_is_valid_dna(seq):
+    return all(base in "ATGCatgc" for base in seq)
+
+
+def old_gc_content(seq):
+    return (seq.count("G") + seq.count("C")) * 100 / len(seq)
+
+
+def bench(label, old, new, number):
+    old_time = timeit.timeit(old, number=number) / number
+    new_time = timeit.timeit(new, number=number) / number
+    print(f"{label:<22} old {old_time * 1000:9.2f} ms   new {new_time * 1000:8.3f} ms   x{old_time / new_time:6.1f}")
+
+
+if __name__ == "__main__":
+    for length in (10_000, 1_000_000, 5_000_000):
+        sequence = "".join(random.choices("ACGT", k=length))
+        assert old_reverse_complement(sequence) == sequence_ops.reverse_complement(sequence, upper=True)
+        assert old_is_valid_dna(sequence) == sequence_ops.is_valid_dna(sequence)
+
+        number = 20 if length <= 1_000_000 else 3
+        print(f"--- {length:,} bases")
+        bench("reverse complement", lambda: old_reverse_complement(sequence),
+              lambda: sequence_ops.reverse_complement(sequence, upper=True), number)
+        bench("validation", lambda: old_is_valid_dna(sequence), lambda: sequence_ops.is_valid_dna(sequence), number)
+        bench("GC%", lambda: old_gc_content(sequence), lambda: sequence_ops.gc_content(sequence), number)
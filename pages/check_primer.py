@@ -12,6 +12,7 @@ import streamlit as st
 from stqdm import stqdm
 from pages.design_primer_API import NCBIdna, Primer3
 
+from utils import sequence_ops
 from utils.page_config import page_config
 
 
@@ -22,12 +23,11 @@ ucsc_species = {
 
 
 def is_valid_dna(seq):
-    return all(base in "ATGCatgc" for base in seq)
+    return sequence_ops.is_valid_dna(seq, sequence_ops.ACGT)
 
 
 def reverse_complement(seq):
-    complement = str.maketrans("ATGCatgc", "TACGtacg")
-    return seq.translate(complement)[::-1]
+    return sequence_ops.reverse_complement(seq)
 
 
 # Page config
@@ -105,7 +105,8 @@ if st.session_state.primers:
             st.rerun()
 
     if st.button("Run"):
-        results = []
+        # Every pair is submitted first, primer-BLAST jobs are then polled together
+        validations = []
         for primer in st.session_state.primers:
             left_seq = primer["Forward"]
             right_seq = primer["Reverse"]
@@ -113,9 +114,11 @@ if st.session_state.primers:
                 org = ucsc_species[species]["org"]
                 db = ucsc_species[species]["db"]
                 wp_targets = ucsc_species[species]["wp_target"]
-                val_rel, val_abs, seq_rel, seq_abs = Primer3.fetch_ucsc_pcr_results(
-                    left_seq, right_seq, species, org, db, wp_targets)
-                results.append(seq_rel)
+                validations.append(Primer3.validate_pair(left_seq, right_seq, species, org, db, wp_targets))
+        results = []
+        for validation in validations:
+            val_rel, val_abs, seq_rel, seq_abs = validation.result()
+            results.append(seq_rel)
         st.write(results)
 
 
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 import io
 import json
 
@@ -7,11 +8,15 @@ from io import StringIO
 
 import altair as alt
 import pandas as pd
-import requests
 import streamlit as st
-from stqdm import stqdm
 from pages.design_primer_API import NCBIdna, Primer3
+from pages.design_primer_API.checkpoint import ExtractionCheckpoint
+from pages.design_primer_API.jobs import JobRunner
+from pages.design_primer_API.local_pcr import PcrIndex, amplification_matrix
+from pages.design_primer_API.network import SharedBudget
+from pages.design_primer_API.planner import ExtractionPlanner
 
+from utils.packed_sequence import PackedSequence
 from utils.page_config import page_config
 
 ucsc_species = [
@@ -128,6 +133,18 @@ ucsc_species = [
 ]
 
 
+@st.cache_resource
+def ncbi_budget():
+    # One NCBI/UCSC rate budget and request coalescer for every session of this server, not one per user
+    return SharedBudget()
+
+
+@st.cache_resource
+def job_runner():
+    # Extractions and designs run here, outside the script: reruns and widget changes no longer abort them
+    return JobRunner()
+
+
 def reset_defaults():
     st.session_state["min_amplicon_size"] = 60
     st.session_state["max_amplicon_size"] = 250
@@ -147,6 +164,14 @@ def reset_defaults():
     st.session_state["only_validated"] = False
 
 
+def pack_variants(variants):
+    # Sequences kept in the session are 2-bit packed, primer3 only decodes the exon ranges it reads
+    for data in variants.values():
+        if isinstance(data.get('sequence'), str):
+            data['sequence'] = PackedSequence(data['sequence'])
+    return variants
+
+
 def parse_fasta_to_json(fasta_text):
     lines = fasta_text.strip().split("\n")
     variants = {}
@@ -299,6 +324,268 @@ def graphique(exons, primers, normalization=False):
     return final_chart
 
 
+# Background jobs (job_runner threads): no st.* call in these, the page reads job.snapshot() on each rerun
+def extraction_job(job, gene_ids, species, all_slice_forms):
+    # Each finished gene is checkpointed: a cancelled or failed extraction resumes where it stopped
+    checkpoint = ExtractionCheckpoint.for_job(gene_ids, species=species, seq_type="rna",
+                                              all_slice_forms=bool(all_slice_forms))
+    resumed = len(checkpoint.completed())
+    job.progress(0, len(gene_ids), f"resuming, {resumed} gene(s) already extracted" if resumed else "info")
+
+    def extraction_progress(done, total, gene_id):
+        if job.cancelled():
+            raise InterruptedError("Extraction cancelled")
+        job.progress(done, total, gene_id)
+
+    extracted = NCBIdna.find_sequences_batch(gene_ids, species, all_slice_forms=all_slice_forms,
+                                             progress=extraction_progress, checkpoint=checkpoint)
+    for gene_id, (all_variants_output, message) in extracted.items():
+        if "Error 200" not in all_variants_output:
+            all_variants_output = pack_variants(all_variants_output)
+        job.add_result((gene_id, species), (all_variants_output, message))
+    checkpoint.clear()
+
+
+def planned_extraction_job(job, groups, all_slice_forms):
+    def extraction_progress(done, total, gene_id, species):
+        if job.cancelled():
+            raise InterruptedError("Extraction cancelled")
+        job.progress(done, total, f"**{gene_id}** from **{(species or 'ID').capitalize()}**")
+
+    # Checkpointed per group like extraction_job: a cancelled or failed extraction resumes where it stopped
+    job.progress(0, ExtractionPlanner.job_count(groups))
+    for gene_id, species, all_variants_output, message in ExtractionPlanner.run(
+            groups, all_slice_forms=all_slice_forms, progress=extraction_progress, resume=True):
+        if "Error 200" not in all_variants_output:
+            all_variants_output = pack_variants(all_variants_output)
+        job.add_result((gene_id, species), (all_variants_output, message))
+
+
+def design_job(job, variants, settings):
+    # Variants are designed in parallel by the Primer3 process pool, results come back in the session order
+    job.progress(0, len(variants), "Initializing")
+
+    def design_progress(variant, data):
+        job.update(1)
+        job.set_description(f"Primers designed for {variant} - {data['gene_name']}")
+
+    for variant, data, primers in Primer3.design_variants(variants.items(), settings, progress=design_progress,
+                                                          cancelled=job.cancelled):
+        job.add_result(variant, (data['gene_name'], data['normalized_exon_coords'], primers))
+
+
+def job_progress(state, text):
+    fraction = min(state['done'] / state['total'], 1.0) if state['total'] else 0.0
+    st.progress(fraction, text=text)
+
+
+@st.fragment(run_every=1)
+def extraction_status():
+    # Polls the extraction job, then hands its variants to the session and reruns the whole page
+    job = job_runner().get(st.session_state.get('extraction_job'))
+    if job is None:
+        st.session_state.pop('extraction_job', None)
+        return
+
+    state = job.snapshot()
+    if not job.is_finished():
+        job_progress(state, f"**:blue[Extract sequence... {state['message']}]** ({state['done']}/{state['total']})")
+        if st.button("⏹️ Cancel extraction", key='cancel_extraction'):
+            job_runner().cancel(job.job_id)
+        return
+
+    all_variants = {}
+    report = {'extracted': [], 'errors': []}
+    for (gene_id, species), (all_variants_output, message) in state['results'].items():
+        if "Error 200" not in all_variants_output:
+            report['extracted'].append(f"**{gene_id}** from **{species or 'ID'}**")
+            all_variants.update(all_variants_output)
+        else:
+            report['errors'].append(message)
+    if state['status'] == 'failed':
+        report['errors'].append(f"Extraction failed: {state['error']}")
+    elif state['status'] == 'cancelled':
+        report['errors'].append("Extraction cancelled, extracted genes are kept for the next run")
+
+    if all_variants or state['status'] == 'done':
+        st.session_state['all_variants'] = all_variants
+    st.session_state['extraction_report'] = report
+    del st.session_state['extraction_job']
+    st.rerun()
+
+
+def design_results(job_id):
+    job = job_runner().get(job_id)
+    if job is None:
+        return
+
+    state = job.snapshot()
+    if not job.is_finished():
+        job_progress(state, f"{state['message']} ({state['done']}/{state['total']} variants)")
+        if st.button("⏹️ Cancel design", key='cancel_design'):
+            job_runner().cancel(job_id)
+    elif state['status'] == 'failed':
+        st.error(f"Primer design failed: {state['error']}")
+
+    primers_result = []
+    for variant, (gene_name, exons, primers) in state['results'].items():
+        if len(primers) > 0:
+            for idx, primer_set in enumerate(primers):
+                primers_result.append({
+                    'Gene': str(variant) + gene_name,
+                    'Pair': idx + 1,
+                    'Product Size (bp)': primer_set['amplicon_size'],
+                    'Product Tm (°C)': primer_set['amplicon_tm'],
+                    "Product Seq. (5'->3')": primer_set['amplicon_seq'],
+                    'Validated': primer_set['validation_relative'],
+                    "For. Pr.(5'->3')": primer_set['left_primer']['sequence'],
+                    'For. Len. (bp)': primer_set['left_primer']['length'],
+                    'For. Pos.': primer_set['left_primer']['position'],
+                    'For. Pos. Abs. (bp)': primer_set['left_primer']['position_abs'],
+                    'For. Tm (°C)': primer_set['left_primer']['tm'],
+                    'For. GC%': primer_set['left_primer']['gc_percent'],
+                    'For. Self Compl.': primer_set['left_primer']['self_complementarity'],
+                    "For. Self 3' Compl.": primer_set['left_primer']['self_3prime_complementarity'],
+                    "Rev. Pr.(5'->3')": primer_set['right_primer']['sequence'],
+                    'Rev. Len. (bp)': primer_set['right_primer']['length'],
+                    'Rev. Pos.': primer_set['right_primer']['position'],
+                    'Rev. Pos. Abs.': primer_set['right_primer']['position_abs'],
+                    'Rev. Tm (°C)': primer_set['right_primer']['tm'],
+                    'Rev. GC%': primer_set['right_primer']['gc_percent'],
+                    'Rev. Self Compl.': primer_set['right_primer']['self_complementarity'],
+                    "Rev. Self 3' Compl.": primer_set['right_primer']['self_3prime_complementarity'],
+                    'Product Size Abs. (bp)': primer_set['amplicon_size_abs'],
+                    'Validated Abs.': primer_set['validation_absolute'],
+                    'validation_relative_sequences': primer_set['validation_relative_sequences'],
+                })
+
+            with st.expander(f'Primers info and graph location for {variant} {gene_name}',
+                             expanded=False):
+                if len(exons) > 1:
+                    st.altair_chart(graphique(exons, primers),
+                                    theme=None, use_container_width=True, key=f"{variant}_exon_intron")
+                st.altair_chart(graphique(exons, primers, True), theme=None, use_container_width=True,
+                                key=f"{variant}_exon")
+
+                for idx, primer_set in enumerate(primers):
+                    st.markdown("---")
+                    st.subheader(f"Primer set {idx + 1} for {variant} {gene_name}")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        st.subheader("Forward primer")
+                        st.markdown(f"**Sequence:** `{primer_set['left_primer']['sequence']}`")
+                        st.markdown(f"**Length:** {primer_set['left_primer']['length']} bp")
+                        st.markdown(f"**Tm:** {primer_set['left_primer']['tm']} °C")
+                        st.markdown(f"**GC%:** {primer_set['left_primer']['gc_percent']}")
+                        st.markdown(f"**Self-compl.:** {primer_set['left_primer']['self_complementarity']}")
+                        st.markdown(
+                            f"**3'-compl.:** {primer_set['left_primer']['self_3prime_complementarity']}")
+                    with col2:
+                        st.subheader("Reverse primer")
+                        st.markdown(f"**Sequence:** `{primer_set['right_primer']['sequence']}`")
+                        st.markdown(f"**Length:** {primer_set['right_primer']['length']} bp")
+                        st.markdown(f"**Tm:** {primer_set['right_primer']['tm']} °C")
+                        st.markdown(f"**GC%:** {primer_set['right_primer']['gc_percent']}")
+                        st.markdown(f"**Self-compl.:** {primer_set['right_primer']['self_complementarity']}")
+                        st.markdown(
+                            f"**3'-compl.:** {primer_set['right_primer']['self_3prime_complementarity']}")
+                    st.markdown("")
+                    st.markdown(f"**Product Size (bp):** {primer_set['amplicon_size']} bp")
+                    st.markdown(f"**Product Tm (°C):** {primer_set['amplicon_tm']}°C")
+                    st.markdown(f"**Product sequence:** `{primer_set['amplicon_seq']}`")
+                    if st.session_state["ucsc_validation"] is True:
+                        validation_status = primer_set['validation_relative']
+                        color = "green" if validation_status is True else "red"
+                        validation_text = "Yes" if validation_status is True else (
+                            "No" if validation_status is False else str(validation_status)
+                        )
+
+                        st.markdown(f"**Validated:** <span style='color:{color}'>{validation_text}</span>",
+                                    unsafe_allow_html=True)
+
+                        st.write(primer_set['validation_relative_sequences'])
+        else:
+            st.warning(f"No primers were designed for {variant} {gene_name}")
+
+    if primers_result:
+        all_columns = list(primers_result[0].keys())
+        if not st.session_state.get("ucsc_validation", False):
+            all_columns = [col for col in all_columns if col != "Validated"]
+            all_columns = [col for col in all_columns if col != "Validated Abs."]
+        all_columns = [col for col in all_columns if col != "validation_relative_sequences"]
+        abs_columns = [col for col in all_columns if "Abs." in col]
+        other_columns = [col for col in all_columns if col not in abs_columns]
+        ordered_columns = other_columns + abs_columns
+        df = pd.DataFrame(primers_result)[ordered_columns]
+        st.dataframe(df, hide_index=True)
+
+        matrix = isoform_matrix(state['results'])
+        if matrix is not None:
+            st.markdown("**Amplified variants** (product sizes in bp, empty when the pair gives no product)")
+            st.dataframe(matrix)
+
+        if job.is_finished():
+            csv_file = pd.DataFrame(primers_result).to_csv(index=False)
+            excel_file = io.BytesIO()
+            pd.DataFrame(primers_result).to_excel(excel_file, index=False, sheet_name='Sheet1')
+            excel_file.seek(0)
+
+            download_button1, download_button2 = st.columns(2, gap='small')
+            current_date_time = datetime.datetime.fromtimestamp(job.finished).strftime("%Y%m%d_%H%M%S")
+            download_button1.download_button("💾 Download table (.xlsx)", excel_file,
+                                             file_name=f'LabmasterDP_{current_date_time}.xlsx',
+                                             mime="application/vnd.ms-excel", key='download-excel')
+            download_button2.download_button(label="💾 Download table (.csv)", data=csv_file,
+                                             file_name=f"LabmasterDP_{current_date_time}.csv", mime="text/csv")
+
+
+def sequence_digest(sequence):
+    if isinstance(sequence, PackedSequence):
+        return sequence.digest()
+    return hashlib.sha256(str(sequence).encode()).hexdigest()
+
+
+def variants_index():
+    # k-mer index over every loaded variant, rebuilt only when the extraction changes. Keyed by content: two FASTA
+    # files with as many records get the same variant names (1..n)
+    variants = st.session_state.get('all_variants', {})
+    key = tuple((variant, sequence_digest(data['sequence'])) for variant, data in variants.items())
+    if st.session_state.get('variants_index_key') != key:
+        st.session_state['variants_index'] = PcrIndex.from_sequences(
+            {variant: data['sequence'] for variant, data in variants.items()}) if variants else None
+        st.session_state['variants_index_key'] = key
+    return st.session_state['variants_index']
+
+
+def isoform_matrix(results):
+    # Pair x transcript table of the product sizes each designed pair gives on the loaded variants
+    index = variants_index()
+    if index is None:
+        return None
+    pairs, max_size = [], 0
+    for variant, (gene_name, exons, primers) in results.items():
+        for idx, primer_set in enumerate(primers):
+            pairs.append((f"{variant}{gene_name} - Pair {idx + 1}", primer_set['left_primer']['sequence'],
+                          primer_set['right_primer']['sequence']))
+            max_size = max(max_size, primer_set['amplicon_size'])
+    if not pairs:
+        return None
+    # Room for isoforms carrying an extra exon between the primers
+    matrix = amplification_matrix(index, pairs, 2 * max_size + 1000)
+    transcripts = [name for name in index.names if any(name in row for row in matrix.values())]
+    return pd.DataFrame([[", ".join(str(size) for size in sorted(row.get(name, []))) for name in transcripts]
+                         for row in matrix.values()], index=list(matrix), columns=transcripts)
+
+
+@st.fragment(run_every=2)
+def design_monitor(job_id):
+    # Live view while the job runs, one full rerun once it is over so the page stops polling
+    job = job_runner().get(job_id)
+    if job is not None and job.is_finished():
+        st.rerun()
+    design_results(job_id)
+
+
 # Page config
 page_config()
 
@@ -312,7 +599,6 @@ colextract1, colextract2, colextract3 = st.columns([0.5, 1.5, 1.5], gap="small")
 
 # Extraction of DNA sequence
 with colextract1:
-    all_variants = {}
     upstream_entry = []
 
     # Gene ID
@@ -337,37 +623,15 @@ with colextract2:
 
         # Run Promoter Finder
         if st.button(f"🧬 :blue[**Step 1.3**] Extraction...", help='(~5sec/gene)'):
-            response = requests.get(
-                'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=gene&term=nos2[Gene%20Name]+AND+human[Organism]&retmode=json&rettype=xml')
+            response = ncbi_budget().http_get(
+                'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=gene&term=nos2[Gene%20Name]+AND+human[Organism]&retmode=json&rettype=xml',
+                use_cache=False)
 
             ncbi_status = True if response.status_code == 200 else False
 
             if ncbi_status is True:
-                with st.spinner('Please wait...'):
-                    with colextract1:
-
-                        pbar = st.progress(0,
-                                           text='**:blue[Extract info...] ⚠️:red[PLEASE WAIT UNTIL END WITHOUT CHANGING ANYTHING]**')
-                        for i, gene_id in enumerate(gene_ids):
-                            pbar.progress(i / len(gene_ids),
-                                          text=f'**:blue[Extract info... {gene_id}] ⚠️:red[PLEASE WAIT UNTIL END WITHOUT CHANGING ANYTHING]**')
-                            all_variants_output, message = NCBIdna(gene_id, species,
-                                                                   all_slice_forms=True if all_slice_form else False).find_sequences()
-                            if "Error 200" not in all_variants_output:
-                                pbar.progress((i + 1) / len(gene_ids),
-
-                                              text=f'**:blue[Extract sequence... {gene_id}] ⚠️:red[PLEASE WAIT UNTIL END WITHOUT CHANGING ANYTHING]**')
-                                st.toast(f"**{gene_id}** from **{species}** extracted", icon='🧬')
-
-                                all_variants.update(all_variants_output)
-
-                            else:
-                                st.error(message)
-                                continue
-
-                        st.session_state['all_variants'] = all_variants
-                        st.success(f"Info extraction complete !")
-                        st.toast(f"Info extraction complete !", icon='😊')
+                st.session_state['extraction_job'] = job_runner().submit(
+                    "extraction", extraction_job, gene_ids, species, True if all_slice_form else False)
 
             elif ncbi_status is False:
                 st.warning("⚠ NCBI servers are under maintenance or have an error")
@@ -386,7 +650,8 @@ with colextract2:
         )
 
         species_list = ['human', 'mouse', 'rat', 'drosophila', 'zebrafish']
-        search_types = ['promoter', 'terminator']
+        # The table has no promoter/terminator columns: Advance extracts the same sequence type as Default
+        search_type = 'rna'
 
         st.markdown('**🔹 :blue[Step 1.2]** Select species for all genes:',
                     help='Checking a box allows you to check all the corresponding boxes for each gene. Warning: if you have manually checked boxes in the table, they will be reset.')
@@ -447,61 +712,32 @@ with colextract2:
         )
 
         if st.button("🧬 :blue[**Step 1.4**] Extract sequences", help="(~5sec/seq)", key='Advance'):
-            response = requests.get(
-                'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=gene&term=nos2[Gene%20Name]+AND+human[Organism]&retmode=json&rettype=xml')
+            response = ncbi_budget().http_get(
+                'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=gene&term=nos2[Gene%20Name]+AND+human[Organism]&retmode=json&rettype=xml',
+                use_cache=False)
 
             ncbi_status = True if response.status_code == 200 else False
 
             if ncbi_status is True:
-                with colextract1:
-                    pbar = st.progress(0,
-                                       text='**:blue[Extract sequence...] ⚠️:red[PLEASE WAIT UNTIL END WITHOUT CHANGING ANYTHING]**')
-                    for i, gene_info in enumerate(data_dff.itertuples(index=False)):
-                        gene_id = gene_info.Gene
-                        if gene_id.isdigit() or gene_id.startswith('XM_') or gene_id.startswith(
-                                'NM_') or gene_id.startswith('XR_') or gene_id.startswith('NR_'):
-                            for search_type in search_types:
-                                if getattr(gene_info, f'{search_type}'):
-                                    pbar.progress((i + 1) / len(data_dff),
-                                                  text=f'**:blue[Extract sequence...**{gene_id}** from **{species}**] ⚠️:red[PLEASE WAIT UNTIL END WITHOUT CHANGING ANYTHING]**')
-
-                                    all_variants_output, message = NCBIdna(gene_id).find_sequences()
-
-                                    if "Error 200" not in all_variants_output:
-                                        st.toast(f"**{gene_id}** from **{species}** extracted",
-                                                 icon='🧬')
-
-                                        all_variants.update(all_variants_output)
-                                    else:
-                                        st.error(message)
-                                        continue
-
-                        else:
-                            for species in species_list:
-                                for search_type in search_types:
-                                    if getattr(gene_info, f'{species}') and getattr(gene_info,
-                                                                                    f'{search_type}'):
-
-                                        pbar.progress((i + 1) / len(data_dff),
-                                                      text=f'**:blue[Extract sequence... **{gene_id}** from **{species.capitalize()}**] ⚠️:red[PLEASE WAIT UNTIL END WITHOUT CHANGING ANYTHING]**')
-
-                                        all_variants_output, message = NCBIdna(gene_id, species).find_sequences()
-
-                                        if "Error 200" not in all_variants_output:
-                                            st.toast(f"**{gene_id}** from **{species}** extracted",
-                                                     icon='🧬')
-                                            all_variants.update(all_variants_output)
-                                        else:
-                                            st.error(message)
-                                            continue
-
-                    st.session_state['all_variants'] = all_variants
-                    st.success(f"Info extraction complete !")
-                    st.toast(f"Info extraction complete !", icon='😊')
+                # Every checked (gene, species) once, one batched extraction per species
+                groups = ExtractionPlanner.plan(data_dff.to_dict('records'), species_list, search_type)
+                st.session_state['extraction_job'] = job_runner().submit(
+                    "extraction", planned_extraction_job, groups, True if all_slice_form else False)
 
             elif ncbi_status is False:
                 st.warning("⚠ NCBI servers are under maintenance or have an error")
 
+with colextract1:
+    # After the buttons, so a job submitted in this run is already followed
+    if 'extraction_job' in st.session_state:
+        extraction_status()
+    elif 'extraction_report' in st.session_state:
+        for message in st.session_state['extraction_report']['errors']:
+            st.error(message)
+        if st.session_state['extraction_report']['extracted']:
+            st.success(f"Info extraction complete ! "
+                       f"{', '.join(st.session_state['extraction_report']['extracted'])}")
+
 with colextract3:
     default_fasta = """>ExampleGene1 | Homo sapiens\ntacgcaatgtcatgactgcgtttatagatagataaaaagcgtgcgattactaaacgcggatggcgtgcgcactatttcatcggttctgaaatctccatccaatcaaccttactcagacagctcccccgtgacacgggctaccacattcaggtggcttgtaatacatgggtataacatcaatagttcgtgccgcaatacttcgcgggggtacgggtaagtgacgaaagaagtaactctcccactcggagaatctacggtagttgcgcgtttttaattttcatctttgtcctgccagcaatgtacacaccgcaaagtctgtccaagtgcatgctagaccgggtgtgcaccctagggtagagcacggagttgatttcgggcgtgagatcaaggccaaggaggaagtaagcatcgtatctctgtctaatcattgcaggaagggtgcacagcttaggttccccaacaatgcttttagcatgatagctgtctctttgtggactgta\n>ExampleGene2\nttcctctttcaccagctttccatccccgcgacatggcggatcaaaactctggcaaagattaccagtcgaaggcatctcgagatggagatggtaagtttttgtcatacgacccaaacccggaggagacacgttagaaaatccacgacttcttcgaagactaagtggatgagtacaggtcgggaagagtcgactaccctaggatcccgcgtgcggtctacatgtcatgatcctccatgggcccaggccccgtagtgcgactgcggttaattgcatctacgaattttacacttgcgtttaagaccggacgccgggtttctaagtaaaagtttggctatcgacattatttttttaggggcaccgtatcggattccaatgggtggctggattctcagtgaatctccgtagttcgggaaatcactcaggaatgctaatcatccagaatggaaacgtggtaaaagactgccctgcttccctcttttacctcaagaaacaggggcggg"""
 
@@ -525,7 +761,7 @@ with colextract3:
             try:
                 variants = parse_fasta_to_json(fasta_input)
 
-                st.session_state['all_variants'] = variants
+                st.session_state['all_variants'] = pack_variants(variants)
                 st.success(f"{len(variants)} sequence(s) added successfully!")
                 st.rerun()
             except Exception as e:
@@ -543,6 +779,10 @@ if 'all_variants' not in st.session_state:
 if st.session_state['all_variants']:
     df = pd.DataFrame.from_dict(st.session_state['all_variants'], orient="index").reset_index()
     df.rename(columns={"index": "N°/Name"}, inplace=True)
+    if "sequence" in df.columns:
+        # Table and JSON show the start and the length, not megabases of text
+        df["sequence"] = df["sequence"].map(lambda sequence: sequence.preview()
+                                            if isinstance(sequence, PackedSequence) else sequence)
 
     if "species" not in df.columns:
         df["species"] = ""
@@ -682,150 +922,37 @@ if col1_button.button("🔄 Reset defaults"):
     reset_defaults()
     st.rerun()
 
-if 'primers' not in st.session_state:
-    st.session_state['primers'] = None
-
-primers_result = []
-
 if col2_button.button('🏃🏽‍♂️‍➡️ Run design primers',
                       disabled=True if len(st.session_state['all_variants']) < 0 else False):
-    try:
-        total_primers_expected = len(st.session_state['all_variants']) * PRIMER_NUM_RETURN
-        progress_bar = stqdm(total=total_primers_expected, desc="Initializing")
-
-        for variant, data in st.session_state['all_variants'].items():
-            progress_bar.set_description(f"Designing primers for {variant} - {data['gene_name']}")
-
-            st.session_state['primers'] = Primer3.design_primers(variant=variant,
-                                                                 gene_name=data['gene_name'],
-                                                                 species=data['species'],
-                                                                 sequence=data['sequence'],
-                                                                 exons=data['normalized_exon_coords'],
-                                                                 PRIMER_OPT_SIZE=st.session_state["PRIMER_OPT_SIZE"],
-                                                                 PRIMER_MIN_SIZE=st.session_state["PRIMER_MIN_SIZE"],
-                                                                 PRIMER_MAX_SIZE=st.session_state["PRIMER_MAX_SIZE"],
-                                                                 PRIMER_OPT_TM=st.session_state["PRIMER_OPT_TM"],
-                                                                 PRIMER_MIN_TM=st.session_state["PRIMER_MIN_TM"],
-                                                                 PRIMER_MAX_TM=st.session_state["PRIMER_MAX_TM"],
-                                                                 PRIMER_MIN_GC=st.session_state["PRIMER_MIN_GC"],
-                                                                 PRIMER_MAX_GC=st.session_state["PRIMER_MAX_GC"],
-                                                                 PRIMER_NUM_RETURN=PRIMER_NUM_RETURN,
-                                                                 PRIMER_PRODUCT_SIZE_RANGE=[
-                                                                     st.session_state["min_amplicon_size"],
-                                                                     st.session_state["max_amplicon_size"]],
-                                                                 ucsc_validation=st.session_state["ucsc_validation"],
-                                                                 only_validated=st.session_state["only_validated"],
-                                                                 reverse_exon_order=st.session_state[
-                                                                     'reverse_exon_order'],
-                                                                 progress_bar=progress_bar)
-
-            if len(st.session_state['primers']) > 0:
-                for idx, primer_set in enumerate(st.session_state['primers']):
-                    primers_result.append({
-                        'Gene': str(variant) + data['gene_name'],
-                        'Pair': idx + 1,
-                        'Product Size (bp)': primer_set['amplicon_size'],
-                        'Product Tm (°C)': primer_set['amplicon_tm'],
-                        "Product Seq. (5'->3')": primer_set['amplicon_seq'],
-                        'Validated': primer_set['validation_relative'],
-                        "For. Pr.(5'->3')": primer_set['left_primer']['sequence'],
-                        'For. Len. (bp)': primer_set['left_primer']['length'],
-                        'For. Pos.': primer_set['left_primer']['position'],
-                        'For. Pos. Abs. (bp)': primer_set['left_primer']['position_abs'],
-                        'For. Tm (°C)': primer_set['left_primer']['tm'],
-                        'For. GC%': primer_set['left_primer']['gc_percent'],
-                        'For. Self Compl.': primer_set['left_primer']['self_complementarity'],
-                        "For. Self 3' Compl.": primer_set['left_primer']['self_3prime_complementarity'],
-                        "Rev. Pr.(5'->3')": primer_set['right_primer']['sequence'],
-                        'Rev. Len. (bp)': primer_set['right_primer']['length'],
-                        'Rev. Pos.': primer_set['right_primer']['position'],
-                        'Rev. Pos. Abs.': primer_set['right_primer']['position_abs'],
-                        'Rev. Tm (°C)': primer_set['right_primer']['tm'],
-                        'Rev. GC%': primer_set['right_primer']['gc_percent'],
-                        'Rev. Self Compl.': primer_set['right_primer']['self_complementarity'],
-                        "Rev. Self 3' Compl.": primer_set['right_primer']['self_3prime_complementarity'],
-                        'Product Size Abs. (bp)': primer_set['amplicon_size_abs'],
-                        'Validated Abs.': primer_set['validation_absolute'],
-                        'validation_relative_sequences': primer_set['validation_relative_sequences'],
-                    })
-
-                with st.expander(f'Primers info and graph location for {variant} {data["gene_name"]}',
-                                 expanded=False):
-                    if len(data['normalized_exon_coords']) > 1:
-                        st.altair_chart(graphique(data['normalized_exon_coords'], st.session_state['primers']),
-                                        theme=None, use_container_width=True, key=f"{variant}_exon_intron")
-                    st.altair_chart(graphique(data['normalized_exon_coords'], st.session_state['primers'],
-                                              True), theme=None, use_container_width=True,
-                                    key=f"{variant}_exon")
-
-                    for idx, primer_set in enumerate(st.session_state['primers']):
-                        st.markdown("---")
-                        st.subheader(f"Primer set {idx + 1} for {variant} {data['gene_name']}")
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.subheader("Forward primer")
-                            st.markdown(f"**Sequence:** `{primer_set['left_primer']['sequence']}`")
-                            st.markdown(f"**Length:** {primer_set['left_primer']['length']} bp")
-                            st.markdown(f"**Tm:** {primer_set['left_primer']['tm']} °C")
-                            st.markdown(f"**GC%:** {primer_set['left_primer']['gc_percent']}")
-                            st.markdown(f"**Self-compl.:** {primer_set['left_primer']['self_complementarity']}")
-                            st.markdown(
-                                f"**3'-compl.:** {primer_set['left_primer']['self_3prime_complementarity']}")
-                        with col2:
-                            st.subheader("Reverse primer")
-                            st.markdown(f"**Sequence:** `{primer_set['right_primer']['sequence']}`")
-                            st.markdown(f"**Length:** {primer_set['right_primer']['length']} bp")
-                            st.markdown(f"**Tm:** {primer_set['right_primer']['tm']} °C")
-                            st.markdown(f"**GC%:** {primer_set['right_primer']['gc_percent']}")
-                            st.markdown(f"**Self-compl.:** {primer_set['right_primer']['self_complementarity']}")
-                            st.markdown(
-                                f"**3'-compl.:** {primer_set['right_primer']['self_3prime_complementarity']}")
-                        st.markdown("")
-                        st.markdown(f"**Product Size (bp):** {primer_set['amplicon_size']} bp")
-                        st.markdown(f"**Product Tm (°C):** {primer_set['amplicon_tm']}°C")
-                        st.markdown(f"**Product sequence:** `{primer_set['amplicon_seq']}`")
-                        if st.session_state["ucsc_validation"] is True:
-                            validation_status = primer_set['validation_relative']
-                            color = "green" if validation_status is True else "red"
-                            validation_text = "Yes" if validation_status is True else (
-                                "No" if validation_status is False else str(validation_status)
-                            )
-
-                            st.markdown(f"**Validated:** <span style='color:{color}'>{validation_text}</span>",
-                                        unsafe_allow_html=True)
-
-                            st.write(primer_set['validation_relative_sequences'])
-
-                st.toast(f"Primers designed for {variant} {data['gene_name']}!")
-            else:
-                st.warning(f"No primers were designed for {variant} {data['gene_name']}")
-
-        if primers_result:
-            all_columns = list(primers_result[0].keys())
-            if not st.session_state.get("ucsc_validation", False):
-                all_columns = [col for col in all_columns if col != "Validated"]
-                all_columns = [col for col in all_columns if col != "Validated Abs."]
-            all_columns = [col for col in all_columns if col != "validation_relative_sequences"]
-            abs_columns = [col for col in all_columns if "Abs." in col]
-            other_columns = [col for col in all_columns if col not in abs_columns]
-            ordered_columns = other_columns + abs_columns
-            df = pd.DataFrame(primers_result)[ordered_columns]
-            st.dataframe(df, hide_index=True)
-
-            csv_file = pd.DataFrame(primers_result).to_csv(index=False)
-            excel_file = io.BytesIO()
-            pd.DataFrame(primers_result).to_excel(excel_file, index=False, sheet_name='Sheet1')
-            excel_file.seek(0)
-
-            download_button1, download_button2 = st.columns(2, gap='small')
-            current_date_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            download_button1.download_button("💾 Download table (.xlsx)", excel_file,
-                                             file_name=f'LabmasterDP_{current_date_time}.xlsx',
-                                             mime="application/vnd.ms-excel", key='download-excel')
-            download_button2.download_button(label="💾 Download table (.csv)", data=csv_file,
-                                             file_name=f"LabmasterDP_{current_date_time}.csv", mime="text/csv")
-    except Exception as e:
-        print(e)
+    design_settings = {
+        'PRIMER_OPT_SIZE': st.session_state["PRIMER_OPT_SIZE"],
+        'PRIMER_MIN_SIZE': st.session_state["PRIMER_MIN_SIZE"],
+        'PRIMER_MAX_SIZE': st.session_state["PRIMER_MAX_SIZE"],
+        'PRIMER_OPT_TM': st.session_state["PRIMER_OPT_TM"],
+        'PRIMER_MIN_TM': st.session_state["PRIMER_MIN_TM"],
+        'PRIMER_MAX_TM': st.session_state["PRIMER_MAX_TM"],
+        'PRIMER_MIN_GC': st.session_state["PRIMER_MIN_GC"],
+        'PRIMER_MAX_GC': st.session_state["PRIMER_MAX_GC"],
+        'PRIMER_NUM_RETURN': PRIMER_NUM_RETURN,
+        'PRIMER_PRODUCT_SIZE_RANGE': [st.session_state["min_amplicon_size"], st.session_state["max_amplicon_size"]],
+        'ucsc_validation': st.session_state["ucsc_validation"],
+        'only_validated': st.session_state["only_validated"],
+        'reverse_exon_order': st.session_state['reverse_exon_order'],
+    }
+    if 'design_job' in st.session_state:
+        job_runner().cancel(st.session_state['design_job'])
+    st.session_state['design_job'] = job_runner().submit("design", design_job,
+                                                         dict(st.session_state['all_variants']), design_settings)
+
+# Results stay on the page across reruns, the job keeps running whatever the user clicks meanwhile
+if 'design_job' in st.session_state:
+    design_job_state = job_runner().get(st.session_state['design_job'])
+    if design_job_state is None:
+        del st.session_state['design_job']
+    elif design_job_state.is_finished():
+        design_results(st.session_state['design_job'])
+    else:
+        design_monitor(st.session_state['design_job'])
 
 if st.button("You can also check your own primers by clicking here ☺", key="second"):
     st.switch_page("pages/check_primer.py")
@@ -21,17 +21,57 @@
 # SOFTWARE.
 
 
-import random
+import os
 import re
 import time
 import html
-import xml.etree.ElementTree as ET
+import threading
+from collections import deque
+from xml.etree.ElementTree import ParseError
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, as_completed
+from multiprocessing import get_context
 
 import primer3
-import requests
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+from utils import sequence_ops
+
+from .annotation import LocalAnnotations
+from .cache import DesignCache, design_key
+from .fasta import LocalGenomes
+from .gene_xml import index_gene_records
+from .local_pcr import LocalPcr
+from .network import (REQUEST_TIMEOUT, VALIDATION_WORKERS, accession_cache, default_retry_policy, fetch_executor,
+                      headers, http_get, parallel_map, response_cache, set_api_key, validation_executor)
+from .primer_blast import PrimerBlastError, primer_blast_jobs
+
+# Genome FASTA files (+ .fai) used before NCBI efetch, see LABMASTER_GENOME_FASTA
+local_genomes = LocalGenomes.from_env()
+# GTF/GFF3 compiled with `python -m pages.design_primer_API.annotation`, see LABMASTER_ANNOTATION_DB
+local_annotations = LocalAnnotations.from_env()
+# Transcriptome/genome FASTA indexed with `python -m pages.design_primer_API.local_pcr`, see LABMASTER_PCR_INDEX
+local_pcr_indexes = LocalPcr.from_env()
+
+# mRNA mode: exons closer than this are fetched as one region (intron included), farther ones separately
+EXON_MERGE_GAP = 10000
+# Promoter/terminator batches: windows closer than this on the same chromosome share one efetch, up to a region size
+WINDOW_MERGE_GAP = 10000
+MAX_MERGED_REGION = 2000000
+
+# primer3 processes, created on first use. Only primer3 itself runs there: the candidate loop and the in-silico PCR
+# checks stay in this process, under the NCBI/UCSC budget of network.py
+DESIGN_WORKERS = int(os.environ.get("LABMASTER_DESIGN_WORKERS", os.cpu_count() or 1))
+design_pool = None
+design_pool_lock = threading.Lock()
+# primer3 answers by template + regions + settings, LABMASTER_DESIGN_CACHE=0 to always recompute
+design_cache = DesignCache(enabled=os.environ.get("LABMASTER_DESIGN_CACHE", "1") != "0")
+
+# Longest a designed pair waits for its in-silico PCR: every attempt of the two hgPcr queries (genome, transcriptome),
+# then the primer-BLAST job. Past that the pair is kept unvalidated and the design thread goes on.
+UCSC_TIMEOUT = 2 * default_retry_policy.max_attempts * (sum(REQUEST_TIMEOUT) + default_retry_policy.max_delay)
+VALIDATION_TIMEOUT = UCSC_TIMEOUT + primer_blast_jobs.timeout
+
 
 class bcolors:
     HEADER = '\033[95m'
@@ -45,10 +85,6 @@ class bcolors:
     UNDERLINE = '\033[4m'
 
 
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-}
-
 ucsc_species = {
     "Homo sapiens": {'org': 'Human', 'db': 'hg38', 'wp_target': ['genome', 'hg38KgSeqV48']},
     "Mus musculus": {'org': 'Mouse', 'db': 'mm39', 'wp_target': ['genome', 'mm39KgSeqVM37']},
@@ -164,7 +200,7 @@ ucsc_species = {
 
 class NCBIdna:
     def __init__(self, gene_id, species=None, seq_type="rna", upstream=0, downstream=0, genome_version="current",
-                 all_slice_forms=None):
+                 all_slice_forms=None, api_key=None):
         self.gene_id = gene_id
         self.species = species if species is not None else "human"
         self.seq_type = seq_type if seq_type is not None else "rna"
@@ -172,44 +208,81 @@ class NCBIdna:
         self.downstream = downstream if downstream is not None and seq_type in ["promoter", "terminator"] else None
         self.genome_version = genome_version if genome_version is not None else "current"
         self.all_slice_forms = True if all_slice_forms is True else False
+        if api_key is not None:
+            # NCBI allows 10 requests/s instead of 3 with a key, the shared rate limiter follows
+            set_api_key(api_key)
 
     @staticmethod
-    def XMNM_to_gene_ID(variant, max_attempts=25):
-        global headers
-
-        attempt = 0
-
-        while attempt < max_attempts:
-            attempt += 1
-
-            uids = f"https://www.ncbi.nlm.nih.gov/nuccore/{variant}"
-
-            response = requests.get(uids, headers=headers)
+    def XMNM_to_gene_ID(variant):
+        return NCBIdna.transcripts_to_gene_ids([variant])[variant.split('.')[0]]
 
+    @staticmethod
+    # NM_/XM_/... accessions -> Entrez gene IDs: esummary (accession -> nuccore UID) then elink nuccore -> gene,
+    # 100 accessions per request pair, answers kept in the persistent accession cache.
+    # Retries are http_get's: the accessions of a request that still fails are "NCBI did not answer" (never cached),
+    # "UIDs not founds" is kept for accessions NCBI answered about without a gene.
+    def transcripts_to_gene_ids(variants, chunk_size=100):
+        wanted = list(dict.fromkeys(variant.split('.')[0] for variant in variants))
+        found = accession_cache.get_many(wanted)
+        unanswered = set()
+
+        for chunk in NCBIdna.chunks([variant for variant in wanted if variant not in found], chunk_size):
+            uids = {}
+            url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+            response = http_get(url, params={'db': 'nuccore', 'id': ",".join(chunk), 'retmode': 'json'})
             if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
+                result = response.json().get('result', {})
+                for uid in result.get('uids', []):
+                    caption = result.get(uid, {}).get('caption', '')
+                    if caption.upper() in (variant.upper() for variant in chunk):
+                        uids[str(uid)] = caption
+            else:
+                print(bcolors.FAIL + f"Error {response.status_code}: Error during process of retrieving UIDs"
+                      + bcolors.ENDC)
+                unanswered.update(chunk)
 
-                pattern = r"list_uids=(\d+)"
-                matches = re.search(pattern, str(soup))
+            if not uids:
+                continue
 
-                if matches:
-                    entrez_id = matches.group(1)
-                else:
-                    entrez_id = "UIDs not founds"
-
-                return entrez_id
+            linked = {}
+            # One id parameter per UID: elink answers with one linkset per UID
+            url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/elink.fcgi"
+            response = http_get(url, params={'dbfrom': 'nuccore', 'db': 'gene', 'id': list(uids), 'retmode': 'json'})
+            if response.status_code == 200:
+                for linkset in response.json().get('linksets', []):
+                    for linksetdb in linkset.get('linksetdbs', []):
+                        if linksetdb.get('linkname') == 'nuccore_gene' and linksetdb.get('links'):
+                            for uid in linkset.get('ids', []):
+                                if str(uid) in uids:
+                                    linked[uids[str(uid)].upper()] = str(linksetdb['links'][0])
             else:
-                print(bcolors.FAIL + "Error during process of retrieving UIDs" + bcolors.ENDC)
+                print(bcolors.FAIL + f"Error {response.status_code}: Error during process of retrieving gene IDs"
+                      + bcolors.ENDC)
+                # Only the accessions esummary did know are unanswered, the others are not found either way
+                captions = {caption.upper() for caption in uids.values()}
+                unanswered.update(variant for variant in chunk if variant.upper() in captions)
+
+            # Accession captions come back upper case, match them to what the user typed
+            for variant in chunk:
+                if variant.upper() in linked:
+                    found[variant] = linked[variant.upper()]
+            accession_cache.set_many({variant: found[variant] for variant in chunk if variant in found})
 
-        return "UIDs not founds"
+        return {variant: found.get(variant, "NCBI did not answer" if variant in unanswered else "UIDs not founds")
+                for variant in wanted}
 
     # Sequence extractor
     def find_sequences(self):
-        time.sleep(1)
+        all_variants = self.local_variants(self.gene_id)
+        if all_variants is not None:
+            return self.add_sequences(all_variants)
+
         if self.gene_id.upper().startswith(('XM_', 'NM_', 'XR_', 'NR_', 'YP_')):
             if '.' in self.gene_id:
                 self.gene_id = self.gene_id.split('.')[0]
             entrez_id = NCBIdna.XMNM_to_gene_ID(str(self.gene_id))
+            if entrez_id == 'NCBI did not answer':
+                return "Error 200", f"NCBI did not answer for {self.gene_id}, please try again later"
             if entrez_id == 'UIDs not founds':
                 result_promoter = f'Please verify {self.gene_id} variant'
                 return "Error 200", result_promoter
@@ -226,33 +299,172 @@ class NCBIdna:
                                                     self.gene_id if
                                                     self.gene_id.upper().startswith(
                                                         ('XM_', 'NM_', 'XR_', 'NR_', 'YP_')) else None)
+        return self.add_sequences(all_variants)
+
+    def local_variants(self, gene_id):
+        # Exon structures from the local annotation index (current assembly only), no E-utilities round trip
+        if self.genome_version != "current":
+            return None
+        all_variants = local_annotations.find_variants(gene_id, self.species, self.all_slice_forms)
+        if all_variants is not None:
+            print(bcolors.OKGREEN + f"Local annotation: Transcript(s) found(s) for {gene_id}: {list(all_variants.keys())}"
+                  + bcolors.ENDC)
+        return all_variants
+
+    def add_sequences(self, all_variants):
         if "Error 200" not in all_variants:
-            for nm_id, data in all_variants.items():
-                exon_coords = data.get('exon_coords')
-                # data['upstream'] = self.upstream
-                # data['seq_type'] = self.seq_type
-                sequence = NCBIdna.get_dna_sequence(data.get("entrez_id"), data.get("chraccver"), exon_coords[0][0],
-                                                    exon_coords[-1][1], self.seq_type, self.upstream, self.downstream)
-                if self.seq_type in ['mrna']:
-                    if self.seq_type == 'mrna':
-                        data['sequence'] = "".join(
-                            sequence[start:end + 1] for start, end in data["normalized_exon_coords"])
+            for nm_id, sequence in self.fetch_sequences(all_variants):
+                if sequence is None:
+                    # NCBI gave up on this one after the retries, keep the variants that did come back
+                    del all_variants[nm_id]
                 else:
-                    data['sequence'] = sequence
+                    self.set_sequence(all_variants[nm_id], sequence)
 
+            if len(all_variants) == 0:
+                return "Error 200", "DNA extraction failed, NCBI did not answer, please try again later"
             return all_variants, "OK"
         else:
             return all_variants, "Error 200"
 
+    def fetch_sequences(self, variants):
+        # variants: {key: variant data}. Yields (key, sequence or None) as soon as each one is there.
+        variants = dict(variants)
+        if self.seq_type in ['promoter', 'terminator']:
+            windows = {}
+            for key, data in variants.items():
+                chrstart, chrstop = data['exon_coords'][0][0], data['exon_coords'][-1][1]
+                start, end = NCBIdna.dna_window(chrstart, chrstop, self.seq_type, self.upstream, self.downstream)
+                windows[key] = (data.get("entrez_id"), data.get("chraccver"), start, end, chrstop < chrstart)
+            yield from NCBIdna.fetch_windows(windows)
+        else:
+            futures = {fetch_executor.submit(self.fetch_sequence, data): key for key, data in variants.items()}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def fetch_sequence(self, data):
+        exon_coords = data.get('exon_coords')
+        # data['upstream'] = self.upstream
+        # data['seq_type'] = self.seq_type
+        if self.seq_type == 'mrna':
+            return NCBIdna.get_mrna_sequence(data.get("entrez_id"), data.get("chraccver"), exon_coords)
+        return NCBIdna.get_dna_sequence(data.get("entrez_id"), data.get("chraccver"), exon_coords[0][0],
+                                        exon_coords[-1][1], self.seq_type, self.upstream, self.downstream)
+
+    def set_sequence(self, data, sequence):
+        # mRNA comes back already spliced (get_mrna_sequence)
+        data['sequence'] = sequence
+
     @staticmethod
-    # Convert gene to ENTREZ_GENE_ID
-    def convert_gene_to_entrez_id(gene_name, species):
+    # Batch sequence extractor: a handful of esearch/esummary/efetch round trips for a whole gene list
+    def find_sequences_batch(gene_ids, species=None, seq_type="rna", upstream=0, downstream=0,
+                             genome_version="current", all_slice_forms=None, progress=None, checkpoint=None):
+        extractor = NCBIdna(None, species, seq_type, upstream, downstream, genome_version, all_slice_forms)
+        transcript_prefixes = ('XM_', 'NM_', 'XR_', 'NR_', 'YP_')
+        # A gene listed twice is extracted once: progress counts distinct genes and reaches its total
+        gene_ids = list(dict.fromkeys(gene_ids))
+
+        # Genes already extracted by an interrupted run of the same job (checkpoint.ExtractionCheckpoint)
+        resumed = checkpoint.completed() if checkpoint is not None else {}
+        results = {gene_id: resumed[gene_id] for gene_id in gene_ids if gene_id in resumed}
+        todo = [gene_id for gene_id in gene_ids if gene_id not in results]
+
+        targets = {}
+        gene_names = []
+        local = {gene_id: extractor.local_variants(gene_id) for gene_id in todo}
+        local = {gene_id: all_variants for gene_id, all_variants in local.items() if all_variants is not None}
+        transcripts = {gene_id: gene_id.split('.')[0] for gene_id in todo
+                       if gene_id.upper().startswith(transcript_prefixes) and gene_id not in local}
+        transcript_gene_ids = NCBIdna.transcripts_to_gene_ids(transcripts.values())
+        transcript_ids = {gene_id: transcript_gene_ids[transcript] for gene_id, transcript in transcripts.items()}
+        for gene_id in todo:
+            if gene_id in local:
+                continue
+            elif gene_id in transcripts:
+                transcript = transcripts[gene_id]
+                entrez_id = transcript_ids[gene_id]
+                if entrez_id == 'NCBI did not answer':
+                    results[gene_id] = ("Error 200", f"NCBI did not answer for {transcript}, please try again later")
+                elif entrez_id == 'UIDs not founds':
+                    results[gene_id] = ("Error 200", f'Please verify {transcript} variant')
+                else:
+                    targets[gene_id] = (entrez_id, transcript)
+            elif gene_id.isdigit():
+                targets[gene_id] = (gene_id, None)
+            else:
+                gene_names.append(gene_id)
+
+        entrez_ids = NCBIdna.convert_genes_to_entrez_ids(gene_names, extractor.species)
+        for gene_name in gene_names:
+            entrez_id, message = entrez_ids[gene_name]
+            if entrez_id == "Error 200":
+                results[gene_name] = (entrez_id, message)
+            else:
+                targets[gene_name] = (entrez_id, None)
+
+        unique_ids = list(dict.fromkeys(entrez_id for entrez_id, _ in targets.values()))
+        summaries = NCBIdna.gene_summaries(unique_ids)
+        records = NCBIdna.gene_records(unique_ids)
+
+        pending = dict(local)
+        for gene_id in gene_ids:
+            if gene_id in targets:
+                entrez_id, transcript = targets[gene_id]
+                if entrez_id not in summaries or entrez_id not in records:
+                    all_variants = "Error 200"
+                else:
+                    summary = {'result': {entrez_id: summaries[entrez_id]}}
+                    all_variants, message = NCBIdna.build_variants(entrez_id, summary, records[entrez_id],
+                                                                   genome_version, extractor.all_slice_forms,
+                                                                   transcript)
+                if "Error 200" in all_variants:
+                    results[gene_id] = (all_variants, "Error 200")
+                else:
+                    pending[gene_id] = all_variants
+
+        # Every sequence of every gene goes to the fetch pool at once, progress is reported per finished gene
+        if progress is not None:
+            for done, gene_id in enumerate(results, start=1):
+                progress(done, len(gene_ids), gene_id)
+        done = len(results)
+
+        remaining = {gene_id: len(all_variants) for gene_id, all_variants in pending.items()}
+        variants = {(gene_id, nm_id): data for gene_id, all_variants in pending.items()
+                    for nm_id, data in all_variants.items()}
+
+        for (gene_id, nm_id), sequence in extractor.fetch_sequences(variants):
+            if sequence is None:
+                del pending[gene_id][nm_id]
+            else:
+                extractor.set_sequence(variants[(gene_id, nm_id)], sequence)
+            remaining[gene_id] -= 1
+            if remaining[gene_id] == 0:
+                if len(pending[gene_id]) == 0:
+                    results[gene_id] = ("Error 200", "DNA extraction failed, NCBI did not answer, please try again later")
+                else:
+                    results[gene_id] = (pending[gene_id], "OK")
+                    if checkpoint is not None:
+                        checkpoint.save(gene_id, pending[gene_id], "OK")
+                done += 1
+                if progress is not None:
+                    progress(done, len(gene_ids), gene_id)
+
+        return {gene_id: results[gene_id] for gene_id in gene_ids}
+
+    @staticmethod
+    def chunks(items, size):
+        for i in range(0, len(items), size):
+            yield items[i:i + size]
+
+    @staticmethod
+    # Convert gene to ENTREZ_GENE_ID. http_get already retried a failed request, max_attempts only re-asks an
+    # unusable answer sent with a 200
+    def convert_gene_to_entrez_id(gene_name, species, max_attempts=3):
         global headers
 
-        while True:
+        for attempt in range(max_attempts):
             # Request for ENTREZ_GENE_ID
             url = f'https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi?db=gene&term="{gene_name}"[Gene%20Name]+AND+{species}[Organism]&retmode=json&rettype=xml'
-            response = requests.get(url, headers=headers)
+            response = http_get(url)
 
             if response.status_code == 200:
                 response_data = response.json()
@@ -270,206 +482,297 @@ class NCBIdna:
                 else:
                     print(
                         bcolors.FAIL + f"Error 200: Issues for {species} {gene_name}, try again: {response.text}" + bcolors.ENDC)
-                    time.sleep(random.uniform(0.25, 0.5))
+                    response_cache.delete(url)
+                    time.sleep(default_retry_policy.delay(attempt))
 
             elif response.status_code == 429:
                 print(
-                    bcolors.FAIL + f"Error 429: API rate limit exceeded during get ID of {species} {gene_name}, try again: {response.text}" + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
+                    bcolors.FAIL + f"Error 429: API rate limit exceeded during get ID of {species} {gene_name}: {response.text}" + bcolors.ENDC)
+                break
             else:
                 print(bcolors.FAIL + f"Error {response.status_code}: {response.text}" + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
+                break
+
+        return "Error 200", f"NCBI did not answer for {gene_name} ({species}), please try again later"
+
+    @staticmethod
+    # Convert a list of genes to ENTREZ_GENE_ID with one esearch + one esummary per chunk
+    def convert_genes_to_entrez_ids(gene_names, species, chunk_size=100, max_attempts=3):
+        wanted = list(dict.fromkeys(gene_names))
+        found = {}
+
+        for chunk in NCBIdna.chunks(wanted, chunk_size):
+            term = "(" + " OR ".join(f'"{gene_name}"[Gene Name]' for gene_name in chunk) + f") AND {species}[Organism]"
+            params = {'db': 'gene', 'term': term, 'retmode': 'json', 'retmax': len(chunk) * 20}
+
+            idlist = None
+            for attempt in range(max_attempts):
+                response = http_get("https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi", params=params)
+                if response.status_code != 200:
+                    print(bcolors.FAIL + f"Error {response.status_code}: batch ID search for {species}" + bcolors.ENDC)
+                    break
+                if 'idlist' in response.json().get('esearchresult', {}):
+                    idlist = response.json()['esearchresult']['idlist']
+                    break
+                print(bcolors.FAIL + f"Error 200: batch ID search for {species}, try again" + bcolors.ENDC)
+                response_cache.delete("https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi", params)
+            if idlist is None:
+                continue
+
+            # esearch returns IDs by relevance, keep the first one whose official symbol matches, like the single query
+            summaries = NCBIdna.gene_summaries(idlist)
+            by_symbol = {gene_name.upper(): gene_name for gene_name in chunk}
+            for uid in idlist:
+                symbol = summaries.get(uid, {}).get('name', '').upper()
+                if symbol in by_symbol and by_symbol[symbol] not in found:
+                    gene_name = by_symbol[symbol]
+                    found[gene_name] = (uid, bcolors.OKGREEN + f"Response 200: ID found for {species} {gene_name}: {uid}" + bcolors.ENDC)
+
+        # Aliases and anything the batch could not match fall back to the historical one-by-one search
+        missing = [gene_name for gene_name in wanted if gene_name not in found]
+        found.update(zip(missing, parallel_map(lambda gene_name: NCBIdna.convert_gene_to_entrez_id(gene_name, species),
+                                               missing)))
+
+        return found
+
+    @staticmethod
+    # Gene esummary for many ENTREZ_GENE_ID, comma-separated in chunks
+    def gene_summaries(entrez_ids, chunk_size=200, max_attempts=3):
+        summaries = {}
+
+        for chunk in NCBIdna.chunks(list(entrez_ids), chunk_size):
+            url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=gene&id={','.join(chunk)}&retmode=json"
+
+            for attempt in range(max_attempts):
+                response = http_get(url)
+                if response.status_code != 200:
+                    print(bcolors.FAIL + f"Error {response.status_code}: batch esummary of {len(chunk)} genes" + bcolors.ENDC)
+                    break
+                if 'result' in response.json():
+                    result = response.json()['result']
+                    summaries.update({uid: result[uid] for uid in result.get('uids', []) if uid in result})
+                    break
+                print(bcolors.FAIL + f"Error 200: batch esummary of {len(chunk)} genes, try again" + bcolors.ENDC)
+                response_cache.delete(url)
+
+        return summaries
+
+    @staticmethod
+    # Gene efetch XML for many ENTREZ_GENE_ID, indexed per Entrezgene record
+    def gene_records(entrez_ids, chunk_size=50, max_attempts=3):
+        def fetch_chunk(chunk):
+            url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=gene&id={','.join(chunk)}&retmode=xml"
+
+            for attempt in range(max_attempts):
+                response = http_get(url)
+                if response.status_code == 200:
+                    try:
+                        return index_gene_records(response.text)
+                    except ParseError as e:
+                        # Truncated or error page sent with a 200: never keep it
+                        print(bcolors.FAIL + f"Unreadable batch efetch of {len(chunk)} genes ({e}), try again" + bcolors.ENDC)
+                        response_cache.delete(url)
+                        continue
+                print(bcolors.FAIL + f"Error {response.status_code}: batch efetch of {len(chunk)} genes" + bcolors.ENDC)
+                break
+            return {}
+
+        records = {}
+        for chunk_records in parallel_map(fetch_chunk, list(NCBIdna.chunks(list(entrez_ids), chunk_size))):
+            records.update(chunk_records)
+        return records
 
     @staticmethod
     # Get gene information
-    def all_variant(entrez_id, genome_version="current", all_slice_forms=False, specific_transcript=None):
+    def all_variant(entrez_id, genome_version="current", all_slice_forms=False, specific_transcript=None,
+                    max_attempts=3):
         global headers
 
-        while True:
-            url2 = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=gene&id={entrez_id}&retmode=json&rettype=xml"
-            response = requests.get(url2, headers=headers)
+        # http_get already retried a failed request, max_attempts only re-asks an unreadable efetch sent with a 200
+        url2 = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=gene&id={entrez_id}&retmode=json&rettype=xml"
+        response = http_get(url2)
 
-            if response.status_code == 200:
-                response_data = response.json()
-                try:
-                    gene_info = response_data['result'][str(entrez_id)]
-                    species_API = gene_info['organism']['scientificname']
-                    gene_name = gene_info['name']
-                    title, chrloc, chraccver, coords = NCBIdna.extract_genomic_info(entrez_id, response_data,
-                                                                                    genome_version, species_API)
-                    chrstart = coords[0]
-                    chrstop = coords[1]
-                    print(
-                        bcolors.OKGREEN + f"Response 200: Chromosome {chrloc} {chraccver} found for {entrez_id}: {response.text}" + bcolors.ENDC)
-                    break
+        if response.status_code == 200:
+            response_data = response.json()
+            try:
+                location = NCBIdna.gene_location(entrez_id, response_data, genome_version)
 
-                except Exception as e:
-                    print(
-                        bcolors.WARNING + f"Response 200: Chromosome not found for {entrez_id}: {response.text} {e}" + bcolors.ENDC)
-                    all_variants = [("Error 200", None, None, None, None, None)]
-                    print(
-                        bcolors.WARNING + f"Response 200: Transcript not found(s) for {entrez_id}." + bcolors.ENDC)
-                    return "Error 200", f"Transcript not found(s) for {entrez_id}."
+            except Exception as e:
+                print(
+                    bcolors.WARNING + f"Response 200: Chromosome not found for {entrez_id}: {response.text} {e}" + bcolors.ENDC)
+                response_cache.delete(url2)
+                print(
+                    bcolors.WARNING + f"Response 200: Transcript not found(s) for {entrez_id}." + bcolors.ENDC)
+                return "Error 200", f"Transcript not found(s) for {entrez_id}."
 
-            elif response.status_code == 429:
+        else:
+            if response.status_code == 429:
                 print(
                     bcolors.ENDC + f"Error {response.status_code}: API rate limit exceeded during get chromosome of {entrez_id}: {response.text}" + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
             else:
                 print(
                     bcolors.ENDC + f"Error {response.status_code}: Error during get chromosome of {entrez_id}: {response.text}" + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
-
-        while True:
-            all_variants = {}
+            return "Error 200", f"NCBI did not answer for {entrez_id}, please try again later"
 
+        for attempt in range(max_attempts):
             url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=gene&id={entrez_id}&retmode=xml"
-            response = requests.get(url, headers=headers)
+            response = http_get(url)
 
             if response.status_code == 200:
-                root = ET.fromstring(response.text)
-
-                tv = []
-                variants = []
-                chromosome = ""
-
-                for elem in root.iter():
-                    if elem.tag == "Gene-commentary_label":
-                        if elem.text.startswith('transcript variant'):
-                            if elem.text not in tv:
-                                tv.append(elem.text)
-                    if elem.tag == "Gene-commentary_accession":
-                        if elem.text.upper().startswith(('XM_', 'NM_', 'XR_', 'NR_', 'YP_')):
-                            if elem.text not in variants:
-                                variants.append(elem.text)
-
-                    if elem.tag == "Gene-commentary_type":
-                        if elem.attrib.get("value") in ["tRNA", "rRNA", "d-segment"]:
-                            all_variants[entrez_id] = {
-                                'entrez_id': entrez_id,
-                                'gene_name': gene_name,
-                                'genomic_info': title,
-                                'chraccver': chraccver,
-                                'strand': "plus" if chrstart < chrstop else "minus",
-                                'exon_coords': [(chrstart if chrstart < chrstop else chrstop,
-                                                 chrstop if chrstart < chrstop else chrstart)],
-                                'normalized_exon_coords': [(0, abs(chrstart - chrstop))],
-                                'species': species_API
-                            }
-                            return all_variants, f"Transcript(s) found(s) for {entrez_id}: {list(all_variants.keys())}"
-
-                for elem in root.iter('Gene-commentary_accession'):
-                    if elem.text.startswith(("NC_", "NT_")):
-                        chromosome = elem.text
-                        break
+                try:
+                    gene_index = index_gene_records(response.text).get(str(entrez_id))
+                except ParseError as e:
+                    # Truncated or error page sent with a 200: never keep it
+                    print(bcolors.FAIL + f"Unreadable efetch of {entrez_id} ({e}), try again" + bcolors.ENDC)
+                    response_cache.delete(url)
+                    continue
+                if gene_index is None:
+                    return "Error 200", f"Transcript not found(s) for {entrez_id}."
+                return NCBIdna.build_variants(entrez_id, response_data, gene_index, genome_version, all_slice_forms,
+                                              specific_transcript, location)
 
-                def calc_exon(root, variants):
-
-                    for variant in variants:
-                        exon_coords = []
-                        found_variant = False
-                        k_found = False
-                        orientation = ""
-                        for elem in root.iter():
-                            if elem.tag == "Gene-commentary_accession" and elem.text != variant:
-                                if elem.text == chromosome:
-                                    k_found = True
-                                elif len(exon_coords) == 0:
-                                    continue
-                                else:
-                                    break
-
-                            if k_found and elem.tag == "Gene-commentary_accession":
-                                found_variant = True if elem.text == variant else False
-                            elif k_found and found_variant and elem.tag == "Seq-interval_from":
-                                start = int(elem.text)
-                            elif k_found and found_variant and elem.tag == "Seq-interval_to":
-                                end = int(elem.text)
-                                exon_coords.append((start, end))
-                            elif k_found and found_variant and elem.tag == "Na-strand" and orientation == "":
-                                orientation += elem.attrib.get("value")
-
-                            elif elem.tag == "Org-ref_taxname":
-                                species_API = elem.text
-
-                        if exon_coords:
-                            if orientation == "minus":
-                                exon_coords = [(end, start) for start, end in exon_coords]
-
-                            first_exon_start = exon_coords[0][0]
-
-                            normalized_exon_coords = [
-                                (abs(start - first_exon_start), abs(end - first_exon_start)) for start, end in
-                                exon_coords]
-
-                            all_variants[variant] = {
-                                'entrez_id': entrez_id,
-                                'gene_name': gene_name,
-                                'genomic_info': title,
-                                'chraccver': chraccver,
-                                'strand': orientation,
-                                'exon_coords': exon_coords,
-                                'normalized_exon_coords': normalized_exon_coords,
-                                'species': species_API
-                            }
-
-                    if len(all_variants) > 0:
-                        print(
-                            bcolors.OKGREEN + f"Response 200: Transcript(s) found(s) for {entrez_id}: {all_variants}" + bcolors.ENDC)
-                        return all_variants, f"Transcript(s) found(s) for {entrez_id}: {list(all_variants.keys())}"
-                    else:
-                        all_variants["Error 200"] = {
-                            "entrez_id": f"Transcript not found for {entrez_id}.",
-                            "gene_name": None,
-                            "chraccver": None,
-                            "exon_coords": None,
-                            "normalized_exon_coords": None,
-                            "species": None
-                        }
-                        print(
-                            bcolors.WARNING + f"Error 200: Transcript not found(s) for {entrez_id}." + bcolors.ENDC)
-                        return all_variants, f"Error 200: Transcript not found(s) for {entrez_id}."
+            elif response.status_code == 429:
+                print(
+                    bcolors.FAIL + f"Error {response.status_code}: API rate limit exceeded while searching for {entrez_id} transcripts: {response.text}" + bcolors.ENDC)
+                break
+            else:
+                print(
+                    bcolors.FAIL + f"Error {response.status_code}: Error while searching for {entrez_id} transcripts: {response.text}" + bcolors.ENDC)
+                break
+
+        return "Error 200", f"NCBI did not answer for {entrez_id} transcripts, please try again later"
+
+    @staticmethod
+    # Chromosome and coordinates of a gene from its esummary
+    def gene_location(entrez_id, response_data, genome_version="current"):
+        gene_info = response_data['result'][str(entrez_id)]
+        species_API = gene_info['organism']['scientificname']
+        gene_name = gene_info['name']
+        title, chrloc, chraccver, coords = NCBIdna.extract_genomic_info(str(entrez_id), response_data,
+                                                                        genome_version, species_API)
+        print(
+            bcolors.OKGREEN + f"Response 200: Chromosome {chrloc} {chraccver} found for {entrez_id}" + bcolors.ENDC)
+        return gene_name, species_API, title, chraccver, coords[0], coords[1]
+
+    @staticmethod
+    # Transcripts and exons of a gene from its esummary and its indexed efetch XML record (gene_xml)
+    def build_variants(entrez_id, response_data, gene_index, genome_version="current", all_slice_forms=False,
+                       specific_transcript=None, location=None):
+        try:
+            if location is None:
+                location = NCBIdna.gene_location(entrez_id, response_data, genome_version)
+            gene_name, species_API, title, chraccver, chrstart, chrstop = location
+        except Exception as e:
+            print(bcolors.WARNING + f"Response 200: Transcript not found(s) for {entrez_id}. {e}" + bcolors.ENDC)
+            return "Error 200", f"Transcript not found(s) for {entrez_id}."
+
+        all_variants = {}
+
+        tv = gene_index['tv']
+        variants = gene_index['variants']
+
+        if gene_index['special']:
+            all_variants[entrez_id] = {
+                'entrez_id': entrez_id,
+                'gene_name': gene_name,
+                'genomic_info': title,
+                'chraccver': chraccver,
+                'strand': "plus" if chrstart < chrstop else "minus",
+                'exon_coords': [(chrstart if chrstart < chrstop else chrstop,
+                                 chrstop if chrstart < chrstop else chrstart)],
+                'normalized_exon_coords': [(0, abs(chrstart - chrstop))],
+                'species': species_API
+            }
+            return all_variants, f"Transcript(s) found(s) for {entrez_id}: {list(all_variants.keys())}"
 
-                if all_slice_forms is True:
-                    all_variants, message = calc_exon(root, variants)
-                    return all_variants, message
+        def calc_exon(variants):
 
-                elif all_slice_forms is False:
-                    variant = None
+            for variant in variants:
+                if variant not in gene_index['exons']:
+                    continue
 
-                    if specific_transcript and re.search(r"\.\d+$", specific_transcript):
-                        specific_transcript = re.sub(r"\.\d+$", "", specific_transcript)
+                exon_coords = list(gene_index['exons'][variant]['exon_coords'])
+                orientation = gene_index['exons'][variant]['strand']
 
-                    if len(tv) > 0:
-                        if specific_transcript and specific_transcript in variants:
-                            variant = specific_transcript
-                        elif "transcript variant 1" in tv:
-                            associations = dict(zip(tv, variants))
-                            variant = associations["transcript variant 1"]
-                        else:
-                            variant = variants[0]
+                if exon_coords:
+                    if orientation == "minus":
+                        exon_coords = [(end, start) for start, end in exon_coords]
 
-                    elif len(tv) == 0 and len(variants) > 0:
-                        variant = variants[0]
+                    first_exon_start = exon_coords[0][0]
 
-                    if variant is not None:
-                        all_variants, message = calc_exon(root, [variant])
-                        return all_variants, message
+                    normalized_exon_coords = [
+                        (abs(start - first_exon_start), abs(end - first_exon_start)) for start, end in
+                        exon_coords]
 
-            elif response.status_code == 429:
+                    all_variants[variant] = {
+                        'entrez_id': entrez_id,
+                        'gene_name': gene_name,
+                        'genomic_info': title,
+                        'chraccver': chraccver,
+                        'strand': orientation,
+                        'exon_coords': exon_coords,
+                        'normalized_exon_coords': normalized_exon_coords,
+                        'species': gene_index['species'] or species_API
+                    }
+
+            if len(all_variants) > 0:
                 print(
-                    bcolors.FAIL + f"Error {response.status_code}: API rate limit exceeded while searching for {entrez_id} transcripts: {response.text}" + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
+                    bcolors.OKGREEN + f"Response 200: Transcript(s) found(s) for {entrez_id}: {all_variants}" + bcolors.ENDC)
+                return all_variants, f"Transcript(s) found(s) for {entrez_id}: {list(all_variants.keys())}"
             else:
+                all_variants["Error 200"] = {
+                    "entrez_id": f"Transcript not found for {entrez_id}.",
+                    "gene_name": None,
+                    "chraccver": None,
+                    "exon_coords": None,
+                    "normalized_exon_coords": None,
+                    "species": None
+                }
                 print(
-                    bcolors.FAIL + f"Error {response.status_code}: Error while searching for {entrez_id} transcripts: {response.text}" + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
+                    bcolors.WARNING + f"Error 200: Transcript not found(s) for {entrez_id}." + bcolors.ENDC)
+                return all_variants, f"Error 200: Transcript not found(s) for {entrez_id}."
+
+        if all_slice_forms is True:
+            return calc_exon(variants)
+
+        variant = None
+
+        if specific_transcript and re.search(r"\.\d+$", specific_transcript):
+            specific_transcript = re.sub(r"\.\d+$", "", specific_transcript)
+
+        if len(tv) > 0:
+            if specific_transcript and specific_transcript in variants:
+                variant = specific_transcript
+            elif "transcript variant 1" in tv:
+                associations = dict(zip(tv, variants))
+                variant = associations["transcript variant 1"]
+            else:
+                variant = variants[0]
+
+        elif len(tv) == 0 and len(variants) > 0:
+            variant = variants[0]
+
+        return calc_exon([variant] if variant is not None else [])
 
     @staticmethod
     # Get DNA sequence
-    def get_dna_sequence(gene_name, chraccver, chrstart, chrstop, seq_type, upstream=2000, downstream=2000):
+    def get_dna_sequence(gene_name, chraccver, chrstart, chrstop, seq_type, upstream=2000, downstream=2000,
+                         max_attempts=3):
         global headers
 
+        start, end = NCBIdna.dna_window(chrstart, chrstop, seq_type, upstream, downstream)
+
+        dna_sequence = NCBIdna.fetch_region(gene_name, chraccver, start, end, max_attempts)
+        if dna_sequence is None:
+            return None
+
+        if chrstop < chrstart:
+            return NCBIdna.reverse_complement(dna_sequence)
+        return dna_sequence
+
+    @staticmethod
+    # efetch from/to (1-based) of a gene, its promoter or its terminator, as requested by seq_type
+    def dna_window(chrstart, chrstop, seq_type, upstream=2000, downstream=2000):
         if seq_type in ['mrna', 'rna']:
             # if chrstop > chrstart:
             #     start = chrstart + 1
@@ -488,41 +791,112 @@ class NCBIdna:
                 start = (chrstart if seq_type == 'promoter' else chrstop) + upstream + 1
                 end = (chrstart if seq_type == 'promoter' else chrstop) - downstream + 2
 
-        while True:
-            url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=nuccore&id={chraccver}&from={start}&to={end}&rettype=fasta&retmode=text"
-            response = requests.get(url, headers=headers)
+        return start, end
 
-            if response.status_code == 200:
-                dna_sequence = response.text.split('\n', 1)[1].replace('\n',
-                                                                       '')
-
-                if chrstop < chrstart:
-                    sequence = NCBIdna.reverse_complement(dna_sequence)
+    @staticmethod
+    # Many windows (promoters, terminators) in a few requests: windows are sorted per chromosome accession, overlapping
+    # or close ones share one merged region, each window is then sliced out locally. Yields (key, sequence or None).
+    def fetch_windows(windows, merge_gap=WINDOW_MERGE_GAP, max_region=MAX_MERGED_REGION, max_attempts=3):
+        # windows: {key: (gene_name, chraccver, start, end, minus)}
+        by_chromosome = {}
+        for key, (gene_name, chraccver, start, end, minus) in windows.items():
+            start, end = max(1, min(start, end)), max(start, end)
+            by_chromosome.setdefault(chraccver, []).append((start, end, key))
+
+        regions = []
+        for chraccver, chromosome_windows in by_chromosome.items():
+            chromosome_windows.sort()
+            for start, end, key in chromosome_windows:
+                region = regions[-1] if regions and regions[-1][0] == chraccver else None
+                if region and start - region[2] <= merge_gap and max(end, region[2]) - region[1] < max_region:
+                    region[2] = max(region[2], end)
+                    region[3].append((start, end, key))
                 else:
-                    sequence = dna_sequence
+                    regions.append([chraccver, start, end, [(start, end, key)]])
+
+        futures = {fetch_executor.submit(NCBIdna.fetch_region, windows[region[3][0][2]][0], region[0], region[1],
+                                         region[2], max_attempts): region for region in regions}
+        for future in as_completed(futures):
+            chraccver, region_start, region_end, region_windows = futures[future]
+            region_sequence = future.result()
+            for start, end, key in region_windows:
+                if region_sequence is None:
+                    yield key, None
+                    continue
+                sequence = region_sequence[start - region_start:end - region_start + 1]
+                yield key, NCBIdna.reverse_complement(sequence) if windows[key][4] else sequence
+
+    @staticmethod
+    # Spliced transcript from its exons only: introns are never downloaded, except short ones between merged exons
+    def get_mrna_sequence(gene_name, chraccver, exon_coords, merge_gap=EXON_MERGE_GAP, max_attempts=3):
+        exons = sorted((min(start, end) + 1, max(start, end) + 1) for start, end in exon_coords)
+
+        # One efetch per group of exons closer than merge_gap: a round trip costs more than a few kb of intron
+        regions = [list(exons[0])]
+        for start, end in exons[1:]:
+            if start - regions[-1][1] <= merge_gap:
+                regions[-1][1] = max(regions[-1][1], end)
+            else:
+                regions.append([start, end])
+
+        pieces = []
+        for region_start, region_end in regions:
+            region_sequence = NCBIdna.fetch_region(gene_name, chraccver, region_start, region_end, max_attempts)
+            if region_sequence is None:
+                return None
+            for start, end in exons:
+                if region_start <= start and end <= region_end:
+                    pieces.append(region_sequence[start - region_start:end - region_start + 1])
+
+        mrna_sequence = "".join(pieces)
+        # Minus strand transcripts: exons are listed from the highest coordinate, as in get_dna_sequence
+        if exon_coords[-1][1] < exon_coords[0][0]:
+            return NCBIdna.reverse_complement(mrna_sequence)
+        return mrna_sequence
+
+    @staticmethod
+    # Plus strand bases start..end (1-based, inclusive) of chraccver
+    def fetch_region(gene_name, chraccver, start, end, max_attempts=3):
+        start, end = min(start, end), max(start, end)
+
+        # Local genome FASTA first (microseconds, works offline), NCBI only for what is not on disk
+        local_sequence = local_genomes.fetch(chraccver, start, end)
+        if local_sequence is not None:
+            return local_sequence
+
+        # http_get already retried a failed request, max_attempts only re-asks an answer that is not a FASTA
+        for attempt in range(max_attempts):
+            url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=nuccore&id={chraccver}&from={start}&to={end}&rettype=fasta&retmode=text"
+            response = http_get(url)
+
+            if response.status_code == 200 and not response.text.lstrip().startswith(">"):
+                # Not a FASTA (error page sent with a 200): out of the cache, try again
+                print(bcolors.FAIL + f"Unexpected efetch answer for DNA extraction of {gene_name}, try again." + bcolors.ENDC)
+                response_cache.delete(url)
+            elif response.status_code == 200:
+                dna_sequence = response.text.lstrip().split('\n', 1)[1].replace('\n', '')
 
                 # print(
-                #     bcolors.OKGREEN + f"Response 200: DNA sequence for {gene_name} extracted: {sequence}" + bcolors.ENDC)
-                return sequence
+                #     bcolors.OKGREEN + f"Response 200: DNA sequence for {gene_name} extracted: {dna_sequence}" + bcolors.ENDC)
+                return dna_sequence
 
             elif response.status_code == 429:
                 print(
-                    bcolors.FAIL + f"Error 429: API rate limit exceeded for DNA extraction of {gene_name}, try again." + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
+                    bcolors.FAIL + f"Error 429: API rate limit exceeded for DNA extraction of {gene_name}." + bcolors.ENDC)
+                break
             else:
-                print(bcolors.OKGREEN + f"Error {response.status_code}: {response.text}" + bcolors.ENDC)
-                time.sleep(random.uniform(0.25, 0.5))
+                print(bcolors.FAIL + f"Error {response.status_code}: {response.text}" + bcolors.ENDC)
+                break
+
+        print(bcolors.FAIL + f"DNA extraction of {gene_name} failed" + bcolors.ENDC)
+        return None
 
     @staticmethod
     def reverse_complement(dna_sequence):
-        DNA_code = ["A", "T", "C", "G", "N", "a", "t", "c", "g", "n"]
-        if not all(char in DNA_code for char in dna_sequence):
+        if not sequence_ops.is_valid_dna(dna_sequence, sequence_ops.ACGTN):
             isdna = 'Please use only A T G C'
             return isdna
-        complement_dict = {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C'}
-        reverse_sequence = dna_sequence[::-1].upper()
-        complement_sequence = ''.join(complement_dict.get(base, base) for base in reverse_sequence)
-        return complement_sequence
+        return sequence_ops.reverse_complement(dna_sequence, upper=True)
 
     @staticmethod
     def extract_genomic_info(gene_id, gene_info, genome_version, species=None):
@@ -530,8 +904,6 @@ class NCBIdna:
             accession_dict = {}
             gene_details = gene_info['result'][gene_id]
 
-            time.sleep(1)
-
             location_hist = gene_details.get('locationhist', [])
             if len(location_hist) == 0:
                 location_hist = gene_details.get('genomicinfo', [])
@@ -604,22 +976,24 @@ class NCBIdna:
         return None
 
     @staticmethod
-    def fetch_nc_info(nc_accver):
+    def fetch_nc_info(nc_accver, max_attempts=3):
         global headers
 
-        while True:
+        for attempt in range(max_attempts):
             url = f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=nuccore&id={nc_accver}&retmode=json"
-            response = requests.get(url, headers=headers)
-            if response.status_code == 200:
-                nc_info = response.json()
-                try:
-                    uid = nc_info['result']['uids'][0]
-                    title = nc_info['result'][uid]['title']
-                    return title
-                except Exception as e:
-                    time.sleep(random.uniform(0.25, 0.5))
-            else:
-                time.sleep(random.uniform(0.25, 0.5))
+            response = http_get(url)
+            if response.status_code != 200:
+                break
+            nc_info = response.json()
+            try:
+                uid = nc_info['result']['uids'][0]
+                title = nc_info['result'][uid]['title']
+                return title
+            except Exception as e:
+                response_cache.delete(url)
+                time.sleep(default_retry_policy.delay(attempt))
+
+        return None
 
 
 class Primer3:
@@ -676,7 +1050,8 @@ class Primer3:
                        ucsc_validation=False,
                        only_validated="No",
                        reverse_exon_order=False,
-                       progress_bar=None):
+                       progress_bar=None,
+                       primer3_executor=None):
 
         if not PRIMER_MIN_SIZE <= PRIMER_OPT_SIZE <= PRIMER_MAX_SIZE:
             PRIMER_OPT_SIZE = (PRIMER_MAX_SIZE + PRIMER_MIN_SIZE) // 2
@@ -808,153 +1183,221 @@ class Primer3:
 
             seen_primers = set()
 
+            # One primer3 call per exon pair, asked for enough pairs at once, then round-robin over the per-pair
+            # queues: ranks 0-1 of every pair in the first round, the next rank in each following round (the order
+            # the old "PRIMER_NUM_RETURN += 1 and re-run every pair" loop produced). A pair whose queue runs dry is
+            # asked again for twice as many, a pair that returned fewer than asked is exhausted.
+            pair_regions = []
+            for i, j in exon_pairs:
+                exon1_start, exon1_end = exons[i]
+                exon2_start, exon2_end = exons[j]
+
+                simplified_start1 = cumulative_lengths[i]
+                simplified_end1 = simplified_start1 + (exon1_end - exon1_start)
+                simplified_start2 = cumulative_lengths[j]
+                simplified_end2 = simplified_start2 + (exon2_end - exon2_start)
+
+                product_size = simplified_end2 - simplified_start1
+
+                if 40 <= product_size:
+                    pair_regions.append([simplified_start1, simplified_end1 - simplified_start1,
+                                         simplified_start2, simplified_end2 - simplified_start2])
+
+            pair_queues = {}
+            primer3_calls = 0
+
+            # (primer record, validation future or None), in candidate order
+            pending = deque()
+
+            def producing():
+                # Without filter every candidate is kept: never more in flight than primers still missing.
+                # With only_validated some are rejected, the validator pool is kept busy instead.
+                if only_validated in ["qPCR", "Genome", "Both"]:
+                    return len(primers) < PRIMER_NUM_RETURN and len(pending) < 2 * VALIDATION_WORKERS
+                return len(primers) + len(pending) < PRIMER_NUM_RETURN
+
+            def finish(record, future):
+                validation_relative, validation_absolute, sequence_relative, sequence_absolute = None, None, None, None
+                if future is not None:
+                    try:
+                        validation_relative, validation_absolute, sequence_relative, sequence_absolute = \
+                            future.result(timeout=VALIDATION_TIMEOUT)
+                    except TimeoutError:
+                        future.cancel()
+                        print(bcolors.WARNING + f"{record['left_primer']['sequence']} "
+                              f"{record['right_primer']['sequence']}: validation timed out" + bcolors.ENDC)
+                    except Exception as e:
+                        print(bcolors.FAIL + f"{record['left_primer']['sequence']} "
+                              f"{record['right_primer']['sequence']}: validation failed, {e}" + bcolors.ENDC)
+                left_seq, right_seq = record['left_primer']['sequence'], record['right_primer']['sequence']
+
+                if only_validated != "No":
+                    if only_validated == "qPCR":
+                        if validation_relative in [None, False]:
+                            print("SKIPPED qPCR", left_seq, right_seq, validation_relative, validation_absolute)
+                            return
+                    elif only_validated == "Genome":
+                        if validation_absolute in [None, False]:
+                            print("SKIPPED Genome", left_seq, right_seq, validation_relative, validation_absolute)
+                            return
+                    elif only_validated == "Both":
+                        if validation_relative in [None, False] or validation_absolute in [None, False]:
+                            print("SKIPPED Both", left_seq, right_seq, validation_relative, validation_absolute)
+                            return
+
+                record['validation_relative'] = validation_relative
+                record['validation_relative_sequences'] = sequence_relative
+                record['validation_absolute'] = validation_absolute
+                primers.append(record)
+
+                print("SAVED", left_seq, right_seq, validation_relative, validation_absolute)
+                pbar.update(1)
+                if progress_bar is not None:
+                    progress_bar.update(1)
+
             with tqdm(total=PRIMER_NUM_RETURN, desc=f"Generating primers for {variant} {gene_name}",
                       unit="primer") as pbar:
                 no_progress_count = 0
                 max_no_progress = 2
+                rank = 0
 
                 while len(primers) < PRIMER_NUM_RETURN:
-                    primer3_params['PRIMER_NUM_RETURN'] += 1
-                    primers_found_in_iteration = False
+                    rank += 1
+                    primers_before = len(primers)
 
-                    for i, j in exon_pairs:
+                    for pair, region in enumerate(pair_regions):
                         if len(primers) >= PRIMER_NUM_RETURN:
                             break
 
-                        exon1_start, exon1_end = exons[i]
-                        exon2_start, exon2_end = exons[j]
-
-                        simplified_start1 = cumulative_lengths[i]
-                        simplified_end1 = simplified_start1 + (exon1_end - exon1_start)
-                        simplified_start2 = cumulative_lengths[j]
-                        simplified_end2 = simplified_start2 + (exon2_end - exon2_start)
-
-                        product_size = simplified_end2 - simplified_start1
-
-                        if 40 <= product_size:
-                            primer3_input['SEQUENCE_PRIMER_PAIR_OK_REGION_LIST'] = [
-                                simplified_start1, simplified_end1 - simplified_start1,
-                                simplified_start2, simplified_end2 - simplified_start2
-                            ]
-
-                            primer_results = primer3.bindings.design_primers(primer3_input, primer3_params)
-
-                            if 'PRIMER_PAIR_NUM_RETURNED' in primer_results and primer_results[
-                                'PRIMER_PAIR_NUM_RETURNED'] > 0:
-                                for k in range(primer_results['PRIMER_PAIR_NUM_RETURNED']):
-                                    if len(primers) >= PRIMER_NUM_RETURN:
-                                        break
-
-                                    left_key = f'PRIMER_LEFT_{k}_SEQUENCE'
-                                    right_key = f'PRIMER_RIGHT_{k}_SEQUENCE'
-
-                                    if left_key in primer_results and right_key in primer_results:
-                                        left_seq = primer_results.get(left_key, 'N/A')
-                                        right_seq = primer_results.get(right_key, 'N/A')
-
-                                        primer_key = (left_seq, right_seq)
-                                        if primer_key in seen_primers:
-                                            continue
-
-                                        left_position = primer_results.get(f'PRIMER_LEFT_{k}')[0]
-                                        right_position = primer_results.get(f'PRIMER_RIGHT_{k}')[0]
-
-                                        left_absolute = Primer3.convert_to_absolute(left_position, exons,
-                                                                                    cumulative_lengths)
-                                        right_absolute = Primer3.convert_to_absolute(right_position, exons,
-                                                                                     cumulative_lengths)
-
-                                        amplicon_size = right_position - left_position + 1
-                                        amplicon_size_abs = right_absolute - left_absolute + 1
-
-                                        amplicon_seq = simplified_sequence[left_position:right_position + 1]
-
-                                        tm_amplicon = primer3.bindings.calc_tm(
-                                            str(amplicon_seq),
-                                            mv_conc=PRIMER_MONOVALENT_CATION_CONC,  # Na+ mM
-                                            dv_conc=PRIMER_DIVALENT_CATION_CONC,  # Mg2+ mM
-                                            dntp_conc=PRIMER_DNTP_CONC,  # dNTPs mM
-                                            dna_conc=PRIMER_ANN_Oligo_CONC,  # oligo nM
-                                            tm_method=tm_method,
-                                            salt_corrections_method=salt_corrections_method
-                                        )
-
-                                        if species in ucsc_species.keys() and ucsc_validation is True:
-                                            org = ucsc_species[species]["org"]
-                                            db = ucsc_species[species]["db"]
-                                            wp_targets = ucsc_species[species]["wp_target"]
-                                            validation_relative, validation_absolute, sequence_relative, sequence_absolute = Primer3.fetch_ucsc_pcr_results(
-                                                left_seq, right_seq, species, org, db, wp_targets,
-                                                amplicon_size_abs, PRIMER_PRODUCT_SIZE_RANGE[1])
-                                        else:
-                                            validation_relative, validation_absolute, sequence_relative, sequence_absolute = None, None, None, None
-
-                                        if only_validated != "No":
-                                            if only_validated == "qPCR":
-                                                if validation_relative in [None, False]:
-                                                    print("SKIPPED qPCR", left_seq, right_seq, validation_relative,
-                                                          validation_absolute)
-                                                    continue
-                                            elif only_validated == "Genome":
-                                                if validation_absolute in [None, False]:
-                                                    print("SKIPPED Genome", left_seq, right_seq, validation_relative,
-                                                          validation_absolute)
-                                                    continue
-                                            elif only_validated == "Both":
-                                                if validation_relative in [None, False] or validation_absolute in [None,
-                                                                                                                   False]:
-                                                    print("SKIPPED Both", left_seq, right_seq, validation_relative,
-                                                          validation_absolute)
-                                                    continue
-
-                                        primers.append({
-                                            'gene_name': variant + " " + gene_name,
-                                            'left_primer': {
-                                                'sequence': left_seq,
-                                                'length': len(left_seq),
-                                                'position': (left_position, left_position + len(left_seq)),
-                                                'position_abs': (left_absolute, left_absolute + len(left_seq)),
-                                                'tm': primer_results.get(f'PRIMER_LEFT_{k}_TM', 'N/A'),
-                                                'gc_percent': primer_results.get(f'PRIMER_LEFT_{k}_GC_PERCENT', 'N/A'),
-                                                'self_complementarity': primer_results.get(
-                                                    f'PRIMER_LEFT_{k}_SELF_ANY_TH',
-                                                    'N/A'),
-                                                'self_3prime_complementarity': primer_results.get(
-                                                    f'PRIMER_LEFT_{k}_SELF_END_TH', 'N/A'),
-                                                'exon_junction': None
-                                            },
-                                            'right_primer': {
-                                                'sequence': right_seq,
-                                                'length': len(right_seq),
-                                                'position': (right_position - len(right_seq), right_position),
-                                                'position_abs': (right_absolute - len(right_seq),
-                                                                 right_absolute + len(right_seq)),
-                                                'tm': primer_results.get(f'PRIMER_RIGHT_{k}_TM', 'N/A'),
-                                                'gc_percent': primer_results.get(f'PRIMER_RIGHT_{k}_GC_PERCENT', 'N/A'),
-                                                'self_complementarity': primer_results.get(
-                                                    f'PRIMER_RIGHT_{k}_SELF_ANY_TH',
-                                                    'N/A'),
-                                                'self_3prime_complementarity': primer_results.get(
-                                                    f'PRIMER_RIGHT_{k}_SELF_END_TH', 'N/A'),
-                                                'template_strand': 'Minus',
-                                                'exon_junction': None
-                                            },
-                                            'validation_relative': validation_relative,
-                                            'validation_relative_sequences': sequence_relative,
-                                            'validation_absolute': validation_absolute,
-                                            'amplicon_size': amplicon_size,
-                                            'amplicon_seq': amplicon_seq,
-                                            'amplicon_tm': tm_amplicon,
-                                            'amplicon_size_abs': amplicon_size_abs,
-
-                                        })
-
-                                        print("SAVED", left_seq, right_seq, validation_relative, validation_absolute)
-                                        pbar.update(1)
-                                        if progress_bar is not None:
-                                            progress_bar.update(1)
-                                        seen_primers.add(primer_key)
-                                        primers_found_in_iteration = True
+                        queue = pair_queues.get(pair)
+                        while len(primers) < PRIMER_NUM_RETURN:
+                            # Oldest candidates first, so primers keep the candidate order
+                            while pending and len(primers) < PRIMER_NUM_RETURN and (
+                                    pending[0][1] is None or pending[0][1].done() or not producing()):
+                                finish(*pending.popleft())
+                            if len(primers) >= PRIMER_NUM_RETURN:
+                                break
+
+                            if queue is None or (queue['next'] >= queue['returned'] and
+                                                 queue['returned'] == queue['asked'] and queue['next'] <= rank):
+                                # First visit, or every candidate drawn and primer3 may have more
+                                asked = PRIMER_NUM_RETURN + 1 if queue is None else queue['asked'] * 2
+                                primer3_input['SEQUENCE_PRIMER_PAIR_OK_REGION_LIST'] = region
+                                primer_results = Primer3.run_primer3(primer3_input,
+                                                                     dict(primer3_params, PRIMER_NUM_RETURN=asked),
+                                                                     primer3_executor)
+                                primer3_calls += 1
+                                queue = pair_queues[pair] = {
+                                    'results': primer_results,
+                                    'asked': asked,
+                                    'returned': primer_results.get('PRIMER_PAIR_NUM_RETURNED', 0),
+                                    'next': 0 if queue is None else queue['next'],
+                                }
+
+                            if queue['next'] > rank or queue['next'] >= queue['returned']:
+                                break
+
+                            k = queue['next']
+                            queue['next'] += 1
+                            primer_results = queue['results']
+
+                            left_key = f'PRIMER_LEFT_{k}_SEQUENCE'
+                            right_key = f'PRIMER_RIGHT_{k}_SEQUENCE'
+
+                            if left_key in primer_results and right_key in primer_results:
+                                left_seq = primer_results.get(left_key, 'N/A')
+                                right_seq = primer_results.get(right_key, 'N/A')
+
+                                primer_key = (left_seq, right_seq)
+                                if primer_key in seen_primers:
+                                    continue
+
+                                left_position = primer_results.get(f'PRIMER_LEFT_{k}')[0]
+                                right_position = primer_results.get(f'PRIMER_RIGHT_{k}')[0]
+
+                                left_absolute = Primer3.convert_to_absolute(left_position, exons,
+                                                                            cumulative_lengths)
+                                right_absolute = Primer3.convert_to_absolute(right_position, exons,
+                                                                             cumulative_lengths)
+
+                                amplicon_size = right_position - left_position + 1
+                                amplicon_size_abs = right_absolute - left_absolute + 1
+
+                                amplicon_seq = simplified_sequence[left_position:right_position + 1]
+
+                                tm_amplicon = primer3.bindings.calc_tm(
+                                    str(amplicon_seq),
+                                    mv_conc=PRIMER_MONOVALENT_CATION_CONC,  # Na+ mM
+                                    dv_conc=PRIMER_DIVALENT_CATION_CONC,  # Mg2+ mM
+                                    dntp_conc=PRIMER_DNTP_CONC,  # dNTPs mM
+                                    dna_conc=PRIMER_ANN_Oligo_CONC,  # oligo nM
+                                    tm_method=tm_method,
+                                    salt_corrections_method=salt_corrections_method
+                                )
+
+                                record = {
+                                    'gene_name': f"{variant} {gene_name}",
+                                    'left_primer': {
+                                        'sequence': left_seq,
+                                        'length': len(left_seq),
+                                        'position': (left_position, left_position + len(left_seq)),
+                                        'position_abs': (left_absolute, left_absolute + len(left_seq)),
+                                        'tm': primer_results.get(f'PRIMER_LEFT_{k}_TM', 'N/A'),
+                                        'gc_percent': primer_results.get(f'PRIMER_LEFT_{k}_GC_PERCENT', 'N/A'),
+                                        'self_complementarity': primer_results.get(
+                                            f'PRIMER_LEFT_{k}_SELF_ANY_TH',
+                                            'N/A'),
+                                        'self_3prime_complementarity': primer_results.get(
+                                            f'PRIMER_LEFT_{k}_SELF_END_TH', 'N/A'),
+                                        'exon_junction': None
+                                    },
+                                    'right_primer': {
+                                        'sequence': right_seq,
+                                        'length': len(right_seq),
+                                        'position': (right_position - len(right_seq), right_position),
+                                        'position_abs': (right_absolute - len(right_seq),
+                                                         right_absolute + len(right_seq)),
+                                        'tm': primer_results.get(f'PRIMER_RIGHT_{k}_TM', 'N/A'),
+                                        'gc_percent': primer_results.get(f'PRIMER_RIGHT_{k}_GC_PERCENT', 'N/A'),
+                                        'self_complementarity': primer_results.get(
+                                            f'PRIMER_RIGHT_{k}_SELF_ANY_TH',
+                                            'N/A'),
+                                        'self_3prime_complementarity': primer_results.get(
+                                            f'PRIMER_RIGHT_{k}_SELF_END_TH', 'N/A'),
+                                        'template_strand': 'Minus',
+                                        'exon_junction': None
+                                    },
+                                    'validation_relative': None,
+                                    'validation_relative_sequences': None,
+                                    'validation_absolute': None,
+                                    'amplicon_size': amplicon_size,
+                                    'amplicon_seq': amplicon_seq,
+                                    'amplicon_tm': tm_amplicon,
+                                    'amplicon_size_abs': amplicon_size_abs,
+
+                                }
+                                seen_primers.add(primer_key)
+
+                                if ucsc_validation is True and (species in ucsc_species.keys()
+                                                                or local_pcr_indexes.targets(species)):
+                                    # In-silico PCR runs in the validator pool while primer3 goes on with the next
+                                    # candidates, finish() applies only_validated when the answer is back.
+                                    # Species missing from UCSC are still checked against their local indexes.
+                                    ucsc_entry = ucsc_species.get(species) or {
+                                        "org": None, "db": None, "wp_target": local_pcr_indexes.targets(species)}
+                                    org = ucsc_entry["org"]
+                                    db = ucsc_entry["db"]
+                                    wp_targets = ucsc_entry["wp_target"]
+                                    pending.append((record, Primer3.validate_pair(
+                                        left_seq, right_seq, species, org, db, wp_targets, amplicon_size_abs,
+                                        PRIMER_PRODUCT_SIZE_RANGE[1])))
+                                else:
+                                    pending.append((record, None))
+
+                    # The round is over when its candidates are checked: the stop rule only counts kept primers
+                    while pending and len(primers) < PRIMER_NUM_RETURN:
+                        finish(*pending.popleft())
+                    primers_found_in_iteration = len(primers) > primers_before
 
                     if primers_found_in_iteration is False:
                         no_progress_count += 1
@@ -962,15 +1405,103 @@ class Primer3:
                         no_progress_count = 0
 
                     if no_progress_count >= max_no_progress:
-                        print("Breaking the loop: No new primers found after 5 iterations.")
+                        print("Breaking the loop: No new primers found after 2 rounds.")
                         break
 
+                # Candidates still in flight once enough primers are kept are dropped
+                for record, future in pending:
+                    if future is not None:
+                        future.cancel()
+
+            print(f"{variant} {gene_name}: {len(primers)} primers from {primer3_calls} primer3 call(s)")
+
             return primers
 
         except Exception as e:
             print(e)
             return None
 
+    @staticmethod
+    def design_executor():
+        # spawn, not fork: the server process already runs threads (Streamlit, fetch_executor, job runner)
+        global design_pool
+        with design_pool_lock:
+            if design_pool is None:
+                design_pool = ProcessPoolExecutor(max_workers=DESIGN_WORKERS, mp_context=get_context("spawn"))
+            return design_pool
+
+    @staticmethod
+    def design_variant(task):
+        # Design thread entry point: (variant, data, settings, primer3 processes) -> primers, [] when primer3 failed
+        variant, data, settings, executor = task
+        primers = Primer3.design_primers(variant=variant, gene_name=data['gene_name'], species=data.get('species'),
+                                         sequence=data['sequence'], exons=data['normalized_exon_coords'],
+                                         primer3_executor=executor, **settings)
+        return primers if primers is not None else []
+
+    @staticmethod
+    def design_variants(variants, settings, workers=None, progress=None, cancelled=None):
+        # variants: iterable of (variant, data), designed in parallel and yielded as (variant, data, primers) in input
+        # order. At most 2 x workers variants are in flight, so a streamed input is designed while it is produced.
+        # progress(variant, data) is called as soon as a variant is done, whatever its position.
+        # workers=None uses the shared design pool, a number gets a pool of its own for this run (CLI).
+        if workers is None:
+            yield from Primer3.design_in(Primer3.design_executor(), DESIGN_WORKERS, variants, settings, progress,
+                                         cancelled)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as executor:
+                yield from Primer3.design_in(executor, workers, variants, settings, progress, cancelled)
+
+    @staticmethod
+    def design_in(executor, workers, variants, settings, progress=None, cancelled=None):
+        # One thread per variant in flight: it waits on primer3 in the process pool or on the validator pool, both
+        # shared, so 2 x workers threads keep every primer3 process busy
+        threads = ThreadPoolExecutor(max_workers=2 * workers, thread_name_prefix="labmaster-design")
+        in_flight = deque()
+
+        def stop():
+            return cancelled is not None and cancelled()
+
+        try:
+            for variant, data in variants:
+                if stop():
+                    break
+                future = threads.submit(Primer3.design_variant, (variant, data, settings, executor))
+                if progress is not None:
+                    future.add_done_callback(lambda future, variant=variant, data=data:
+                                             None if future.cancelled() else progress(variant, data))
+                in_flight.append((variant, data, future))
+                while len(in_flight) > 2 * workers or (in_flight and in_flight[0][2].done()):
+                    variant, data, future = in_flight.popleft()
+                    yield variant, data, future.result()
+
+            while in_flight:
+                variant, data, future = in_flight.popleft()
+                if stop():
+                    future.cancel()
+                    continue
+                yield variant, data, future.result()
+        finally:
+            threads.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def run_primer3(primer3_input, primer3_params, executor=None):
+        # executor: primer3 processes. They only run primer3.bindings.design_primers, every HTTP request (in-silico
+        # PCR) stays in this process and its single NCBI/UCSC budget
+        key = design_key(primer3_input['SEQUENCE_TEMPLATE'], primer3_input.get('SEQUENCE_PRIMER_PAIR_OK_REGION_LIST'),
+                         primer3_params, getattr(primer3, '__version__', ''))
+        primer_results = design_cache.get(key)
+        if primer_results is None:
+            if executor is None:
+                primer_results = primer3.bindings.design_primers(primer3_input, primer3_params)
+            else:
+                # Copied: the call is pickled later, by the pool's feeder thread, and the caller moves on to the next
+                # exon pair region
+                primer_results = executor.submit(primer3.bindings.design_primers, dict(primer3_input),
+                                                 primer3_params).result()
+            design_cache.set(key, primer_results)
+        return primer_results
+
     @staticmethod
     def cumsum(iterable):
         total = 0
@@ -989,6 +1520,63 @@ class Primer3:
     @staticmethod
     def fetch_ucsc_pcr_results(wp_f, wp_r, species=None, org=None, db=None, wp_targets=None, amplicon_size_abs=None,
                                max_product_size=None):
+        # Blocking: UCSC (or the local index), then primer-BLAST when the transcripts gave nothing
+        results = Primer3.ucsc_pcr_results(wp_f, wp_r, species, org, db, wp_targets, amplicon_size_abs,
+                                           max_product_size)
+        if not Primer3.needs_primer_blast(species, results):
+            return results
+        try:
+            ncbi_pcr_results = Primer3.ncbi_pcr_in_silico(species, wp_f, wp_r)
+        except PrimerBlastError as e:
+            return Primer3.primer_blast_failed(wp_f, wp_r, e, results)
+        return Primer3.primer_blast_validation(ncbi_pcr_results, results, max_product_size)
+
+    @staticmethod
+    def validate_pair(wp_f, wp_r, species=None, org=None, db=None, wp_targets=None, amplicon_size_abs=None,
+                      max_product_size=None):
+        # Same answer as fetch_ucsc_pcr_results, as a Future: the UCSC part runs in the validator pool, a primer-BLAST
+        # job is then handed to the shared poller, so no validator thread waits on primer-BLAST and every pair
+        # submitted meanwhile is polled together
+        validation = Future()
+
+        def after_ucsc(future):
+            try:
+                results = future.result()
+                if not Primer3.needs_primer_blast(species, results):
+                    validation.set_result(results)
+                    return
+                primer_blast_jobs.submit(species, wp_f, wp_r).add_done_callback(
+                    lambda job: after_primer_blast(job, results))
+            except Exception as e:
+                validation.set_exception(e)
+
+        def after_primer_blast(job, results):
+            try:
+                validation.set_result(Primer3.primer_blast_validation(job.result(), results, max_product_size))
+            except PrimerBlastError as e:
+                validation.set_result(Primer3.primer_blast_failed(wp_f, wp_r, e, results))
+            except Exception as e:
+                validation.set_exception(e)
+
+        validation_executor.submit(Primer3.ucsc_pcr_results, wp_f, wp_r, species, org, db, wp_targets,
+                                   amplicon_size_abs, max_product_size).add_done_callback(after_ucsc)
+        return validation
+
+    @staticmethod
+    def needs_primer_blast(species, results):
+        # Fallback NCBI PCR, not needed when a local transcriptome already answered
+        validation_relative, validation_absolute, sequence_relative, sequence_absolute = results
+        return not sequence_relative and local_pcr_indexes.index_for(species, "transcriptome") is None
+
+    @staticmethod
+    def primer_blast_failed(wp_f, wp_r, error, results):
+        print(bcolors.FAIL + f"{wp_f} {wp_r}: {error}" + bcolors.ENDC)
+        validation_relative, validation_absolute, sequence_relative, sequence_absolute = results
+        return f"Error {error}", validation_absolute, [], sequence_absolute
+
+    @staticmethod
+    def ucsc_pcr_results(wp_f, wp_r, species=None, org=None, db=None, wp_targets=None, amplicon_size_abs=None,
+                         max_product_size=None):
         validation_relative = None
         validation_absolute = None
         sequence_relative = []
@@ -1004,6 +1592,17 @@ class Primer3:
                 else:
                     amplicon_size = 2000
 
+                # Local index first, same size limit as the hgPcr query
+                local = local_pcr_indexes.validate(wp_f, wp_r, species,
+                                                   "genome" if wp_target == "genome" else "transcriptome",
+                                                   amplicon_size * 2)
+                if local is not None:
+                    if wp_target == "genome":
+                        validation_absolute, sequence_absolute = local
+                    else:
+                        validation_relative, sequence_relative = local
+                    continue
+
                 base_url = "https://genome.ucsc.edu/cgi-bin/hgPcr"
                 params = {
                     "org": org,
@@ -1019,7 +1618,7 @@ class Primer3:
                     "boolshad.wp_append": 0,
                 }
 
-                response = requests.get(base_url, params=params, headers=headers)
+                response = http_get(base_url, params=params, use_cache=False)
 
                 if response.status_code != 200:
                     if wp_target == "genome":
@@ -1029,7 +1628,6 @@ class Primer3:
                     continue
 
                 soup = BeautifulSoup(response.text, "html.parser")
-                print(soup)
                 result_section = soup.find("pre")
 
                 parsed_results = []
@@ -1085,161 +1683,44 @@ class Primer3:
                         validation_relative = "Not found"
                         sequence_relative = []
 
-        # Fallback NCBI PCR
-        if not sequence_relative:
-            sequence_relative = []
+        return validation_relative, validation_absolute, sequence_relative, sequence_absolute
 
-            ncbi_pcr_results = Primer3.ncbi_pcr_in_silico(species, wp_f, wp_r)
+    @staticmethod
+    def primer_blast_validation(ncbi_pcr_results, results, max_product_size=None):
+        # primer-BLAST products in place of the empty UCSC transcript answer
+        validation_relative, validation_absolute, sequence_relative, sequence_absolute = results
+        sequence_relative = []
 
-            if len(ncbi_pcr_results) > 0:
-                filtered = [res for res in ncbi_pcr_results if
-                            res["product_length"] and res["product_length"] < 100 + max_product_size]
-
-                if len(set(res["product_length"] for res in filtered)) <= 1:
-                    validation_relative = True
-
-                for i, res in enumerate(filtered):
-                    sequence_relative.append({
-                        "size": res["product_length"],
-                        "gene": res.get("name", "N/A") + " " + res.get("gene", "N/A"),
-                        "template_fwd": {
-                            "start - end": res.get("forward_start", "N/A") + " -> " + res.get("forward_end", "N/A"),
-                            "primer": res.get("forward_primer", "N/A"),
-                            "template": res.get("forward_template", "N/A"),
-                        },
-                        "template_rev": {
-                            "start - end": res.get("reverse_start", "N/A") + " -> " + res.get("reverse_end", "N/A"),
-                            "primer": res.get("reverse_primer", "N/A"),
-                            "template": res.get("reverse_template", "N/A"),
-                        }
-                    })
+        if len(ncbi_pcr_results) > 0:
+            # No size limit given (check_primer): every product counts
+            filtered = [res for res in ncbi_pcr_results if res["product_length"] and (
+                max_product_size is None or res["product_length"] < 100 + max_product_size)]
+
+            if len(set(res["product_length"] for res in filtered)) <= 1:
+                validation_relative = True
+
+            for i, res in enumerate(filtered):
+                sequence_relative.append({
+                    "size": res["product_length"],
+                    "gene": res.get("name", "N/A") + " " + res.get("gene", "N/A"),
+                    "template_fwd": {
+                        "start - end": res.get("forward_start", "N/A") + " -> " + res.get("forward_end", "N/A"),
+                        "primer": res.get("forward_primer", "N/A"),
+                        "template": res.get("forward_template", "N/A"),
+                    },
+                    "template_rev": {
+                        "start - end": res.get("reverse_start", "N/A") + " -> " + res.get("reverse_end", "N/A"),
+                        "primer": res.get("reverse_primer", "N/A"),
+                        "template": res.get("reverse_template", "N/A"),
+                    }
+                })
 
-            else:
-                validation_relative = False
+        else:
+            validation_relative = False
 
-        print(validation_relative)
         return validation_relative, validation_absolute, sequence_relative, sequence_absolute
 
     @staticmethod
     def ncbi_pcr_in_silico(species, primer_fwd, primer_rev):
-
-        url = (
-            "https://www.ncbi.nlm.nih.gov/tools/primer-blast/primertool.cgi?"
-            "CMD=request&CON_ANEAL_OLIGO=50.0&CON_DNTPS=0.6&DIVA_CATIONS=1.5&EVALUE=30000"
-            "&GC_CLAMP=0&HITSIZE=50000&LOW_COMPLEXITY_FILTER=on&MAX_CANDIDATE_PRIMER=500"
-            "&MAX_INTRON_SIZE=1000000&MAX_TARGET_PER_TEMPLATE=100&MAX_TARGET_SIZE=4000"
-            "&MIN_INTRON_SIZE=1000&MISMATCH_REGION_LENGTH=5&MONO_CATIONS=50.0"
-            "&OVERLAP_3END=4&OVERLAP_5END=7&POLYX=5"
-            "&PRIMER_3END_SPECIFICITY_MISMATCH=1&PRIMER_INTERNAL_OLIGO_MAX_GC=80.0"
-            "&PRIMER_INTERNAL_OLIGO_MAX_SIZE=27&PRIMER_INTERNAL_OLIGO_MAX_TM=63.0"
-            "&PRIMER_INTERNAL_OLIGO_MIN_GC=20.0&PRIMER_INTERNAL_OLIGO_MIN_SIZE=18"
-            "&PRIMER_INTERNAL_OLIGO_MIN_TM=57.0&PRIMER_INTERNAL_OLIGO_OPT_GC_PERCENT=50"
-            "&PRIMER_INTERNAL_OLIGO_OPT_SIZE=20&PRIMER_INTERNAL_OLIGO_OPT_TM=60.0"
-            f"&PRIMER_LEFT_INPUT={primer_fwd}&PRIMER_MAX_DIFF_TM=3&PRIMER_MAX_END_GC=5"
-            "&PRIMER_MAX_END_STABILITY=9&PRIMER_MAX_GC=80.0&PRIMER_MAX_HAIRPIN_TH=24.0"
-            "&PRIMER_MAX_SELF_ANY_TH=45.0&PRIMER_MAX_SELF_END_TH=35.0"
-            "&PRIMER_MAX_SIZE=25&PRIMER_MAX_TEMPLATE_MISPRIMING=12.00"
-            "&PRIMER_MAX_TEMPLATE_MISPRIMING_TH=40.00&PRIMER_MAX_TM=63.0"
-            "&PRIMER_MIN_GC=20.0&PRIMER_MIN_SIZE=15&PRIMER_MIN_TM=57.0"
-            "&PRIMER_MISPRIMING_LIBRARY=AUTO&PRIMER_NUM_RETURN=10&PRIMER_ON_SPLICE_SITE=0"
-            "&PRIMER_OPT_SIZE=20&PRIMER_OPT_TM=60.0&PRIMER_PAIR_MAX_COMPL_ANY=8.00"
-            "&PRIMER_PAIR_MAX_COMPL_ANY_TH=45.0&PRIMER_PAIR_MAX_COMPL_END=3.00"
-            "&PRIMER_PAIR_MAX_COMPL_END_TH=35.0&PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING=24.00"
-            "&PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING_TH=70.00&PRIMER_PRODUCT_MAX=1000"
-            "&PRIMER_PRODUCT_MIN=70"
-            f"&PRIMER_RIGHT_INPUT={primer_rev}&PRIMER_SPECIFICITY_DATABASE=refseq_mrna"
-            "&SALT_FORMULAR=1&SEARCH_SPECIFIC_PRIMER=on&SEARCHMODE=0&SELF_ANY=8.00"
-            "&SELF_END=3.00&SHOW_SVIEWER=on&SPLICE_SITE_OVERLAP_3END=4"
-            "&SPLICE_SITE_OVERLAP_3END_MAX=8&SPLICE_SITE_OVERLAP_5END=7&TM_METHOD=1"
-            "&TOTAL_MISMATCH_IGNORE=6&TOTAL_PRIMER_SPECIFICITY_MISMATCH=1&UNGAPPED_BLAST=on"
-            "&USER_TYPE=2&WORD_SIZE=7"
-        )
-
-        if species:
-            url += f"&ORGANISM={species}"
-
-        session = requests.Session()
-        response = session.get(url)
-
-        if response.status_code != 200:
-            print(f"❌ Error request: {response.status_code}")
-            exit()
-
-        soup = BeautifulSoup(response.text, "html.parser")
-        job_id_input = soup.find("input", {"name": "job_key"})
-        if job_id_input:
-            job_key = job_id_input.get("value")
-        else:
-            match = re.search(r"job_key=([A-Za-z0-9_-]+)", response.text)
-            if match:
-                job_key = match.group(1)
-            else:
-                print("❌ JOB ID not found")
-                exit()
-
-        print(f"JOB ID : {job_key}")
-
-        status_url = f"https://www.ncbi.nlm.nih.gov/tools/primer-blast/primertool.cgi?job_key={job_key}&CMD=get"
-
-        while True:
-            time.sleep(10)
-            status_response = session.get(status_url)
-
-            soup = BeautifulSoup(status_response.text, "html.parser")
-
-            primer_pair = soup.find("a", {"name": "0"})
-            forward_primer = soup.find("th", string="Forward primer")
-            reverse_primer = soup.find("th", string="Reverse primer")
-
-            if primer_pair and forward_primer and reverse_primer:
-                break
-            else:
-                print("Waiting results...")
-
-        results = []
-
-        entries = soup.find_all("a", href=re.compile(r"viewer.fcgi\?db=nucleotide"))
-
-        if len(entries) > 0:
-            for entry in entries:
-                gene_name = entry.text.strip()
-                gene_info = entry.next_sibling.strip() if entry.next_sibling else "N/A"
-
-                pre_block = entry.find_next("pre").text.strip()
-
-                product_length_match = re.search(r"product length = (\d+)", pre_block)
-                product_length = int(product_length_match.group(1)) if product_length_match else None
-
-                forward_primer, forward_start, forward_template, forward_end = "N/A", "N/A", "N/A", "N/A"
-                reverse_primer, reverse_start, reverse_template, reverse_end = "N/A", "N/A", "N/A", "N/A"
-
-                forward_match = re.search(r"Forward primer\s+\d+\s+([A-Za-z]+)\s+\d+", pre_block)
-                reverse_match = re.search(r"Reverse primer\s+\d+\s+([A-Za-z]+)\s+\d+", pre_block)
-
-                if forward_match:
-                    forward_primer = forward_match.group(1)
-                if reverse_match:
-                    reverse_primer = reverse_match.group(1)
-
-                template_matches = re.findall(r"Template\s+(\d+)\s+([A-Za-z.\s]+)\s+(\d+)", pre_block)
-
-                if len(template_matches) > 0:
-                    forward_start, forward_template, forward_end = template_matches[0]
-                if len(template_matches) > 1:
-                    reverse_start, reverse_template, reverse_end = template_matches[1]
-
-                results.append({
-                    "gene": gene_info,
-                    "name": gene_name,
-                    "product_length": product_length,
-                    "forward_primer": forward_primer,
-                    "forward_start": forward_start,
-                    "forward_template": forward_template,
-                    "forward_end": forward_end,
-                    "reverse_primer": reverse_primer,
-                    "reverse_start": reverse_start,
-                    "reverse_template": reverse_template,
-                    "reverse_end": reverse_end,
-                })
-
-        return results
+        # Blocks until the job is done, raises PrimerBlastError instead of stopping the server
+        return primer_blast_jobs.run(species, primer_fwd, primer_rev)
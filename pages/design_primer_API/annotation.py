@@ -0,0 +1,286 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import argparse
+import gzip
+import os
+import re
+import sqlite3
+import threading
+from urllib.parse import unquote
+
+# Species names used by the pages -> scientific names stored in the index
+common_species = {
+    "human": "Homo sapiens",
+    "mouse": "Mus musculus",
+    "rat": "Rattus norvegicus",
+    "drosophila": "Drosophila melanogaster",
+    "zebrafish": "Danio rerio",
+}
+
+# Features that are never a transcript, skipped while importing a GFF3
+not_transcripts = {"CDS", "exon", "region", "cDNA_match", "match", "match_part", "start_codon", "stop_codon",
+                   "five_prime_UTR", "three_prime_UTR", "UTR", "Selenocysteine", "sequence_feature"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS genes (gene_key TEXT PRIMARY KEY, entrez_id TEXT, symbol TEXT, species TEXT, seqid TEXT);
+CREATE TABLE IF NOT EXISTS transcripts (transcript_key TEXT, accession TEXT, accession_version TEXT, gene_key TEXT,
+                                        label TEXT, seqid TEXT, strand TEXT, rank INTEGER);
+CREATE TABLE IF NOT EXISTS exons (transcript_key TEXT, start INTEGER, end INTEGER);
+CREATE TABLE IF NOT EXISTS sequences (seqid TEXT PRIMARY KEY, title TEXT);
+CREATE INDEX IF NOT EXISTS genes_symbol ON genes (symbol);
+CREATE INDEX IF NOT EXISTS genes_entrez ON genes (entrez_id);
+CREATE INDEX IF NOT EXISTS transcripts_accession ON transcripts (accession);
+CREATE INDEX IF NOT EXISTS transcripts_gene ON transcripts (gene_key);
+CREATE INDEX IF NOT EXISTS exons_transcript ON exons (transcript_key);
+"""
+
+
+# Chromosomes of the primary assembly: RefSeq NC_ accessions, UCSC/Ensembl names. Anything else (NT_/NW_ alt and patch
+# scaffolds, chrN_..._alt) is another placement of the same transcript, only used when there is no primary one.
+PRIMARY_SEQID = re.compile(r"^(NC_\d+(\.\d+)?|(chr)?(\d+|[XYWZ]|MT?))$")
+
+
+def placement_rank(seqid):
+    return 0 if seqid and PRIMARY_SEQID.match(seqid) else 1
+
+
+def open_text(path):
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path)
+
+
+def parse_attributes(field):
+    # GFF3: key=value;key=value (URL encoded)   GTF: key "value"; key "value";
+    attributes = {}
+    if '"' in field or "=" not in field:
+        for key, value in re.findall(r'(\S+)\s+"([^"]*)"', field):
+            attributes[key] = f"{attributes[key]},{value}" if key in attributes else value
+    else:
+        for item in field.strip().strip(";").split(";"):
+            if "=" in item:
+                key, value = item.split("=", 1)
+                attributes[key.strip()] = unquote(value)
+    return attributes
+
+
+def entrez_from(attributes):
+    for xref in attributes.get("Dbxref", attributes.get("db_xref", "")).split(","):
+        if xref.startswith("GeneID:"):
+            return xref.split(":", 1)[1]
+    return None
+
+
+def variant_label(attributes):
+    match = re.search(r"transcript variant [^,;]+", attributes.get("product", ""))
+    return match.group(0) if match else None
+
+
+def build_index(annotation_path, index_path, species=None):
+    features = {}
+    exons = {}
+    gtf_transcripts = {}
+    titles = {}
+
+    with open_text(annotation_path) as handle:
+        for line in handle:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 9:
+                continue
+            seqid, source, feature, start, end, score, strand, phase, attribute_field = fields[:9]
+            attributes = parse_attributes(attribute_field)
+
+            if feature == "region":
+                if "chromosome" in attributes and seqid not in titles:
+                    titles[seqid] = f"{species or ''} chromosome {attributes['chromosome']}".strip()
+                continue
+
+            if "ID" in attributes or "Parent" in attributes:
+                # GFF3: features by ID, exons attached to their transcript by Parent
+                if feature == "exon":
+                    for parent in attributes.get("Parent", "").split(","):
+                        exons.setdefault(parent, []).append((int(start) - 1, int(end) - 1))
+                elif feature not in not_transcripts and "ID" in attributes:
+                    features[attributes["ID"]] = (seqid, strand, attributes)
+            elif "transcript_id" in attributes:
+                # GTF: everything is keyed by transcript_id / gene_id
+                # A transcript placed twice (PAR on chrX and chrY, alt scaffolds) keeps one id: the seqid tells
+                # the placements apart
+                transcript = gtf_transcripts.setdefault((attributes["transcript_id"], seqid), {
+                    'seqid': seqid, 'strand': strand, 'attributes': {}, 'exons': []})
+                transcript['attributes'].update(attributes)
+                if feature == "exon":
+                    transcript['exons'].append((int(start) - 1, int(end) - 1))
+
+    genes = {}
+    transcripts = []
+
+    for parent, coords in exons.items():
+        if parent not in features:
+            continue
+        seqid, strand, attributes = features[parent]
+        gene_attributes = features.get(attributes.get("Parent", ""), (None, None, {}))[2]
+        accession_version = attributes.get("transcript_id") or attributes.get("Name") or parent
+        gene_key = attributes.get("Parent") or accession_version
+        # RefSeq: Name / gene, GENCODE: gene_name
+        genes.setdefault(gene_key, (entrez_from(gene_attributes) or entrez_from(attributes),
+                                    gene_attributes.get("Name") or gene_attributes.get("gene_name")
+                                    or attributes.get("gene") or attributes.get("gene_name"), seqid))
+        # GFF3 IDs are unique per placement (rna-NM_000001.1, rna-NM_000001.1-2): exons stay with their own one
+        transcripts.append((f"{parent}@{seqid}", accession_version, gene_key, variant_label(attributes), seqid,
+                            strand, coords))
+
+    for (transcript_id, seqid), transcript in gtf_transcripts.items():
+        if not transcript['exons']:
+            continue
+        attributes = transcript['attributes']
+        gene_key = attributes.get("gene_id") or transcript_id
+        genes.setdefault(gene_key, (entrez_from(attributes), attributes.get("gene_name") or attributes.get("gene")
+                                    or attributes.get("gene_id"), seqid))
+        transcripts.append((f"{transcript_id}@{seqid}", transcript_id, gene_key, variant_label(attributes), seqid,
+                            transcript['strand'], transcript['exons']))
+
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    connection = sqlite3.connect(index_path)
+    with connection:
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT OR REPLACE INTO genes VALUES (?, ?, ?, ?, ?)",
+                               [(gene_key, entrez_id, symbol, species, seqid)
+                                for gene_key, (entrez_id, symbol, seqid) in genes.items()])
+        for rank, (transcript_key, accession_version, gene_key, label, seqid, strand, coords) in enumerate(transcripts):
+            accession = accession_version.split(".")[0]
+            connection.execute("INSERT INTO transcripts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (transcript_key, accession, accession_version, gene_key, label, seqid, strand, rank))
+            connection.executemany("INSERT INTO exons VALUES (?, ?, ?)",
+                                   [(transcript_key, start, end) for start, end in sorted(set(coords))])
+        connection.executemany("INSERT OR REPLACE INTO sequences VALUES (?, ?)", titles.items())
+    connection.close()
+    return index_path
+
+
+class AnnotationIndex:
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def query(self, sql, parameters=()):
+        with self.lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def find_gene(self, gene_id, species=None):
+        # Returns (gene_key, specific transcript or None)
+        # Several rows for one transcript or gene: one per placement, the primary assembly one is used
+        if gene_id.upper().startswith(('XM_', 'NM_', 'XR_', 'NR_', 'YP_', 'ENST')):
+            rows = self.query("SELECT gene_key, accession, seqid FROM transcripts WHERE accession = ? ORDER BY rank",
+                              (gene_id.split(".")[0],))
+            rows.sort(key=lambda row: placement_rank(row[2]))
+            return (rows[0][0], rows[0][1]) if rows else (None, None)
+
+        if gene_id.isdigit():
+            # Entrez IDs are unique across species
+            rows = self.query("SELECT gene_key, species, seqid FROM genes WHERE entrez_id = ? ORDER BY rowid",
+                              (gene_id,))
+        else:
+            rows = self.query("SELECT gene_key, species, seqid FROM genes WHERE symbol = ? COLLATE NOCASE "
+                              "ORDER BY rowid", (gene_id,))
+            rows = [row for row in rows if species is None or row[1] in (None, "", species)]
+        rows.sort(key=lambda row: placement_rank(row[2]))
+        return (rows[0][0], None) if rows else (None, None)
+
+    def find_variants(self, gene_id, species=None, all_slice_forms=False):
+        species = common_species.get(str(species).lower(), species) if species else None
+        gene_key, specific_transcript = self.find_gene(gene_id, species)
+        if gene_key is None:
+            return None
+
+        entrez_id, symbol, gene_species = self.query("SELECT entrez_id, symbol, species FROM genes WHERE gene_key = ?",
+                                                     (gene_key,))[0]
+        transcripts = self.query("SELECT transcript_key, accession, label, seqid, strand FROM transcripts "
+                                 "WHERE gene_key = ? ORDER BY rank", (gene_key,))
+        # One placement per accession, the primary assembly one when there is one
+        placements = {}
+        for transcript in sorted(transcripts, key=lambda transcript: placement_rank(transcript[3])):
+            placements.setdefault(transcript[1], transcript)
+        transcripts = [transcript for transcript in transcripts if placements[transcript[1]] is transcript]
+
+        # Same choice as NCBIdna.build_variants: asked transcript, else "transcript variant 1", else the first one
+        if not all_slice_forms:
+            chosen = [t for t in transcripts if t[1] == specific_transcript] or \
+                     [t for t in transcripts if t[2] == "transcript variant 1"] or transcripts[:1]
+            transcripts = chosen[:1]
+
+        all_variants = {}
+        for transcript_key, accession, label, seqid, strand in transcripts:
+            exon_coords = self.query("SELECT start, end FROM exons WHERE transcript_key = ? ORDER BY start",
+                                     (transcript_key,))
+            if strand == "-":
+                # NCBI order: transcript order, (to, from) pairs on the minus strand
+                exon_coords = [(end, start) for start, end in reversed(exon_coords)]
+            else:
+                exon_coords = [(start, end) for start, end in exon_coords]
+
+            first_exon_start = exon_coords[0][0]
+            title = self.query("SELECT title FROM sequences WHERE seqid = ?", (seqid,))
+            all_variants[accession] = {
+                'entrez_id': entrez_id,
+                'gene_name': symbol,
+                'genomic_info': title[0][0] if title else seqid,
+                'chraccver': seqid,
+                'strand': "minus" if strand == "-" else "plus",
+                'exon_coords': exon_coords,
+                'normalized_exon_coords': [(abs(start - first_exon_start), abs(end - first_exon_start))
+                                           for start, end in exon_coords],
+                'species': gene_species or species
+            }
+        return all_variants or None
+
+
+class LocalAnnotations:
+    # Every index given here is tried before E-utilities (LABMASTER_ANNOTATION_DB, paths separated by os.pathsep)
+    def __init__(self, paths=()):
+        self.indexes = [AnnotationIndex(path) for path in paths]
+
+    @classmethod
+    def from_env(cls):
+        paths = os.environ.get("LABMASTER_ANNOTATION_DB", "")
+        return cls([path for path in paths.split(os.pathsep) if path])
+
+    def add(self, path):
+        self.indexes.append(AnnotationIndex(path))
+
+    def find_variants(self, gene_id, species=None, all_slice_forms=False):
+        for index in self.indexes:
+            all_variants = index.find_variants(gene_id, species, all_slice_forms)
+            if all_variants:
+                return all_variants
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile a RefSeq/GENCODE GTF or GFF3 into a LabMaster annotation index")
+    parser.add_argument("annotation", help="GTF or GFF3 file (.gz allowed)")
+    parser.add_argument("index", help="SQLite index to create")
+    parser.add_argument("--species", default=None, help='Scientific name, e.g. "Homo sapiens"')
+    args = parser.parse_args()
+    print(f"Annotation index written to {build_index(args.annotation, args.index, args.species)}")
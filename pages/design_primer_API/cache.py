@@ -0,0 +1,366 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+DAY = 24 * 60 * 60
+
+# Where persistent caches live (HTTP responses, accessions, extraction checkpoints, primer3 results)
+cache_dir = os.environ.get("LABMASTER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".labmaster", "cache"))
+
+# Time to live per endpoint, in seconds. Gene symbols and summaries can move between annotation releases, sequences
+# of a versioned accession (NC_000006.12, ...) never change.
+endpoint_ttl = {
+    "esearch.fcgi": 7 * DAY,
+    "esummary.fcgi": 7 * DAY,
+    "elink.fcgi": 30 * DAY,
+    "efetch.fcgi": 30 * DAY,
+    "nuccore": 30 * DAY,
+}
+default_ttl = 1 * DAY
+
+# Query parameters that do not change the response and must not split the cache
+ignored_params = {"api_key", "tool", "email"}
+
+# What E-utilities sends with a 200 when it is not an answer: HTML maintenance/proxy pages, error JSON or XML
+ERROR_PAGE = re.compile(r"<!DOCTYPE html|<html", re.IGNORECASE)
+ERROR_BODY = re.compile(r'^\{\s*"error"\s*:|"ERROR"\s*:|<ERROR>')
+
+
+def normalize_url(url, params=None):
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)]
+    if params:
+        items = params.items() if isinstance(params, dict) else params
+        for key, value in items:
+            if isinstance(value, (list, tuple)):
+                query.extend((key, str(v)) for v in value)
+            else:
+                query.append((key, str(value)))
+    query = sorted((key, value) for key, value in query if key not in ignored_params)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path}?{urlencode(query)}"
+
+
+def cache_key(url, params=None):
+    return hashlib.sha256(normalize_url(url, params).encode("utf-8")).hexdigest()
+
+
+def endpoint_of(url):
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+    for segment in reversed(segments):
+        if segment in endpoint_ttl:
+            return segment
+    return segments[-1] if segments else ""
+
+
+def cacheable(url, params, text):
+    # Only answers go to the cache: a transient error page kept 30 days would break that gene for 30 days
+    head = text.lstrip()[:1024]
+    if not head or ERROR_BODY.search(head):
+        return False
+    parts = urlsplit(url)
+    if parts.netloc.lower() == "eutils.ncbi.nlm.nih.gov" and ERROR_PAGE.match(head):
+        return False
+    query = dict(parse_qsl(parts.query))
+    query.update(params if isinstance(params, dict) else dict(params or ()))
+    if endpoint_of(url) == "efetch.fcgi" and query.get("rettype") == "fasta":
+        return head.startswith(">")
+    return True
+
+
+def open_db(path):
+    # (path, connection) of a cache file shared between threads, a :memory: database for the lifetime of the process
+    # when the file cannot be created (read-only home, e.g. hosted Streamlit)
+    try:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path, sqlite3.connect(path, check_same_thread=False, timeout=30)
+    except (OSError, sqlite3.Error):
+        return ":memory:", sqlite3.connect(":memory:", check_same_thread=False)
+
+
+class CachedResponse:
+    # Minimal stand-in for requests.Response so callers do not care where the body came from
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, url, text, stale=False):
+        self.url = url
+        self.text = text
+        self.stale = stale
+        self.headers = {}
+
+    @property
+    def content(self):
+        return self.text.encode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    def __init__(self, path=None, max_bytes=512 * 1024 * 1024, ttl=None, enabled=True):
+        self.path = path if path is not None else os.path.join(cache_dir, "http_cache.sqlite")
+        self.max_bytes = max_bytes
+        self.ttl = dict(endpoint_ttl if ttl is None else ttl)
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.path, self.connection = open_db(self.path)
+
+        with self.lock, self.connection:
+            if self.path != ":memory:":
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, url TEXT, endpoint TEXT, body BLOB, size INTEGER, created REAL, accessed REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, url, params=None, allow_stale=False):
+        if not self.enabled:
+            return None
+
+        key = cache_key(url, params)
+        with self.lock:
+            row = self.connection.execute("SELECT body, created, endpoint FROM responses WHERE key = ?",
+                                          (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            body, created, endpoint = row
+            expired = time.time() - created > self.ttl.get(endpoint, default_ttl)
+            if expired and not allow_stale:
+                self.misses += 1
+                return None
+
+            with self.connection:
+                self.connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            if expired:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+
+        return CachedResponse(url, zlib.decompress(body).decode("utf-8"), stale=expired)
+
+    def set(self, url, params, text):
+        if not self.enabled:
+            return
+
+        key = cache_key(url, params)
+        body = zlib.compress(text.encode("utf-8"))
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO responses (key, url, endpoint, body, size, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, normalize_url(url, params), endpoint_of(url), body, len(body), now, now))
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def delete(self, url, params=None):
+        key = cache_key(url, params)
+        with self.lock:
+            row = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                with self.connection:
+                    self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= row[0]
+
+    def evict(self):
+        # Least recently used first, down to 90% of the cap so we do not evict on every insert
+        target = int(self.max_bytes * 0.9)
+        rows = self.connection.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        with self.connection:
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM responses")
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses + self.stale_hits
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self.total_bytes,
+            "path": self.path,
+        }
+
+
+class AccessionCache:
+    # Transcript accession (NM_004562, no version) -> Entrez gene ID. Only positive answers are kept.
+    def __init__(self, path=None, ttl=endpoint_ttl["elink.fcgi"], enabled=True):
+        self.path = path if path is not None else os.path.join(cache_dir, "accessions.sqlite")
+        self.ttl = ttl
+        self.enabled = enabled
+        self.lock = threading.Lock()
+
+        self.path, self.connection = open_db(self.path)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS accessions (accession TEXT PRIMARY KEY, entrez_id TEXT, created REAL)")
+
+    def get_many(self, accessions):
+        if not self.enabled or not accessions:
+            return {}
+
+        found = {}
+        oldest = time.time() - self.ttl
+        with self.lock:
+            for i in range(0, len(accessions), 500):
+                chunk = list(accessions[i:i + 500])
+                rows = self.connection.execute(
+                    f"SELECT accession, entrez_id FROM accessions WHERE created > ? AND accession IN "
+                    f"({','.join('?' * len(chunk))})", [oldest] + chunk).fetchall()
+                found.update(rows)
+        return found
+
+    def set_many(self, mapping):
+        if not self.enabled or not mapping:
+            return
+
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO accessions VALUES (?, ?, ?)",
+                                        [(accession, entrez_id, now) for accession, entrez_id in mapping.items()])
+
+
+def design_key(template, regions, params, version=""):
+    # Content address of one primer3 run: same template, same regions and same settings give the same answer
+    key = json.dumps([version, template, regions, params], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class DesignCache:
+    # primer3.bindings.design_primers results, shared by every design process and kept across restarts.
+    # Least recently used entries go first once the file is over max_bytes.
+    def __init__(self, path=None, max_bytes=256 * 1024 * 1024, enabled=True):
+        self.path = path if path is not None else os.path.join(cache_dir, "primer3.sqlite")
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        self.path, self.connection = open_db(self.path)
+
+        with self.lock, self.connection:
+            if self.path != ":memory:":
+                self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS designs (key TEXT PRIMARY KEY, body BLOB, size INTEGER, accessed REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS designs_accessed ON designs (accessed)")
+            self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM designs").fetchone()[0]
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            row = self.connection.execute("SELECT body FROM designs WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            with self.connection:
+                self.connection.execute("UPDATE designs SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]).decode("utf-8"))
+
+    def set(self, key, results):
+        if not self.enabled:
+            return
+
+        body = zlib.compress(json.dumps(results, default=str).encode("utf-8"))
+        with self.lock:
+            # Two processes designing the same variant write the same key: the replaced row does not count twice
+            previous = self.connection.execute("SELECT size FROM designs WHERE key = ?", (key,)).fetchone()
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO designs VALUES (?, ?, ?, ?)",
+                                        (key, body, len(body), time.time()))
+            self.total_bytes += len(body) - (previous[0] if previous else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        # Several processes write to the same file: start from the real size, then down to 90% of the cap
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM designs").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        evicted = []
+        for key, size in self.connection.execute("SELECT key, size FROM designs ORDER BY accessed ASC").fetchall():
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        with self.connection:
+            self.connection.executemany("DELETE FROM designs WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM designs")
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM designs").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self.total_bytes,
+            "path": self.path,
+        }
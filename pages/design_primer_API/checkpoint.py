@@ -0,0 +1,68 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+
+from .cache import DAY, cache_dir, open_db
+
+
+class ExtractionCheckpoint:
+    # Durable progress of one extraction (same gene list, same settings): every gene that came back OK is stored as
+    # soon as it is done, a restarted extraction only asks NCBI for the others. Failed genes are never stored.
+    def __init__(self, job_id, path=None, max_age=7 * DAY):
+        self.job_id = job_id
+        self.path = path if path is not None else os.path.join(cache_dir, "checkpoints.sqlite")
+        self.lock = threading.Lock()
+
+        self.path, self.connection = open_db(self.path)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "job_id TEXT, gene_id TEXT, message TEXT, body BLOB, finished REAL, PRIMARY KEY (job_id, gene_id))")
+            # Abandoned jobs do not pile up
+            self.connection.execute("DELETE FROM results WHERE finished < ?", (time.time() - max_age,))
+
+    @classmethod
+    def for_job(cls, gene_ids, path=None, **settings):
+        key = json.dumps([list(gene_ids), settings], sort_keys=True, default=str)
+        return cls(hashlib.sha256(key.encode("utf-8")).hexdigest(), path)
+
+    def completed(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT gene_id, message, body FROM results WHERE job_id = ?",
+                                           (self.job_id,)).fetchall()
+        return {gene_id: (json.loads(zlib.decompress(body).decode("utf-8")), message) for gene_id, message, body in rows}
+
+    def save(self, gene_id, all_variants, message):
+        body = zlib.compress(json.dumps(all_variants).encode("utf-8"))
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                                    (self.job_id, gene_id, message, body, time.time()))
+
+    def clear(self):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM results WHERE job_id = ?", (self.job_id,))
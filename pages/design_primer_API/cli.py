@@ -0,0 +1,242 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Headless extraction + primer design, same code as pages/design_primer.py without Streamlit:
+#
+#   python -m pages.design_primer_API.cli --genes genes.txt --settings settings.json --output primers.jsonl
+#   python -m pages.design_primer_API.cli --fasta sequences.fa --output primers.csv --workers 8
+#
+# settings.json (every key optional):
+#   {"species": "human", "seq_type": "rna", "upstream": 2000, "downstream": 2000, "genome_version": "current",
+#    "all_slice_forms": false, "api_key": null,
+#    "primer3": {"PRIMER_NUM_RETURN": 10, "PRIMER_PRODUCT_SIZE_RANGE": [60, 250], "ucsc_validation": false}}
+
+
+import argparse
+import csv
+import importlib.util
+import inspect
+import json
+import os
+import sys
+
+from Bio import SeqIO
+
+from . import NCBIdna, Primer3, bcolors
+from .checkpoint import ExtractionCheckpoint
+from .network import set_api_key
+
+default_settings = {
+    "species": "human",
+    "seq_type": "rna",
+    "upstream": 2000,
+    "downstream": 2000,
+    "genome_version": "current",
+    "all_slice_forms": False,
+    "api_key": None,
+    "primer3": {},
+}
+
+# What settings["primer3"] may hold: the keyword arguments of Primer3.design_primers, not the ones the CLI fills
+primer3_settings = set(inspect.signature(Primer3.design_primers).parameters) - {
+    "variant", "gene_name", "species", "sequence", "exons", "progress_bar", "primer3_executor"}
+
+
+def load_settings(path):
+    settings = dict(default_settings)
+    if path:
+        with open(path) as handle:
+            settings.update(json.load(handle))
+    return settings
+
+
+def check_primer3_settings(settings):
+    # A wrong key would only show up as a TypeError in a design thread, far from the settings file
+    unknown = sorted(set(settings) - primer3_settings)
+    if unknown:
+        raise ValueError(f"Unknown primer3 setting(s): {', '.join(unknown)}")
+
+
+def read_genes(path):
+    with open(path) as handle:
+        return list(dict.fromkeys(line.strip() for line in handle if line.strip() and not line.startswith("#")))
+
+
+def read_fasta(path):
+    # Same header convention as the page: ">GeneName | Species"
+    variants = {}
+    for number, record in enumerate(SeqIO.parse(path, "fasta"), start=1):
+        parts = record.description.split("|")
+        sequence = str(record.seq).upper()
+        variants[number] = {
+            "gene_name": parts[0].strip(),
+            "species": parts[1].strip() if len(parts) > 1 else None,
+            "sequence": sequence,
+            "normalized_exon_coords": [[0, len(sequence)]],
+        }
+    return variants
+
+
+def extract(gene_ids, settings, batch_size):
+    # Yields (variant, data) gene after gene. Each batch is checkpointed, a killed run restarts where it stopped.
+    for start in range(0, len(gene_ids), batch_size):
+        batch = gene_ids[start:start + batch_size]
+        checkpoint = ExtractionCheckpoint.for_job(batch, species=settings["species"], seq_type=settings["seq_type"],
+                                                  upstream=settings["upstream"], downstream=settings["downstream"],
+                                                  genome_version=settings["genome_version"],
+                                                  all_slice_forms=bool(settings["all_slice_forms"]))
+        extracted = NCBIdna.find_sequences_batch(batch, settings["species"], settings["seq_type"], settings["upstream"],
+                                                 settings["downstream"], settings["genome_version"],
+                                                 settings["all_slice_forms"], checkpoint=checkpoint)
+        for gene_id, (all_variants, message) in extracted.items():
+            if "Error 200" in all_variants:
+                print(bcolors.WARNING + f"{gene_id}: {message}" + bcolors.ENDC, file=sys.stderr)
+                continue
+            for variant, data in all_variants.items():
+                yield variant, data
+        checkpoint.clear()
+
+
+def primer_rows(variant, data, primers):
+    # One row per primer pair, same columns as the page table
+    for idx, primer_set in enumerate(primers):
+        yield {
+            'Variant': str(variant),
+            'Gene': data['gene_name'],
+            'Species': data.get('species'),
+            'Pair': idx + 1,
+            'Product Size (bp)': primer_set['amplicon_size'],
+            'Product Tm (°C)': primer_set['amplicon_tm'],
+            "Product Seq. (5'->3')": primer_set['amplicon_seq'],
+            'Validated': primer_set['validation_relative'],
+            "For. Pr.(5'->3')": primer_set['left_primer']['sequence'],
+            'For. Len. (bp)': primer_set['left_primer']['length'],
+            'For. Pos.': primer_set['left_primer']['position'],
+            'For. Pos. Abs. (bp)': primer_set['left_primer']['position_abs'],
+            'For. Tm (°C)': primer_set['left_primer']['tm'],
+            'For. GC%': primer_set['left_primer']['gc_percent'],
+            'For. Self Compl.': primer_set['left_primer']['self_complementarity'],
+            "For. Self 3' Compl.": primer_set['left_primer']['self_3prime_complementarity'],
+            "Rev. Pr.(5'->3')": primer_set['right_primer']['sequence'],
+            'Rev. Len. (bp)': primer_set['right_primer']['length'],
+            'Rev. Pos.': primer_set['right_primer']['position'],
+            'Rev. Pos. Abs.': primer_set['right_primer']['position_abs'],
+            'Rev. Tm (°C)': primer_set['right_primer']['tm'],
+            'Rev. GC%': primer_set['right_primer']['gc_percent'],
+            'Rev. Self Compl.': primer_set['right_primer']['self_complementarity'],
+            "Rev. Self 3' Compl.": primer_set['right_primer']['self_3prime_complementarity'],
+            'Product Size Abs. (bp)': primer_set['amplicon_size_abs'],
+            'Validated Abs.': primer_set['validation_absolute'],
+            'validation_relative_sequences': primer_set['validation_relative_sequences'],
+        }
+
+
+def write_result(writer, variant, data, primers):
+    if not primers:
+        print(bcolors.WARNING + f"No primers were designed for {variant} {data['gene_name']}" + bcolors.ENDC,
+              file=sys.stderr)
+    for row in primer_rows(variant, data, primers):
+        writer.write(row)
+
+
+class ResultWriter:
+    # JSONL and CSV are written row by row (readable while the run goes on), Parquet once at the end
+    def __init__(self, path):
+        self.path = path
+        self.format = os.path.splitext(path)[1].lower().lstrip(".")
+        if self.format not in ("jsonl", "csv", "parquet"):
+            raise ValueError(f"Unsupported output {path}: use .jsonl, .csv or .parquet")
+        # pandas writes Parquet through pyarrow or fastparquet, neither is a requirement: say so before any work
+        engines = ("pyarrow", "fastparquet")
+        if self.format == "parquet" and not any(importlib.util.find_spec(engine) for engine in engines):
+            raise ValueError("Parquet output needs pyarrow or fastparquet (pip install pyarrow), or use .jsonl or .csv")
+        self.handle = None
+        self.writer = None
+        self.rows = []
+
+    def write(self, row):
+        if self.format == "jsonl":
+            if self.handle is None:
+                self.handle = open(self.path, "w")
+            self.handle.write(json.dumps(row, default=str) + "\n")
+            self.handle.flush()
+        elif self.format == "csv":
+            row = {key: json.dumps(value) if isinstance(value, (list, dict, tuple)) else value
+                   for key, value in row.items()}
+            if self.writer is None:
+                self.handle = open(self.path, "w", newline="")
+                self.writer = csv.DictWriter(self.handle, fieldnames=list(row))
+                self.writer.writeheader()
+            self.writer.writerow(row)
+            self.handle.flush()
+        else:
+            self.rows.append({key: json.dumps(value, default=str) if isinstance(value, (list, dict, tuple)) else value
+                              for key, value in row.items()})
+
+    def close(self):
+        if self.format == "parquet":
+            import pandas as pd
+            pd.DataFrame(self.rows).astype(str).to_parquet(self.path, index=False)
+        elif self.handle is not None:
+            self.handle.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LabMaster headless sequence extraction and primer design")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--genes", help="Gene names, Entrez IDs or NM_/XM_ accessions, one per line")
+    source.add_argument("--fasta", help='FASTA sequences, headers as ">GeneName | Species"')
+    parser.add_argument("--settings", help="JSON settings (species, seq_type, primer3 parameters...)")
+    parser.add_argument("--output", required=True, help="Result file: .jsonl, .csv or .parquet")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Primer design processes")
+    parser.add_argument("--batch-size", type=int, default=200, help="Genes per extraction batch")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.settings)
+    try:
+        check_primer3_settings(settings["primer3"])
+    except ValueError as e:
+        parser.error(str(e))
+    try:
+        writer = ResultWriter(args.output)
+    except ValueError as e:
+        parser.error(str(e))
+    if settings["api_key"]:
+        set_api_key(settings["api_key"])
+
+    if args.genes:
+        variants = extract(read_genes(args.genes), settings, args.batch_size)
+    else:
+        variants = iter(read_fasta(args.fasta).items())
+
+    designed = 0
+    try:
+        # Streamed: batch N+1 is extracted while the design processes work on batch N, rows come out in input order
+        for variant, data, primers in Primer3.design_variants(variants, settings["primer3"], workers=args.workers):
+            write_result(writer, variant, data, primers)
+            designed += 1
+    finally:
+        writer.close()
+
+    print(bcolors.OKGREEN + f"{designed} variant(s) designed, results in {args.output}" + bcolors.ENDC)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import mmap
+import os
+import threading
+
+
+def build_fai(path):
+    # Same layout as `samtools faidx`: name, length, offset, bases per line, bytes per line
+    entries = []
+    with open(path, "rb") as handle:
+        name = None
+        offset = length = line_bases = line_width = 0
+        position = 0
+        for line in handle:
+            if line.startswith(b">"):
+                if name is not None:
+                    entries.append((name, length, offset, line_bases, line_width))
+                name = line[1:].split()[0].decode("ascii")
+                offset = position + len(line)
+                length = line_bases = line_width = 0
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if line_bases == 0:
+                    line_bases, line_width = bases, len(line)
+                length += bases
+            position += len(line)
+        if name is not None:
+            entries.append((name, length, offset, line_bases, line_width))
+
+    with open(path + ".fai", "w") as fai:
+        for entry in entries:
+            fai.write("\t".join(str(value) for value in entry) + "\n")
+    return path + ".fai"
+
+
+class IndexedFasta:
+    def __init__(self, path, aliases=None):
+        self.path = path
+        if not os.path.exists(path + ".fai"):
+            build_fai(path)
+
+        self.index = {}
+        with open(path + ".fai") as fai:
+            for line in fai:
+                name, length, offset, line_bases, line_width = line.split("\t")[:5]
+                self.index[name] = (int(length), int(offset), int(line_bases), int(line_width))
+
+        # NCBI accessions (NC_000006.12) vs UCSC/Ensembl names (chr6, 6): "<fasta>.aliases" is "alias<TAB>name" per line
+        self.aliases = dict(aliases or {})
+        if os.path.exists(path + ".aliases"):
+            with open(path + ".aliases") as handle:
+                for line in handle:
+                    fields = line.strip().split("\t")
+                    if len(fields) >= 2 and not line.startswith("#"):
+                        self.aliases[fields[0]] = fields[1]
+
+        self.handle = open(path, "rb")
+        self.map = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def resolve(self, name):
+        if name in self.index:
+            return name
+        if name in self.aliases and self.aliases[name] in self.index:
+            return self.aliases[name]
+        return None
+
+    def __contains__(self, name):
+        return self.resolve(name) is not None
+
+    def byte_offset(self, entry, position):
+        length, offset, line_bases, line_width = entry
+        return offset + (position // line_bases) * line_width + position % line_bases
+
+    def fetch(self, name, start, end):
+        # 1-based, inclusive, like efetch from/to. Plus strand, uppercase (as NCBI returns it).
+        entry = self.index[self.resolve(name)]
+        start, end = min(start, end), max(start, end)
+        start = max(start, 1)
+        end = min(end, entry[0])
+        if end < start:
+            return ""
+        raw = self.map[self.byte_offset(entry, start - 1):self.byte_offset(entry, end - 1) + 1]
+        return raw.replace(b"\n", b"").replace(b"\r", b"").decode("ascii").upper()
+
+    def close(self):
+        self.map.close()
+        self.handle.close()
+
+
+class LocalGenomes:
+    # Every FASTA given here is tried before NCBI efetch (LABMASTER_GENOME_FASTA, paths separated by os.pathsep)
+    def __init__(self, paths=()):
+        self.sources = []
+        self.lock = threading.Lock()
+        for path in paths:
+            self.add(path)
+
+    @classmethod
+    def from_env(cls):
+        paths = os.environ.get("LABMASTER_GENOME_FASTA", "")
+        return cls([path for path in paths.split(os.pathsep) if path])
+
+    def add(self, path, aliases=None):
+        with self.lock:
+            self.sources.append(IndexedFasta(path, aliases))
+
+    def source_for(self, name):
+        for source in self.sources:
+            if name in source:
+                return source
+        return None
+
+    def fetch(self, name, start, end):
+        source = self.source_for(name)
+        if source is None:
+            return None
+        return source.fetch(name, start, end)
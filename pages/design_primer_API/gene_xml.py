@@ -0,0 +1,138 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import io
+import xml.etree.ElementTree as ET
+
+TRANSCRIPT_PREFIXES = ('XM_', 'NM_', 'XR_', 'NR_', 'YP_')
+SPECIAL_TYPES = ("tRNA", "rRNA", "d-segment")
+
+
+class GeneIndexer:
+    # State of one Entrezgene record while it streams by.
+    # Exon rules (same as the historical per-variant walk): nothing counts before the first NC_/NT_ accession;
+    # a transcript accession starts collecting its Seq-intervals, the chromosome accession pauses every transcript,
+    # any other accession closes the transcripts that already have exons.
+    def __init__(self):
+        self.entrez_id = None
+        self.species = None
+        self.tv = []
+        self.variants = []
+        self.special = False
+        self.chromosome = None
+        self.exons = {}
+        self.strands = {}
+        self.found = set()
+        self.collecting = set()
+        self.closed = set()
+        self.start = None
+
+    def accession(self, text):
+        if text.upper().startswith(TRANSCRIPT_PREFIXES) and text not in self.variants:
+            self.variants.append(text)
+
+        if self.chromosome is None:
+            if not text.startswith(("NC_", "NT_")):
+                return
+            self.chromosome = text
+
+        if text == self.chromosome:
+            self.found.clear()
+            return
+
+        for variant in [variant for variant in self.collecting if variant != text]:
+            self.collecting.discard(variant)
+            self.found.discard(variant)
+            self.closed.add(variant)
+
+        if text not in self.closed:
+            self.found.add(text)
+
+    def interval_to(self, end):
+        for variant in self.found:
+            self.exons.setdefault(variant, []).append((self.start, end))
+            self.collecting.add(variant)
+
+    def strand(self, value):
+        for variant in self.found:
+            if variant not in self.strands:
+                self.strands[variant] = value or ""
+
+    def result(self):
+        return {
+            'entrez_id': self.entrez_id,
+            'species': self.species,
+            'tv': self.tv,
+            'variants': self.variants,
+            'special': self.special,
+            'chromosome': self.chromosome or "",
+            'exons': {variant: {'exon_coords': coords, 'strand': self.strands.get(variant, "")}
+                      for variant, coords in self.exons.items()},
+        }
+
+
+def index_gene_records(xml_text):
+    # One iterparse pass over an efetch db=gene XML (one or many Entrezgene records).
+    # Elements are dropped as soon as they end, so memory stays at the depth of the tree.
+    source = io.BytesIO(xml_text.encode("utf-8") if isinstance(xml_text, str) else xml_text)
+    records = {}
+    stack = []
+    indexer = None
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == "Entrezgene":
+                indexer = GeneIndexer()
+            continue
+
+        stack.pop()
+        tag = elem.tag
+        text = elem.text
+
+        if indexer is not None:
+            if tag == "Gene-commentary_accession" and text:
+                indexer.accession(text)
+            elif tag == "Seq-interval_from" and indexer.found:
+                indexer.start = int(text)
+            elif tag == "Seq-interval_to" and indexer.found:
+                indexer.interval_to(int(text))
+            elif tag == "Na-strand" and indexer.found:
+                indexer.strand(elem.attrib.get("value"))
+            elif tag == "Gene-commentary_label" and text and text.startswith('transcript variant'):
+                if text not in indexer.tv:
+                    indexer.tv.append(text)
+            elif tag == "Gene-commentary_type" and elem.attrib.get("value") in SPECIAL_TYPES:
+                indexer.special = True
+            elif tag == "Org-ref_taxname" and indexer.species is None:
+                indexer.species = text
+            elif tag == "Gene-track_geneid" and indexer.entrez_id is None:
+                indexer.entrez_id = text
+            elif tag == "Entrezgene":
+                records[indexer.entrez_id] = indexer.result()
+                indexer = None
+
+        # The element just ended is always the last child of its parent
+        elem.clear()
+        if stack:
+            del stack[-1][-1]
+
+    return records
@@ -0,0 +1,141 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from . import bcolors
+
+
+class Job:
+    # One background extraction or design. The worker fills it, the page reads snapshot() on every rerun.
+    # update()/set_description() follow tqdm, so a job can be passed as Primer3.design_primers(progress_bar=...)
+    def __init__(self, kind):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.done = 0
+        self.total = 0
+        self.message = ""
+        self.results = {}
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.lock = threading.Lock()
+        self.cancel_event = threading.Event()
+
+    def progress(self, done, total=None, message=None):
+        with self.lock:
+            self.done = done
+            if total is not None:
+                self.total = total
+            if message is not None:
+                self.message = message
+
+    def update(self, n=1):
+        with self.lock:
+            self.done += n
+
+    def set_description(self, message):
+        with self.lock:
+            self.message = message
+
+    def add_result(self, key, value):
+        # Partial results, in the order the worker produced them
+        with self.lock:
+            self.results[key] = value
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def is_finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "job_id": self.job_id,
+                "kind": self.kind,
+                "status": self.status,
+                "done": self.done,
+                "total": self.total,
+                "message": self.message,
+                "results": dict(self.results),
+                "error": self.error,
+            }
+
+
+class JobRunner:
+    # Registry shared by every session of the server (kept in st.cache_resource by the pages): a rerun, a widget
+    # change or a closed tab no longer kills the work, the session only keeps the job_id and polls it
+    def __init__(self, max_workers=4, keep=3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="labmaster-job")
+        self.keep = keep
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, kind, function, *args, **kwargs):
+        # function(job, *args, **kwargs) reports through job.progress()/job.add_result(), its return value is ignored
+        self.prune()
+        job = Job(kind)
+        with self.lock:
+            self.jobs[job.job_id] = job
+        self.executor.submit(self.run, job, function, args, kwargs)
+        return job.job_id
+
+    def run(self, job, function, args, kwargs):
+        job.status = "running"
+        try:
+            function(job, *args, **kwargs)
+            job.status = "cancelled" if job.cancelled() else "done"
+        except Exception as e:
+            if job.cancelled():
+                # A worker may stop by raising from its progress callback once cancelled
+                job.status = "cancelled"
+            else:
+                print(bcolors.FAIL + f"Job {job.kind} {job.job_id} failed: {e}" + bcolors.ENDC)
+                traceback.print_exc()
+                job.error = str(e)
+                job.status = "failed"
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        # Cooperative: the worker checks job.cancelled() between genes/variants
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel_event.set()
+
+    def prune(self):
+        # Finished jobs nobody came back for are dropped after `keep` seconds
+        limit = time.time() - self.keep
+        with self.lock:
+            for job_id in [job_id for job_id, job in self.jobs.items()
+                           if job.finished is not None and job.finished < limit]:
+                del self.jobs[job_id]
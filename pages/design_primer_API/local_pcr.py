@@ -0,0 +1,281 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Offline in-silico PCR: the same answer as UCSC hgPcr / primer-BLAST from a local transcriptome or genome FASTA.
+# Build the index once per FASTA:
+#
+#   python -m pages.design_primer_API.local_pcr refseq_rna.fa hs_transcripts.pcr --species "Homo sapiens" --target transcriptome
+#   python -m pages.design_primer_API.local_pcr GRCh38.fa hs_genome.pcr --species "Homo sapiens" --target genome
+#
+# then point LABMASTER_PCR_INDEX at the index directories (separated by os.pathsep).
+
+
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from utils import sequence_ops
+
+from .annotation import open_text
+
+# Exact 3' seed length: 4^12 buckets, one int64 offset each (128 MB), primer 3' ends must match on 12 bases
+SEED = 12
+# Seed positions computed per chunk while building, bounds the memory of the build
+CHUNK = 1 << 24
+
+CODES = np.full(256, 255, dtype=np.uint8)
+for code, base in enumerate(b"ACGT"):
+    CODES[base] = code
+    CODES[base + 32] = code
+
+
+def seed_codes(bases, k=SEED):
+    # Code of the k-mer starting at every position, -1 where it contains anything else than ACGT
+    values = CODES[bases]
+    count = len(values) - k + 1
+    if count <= 0:
+        return np.zeros(0, dtype=np.int64)
+    codes = np.zeros(count, dtype=np.int64)
+    for j in range(k):
+        codes = codes * 4 + (values[j:j + count] & 3)
+    invalid = np.concatenate(([0], np.cumsum(values == 255)))
+    codes[invalid[k:k + count] - invalid[:count] > 0] = -1
+    return codes
+
+
+def read_fasta(path):
+    name, chunks = None, []
+    with open_text(path) as handle:
+        for line in handle:
+            if line.startswith(">"):
+                if name is not None:
+                    yield name, "".join(chunks)
+                name, chunks = line[1:].split()[0], []
+            elif name is not None:
+                chunks.append(line.strip())
+    if name is not None:
+        yield name, "".join(chunks)
+
+
+def build_index(fasta_path, index_path, species=None, target="transcriptome", k=SEED):
+    os.makedirs(index_path, exist_ok=True)
+
+    # All records in one uppercase byte array, an N between two records so no seed spans them
+    names, starts, parts, total = [], [], [], 0
+    for name, sequence in read_fasta(fasta_path):
+        names.append(name)
+        starts.append(total)
+        parts.append(sequence_ops.to_upper(sequence).encode("ascii"))
+        parts.append(b"N")
+        total += len(sequence) + 1
+    bases = np.frombuffer(b"".join(parts), dtype=np.uint8)
+    del parts
+    np.save(os.path.join(index_path, "sequence.npy"), bases)
+
+    # Counting sort of the seed positions: bucket sizes first, then each chunk scattered into its buckets in order
+    counts = np.zeros(4 ** k, dtype=np.int64)
+    for start in range(0, len(bases), CHUNK):
+        codes = seed_codes(bases[start:start + CHUNK + k - 1], k)
+        counts += np.bincount(codes[codes >= 0], minlength=4 ** k)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    position_type = np.uint32 if len(bases) < 2 ** 32 else np.uint64
+    positions = np.lib.format.open_memmap(os.path.join(index_path, "positions.npy"), mode="w+", dtype=position_type,
+                                          shape=(int(offsets[-1]),))
+    cursor = offsets[:-1].copy()
+    for start in range(0, len(bases), CHUNK):
+        codes = seed_codes(bases[start:start + CHUNK + k - 1], k)
+        valid = np.flatnonzero(codes >= 0)
+        order = valid[np.argsort(codes[valid], kind="stable")]
+        sorted_codes = codes[order]
+        group_start = np.concatenate(([0], np.flatnonzero(np.diff(sorted_codes)) + 1))
+        rank = np.arange(len(order)) - np.repeat(group_start, np.diff(np.append(group_start, len(order))))
+        positions[cursor[sorted_codes] + rank] = order + start
+        unique_codes, unique_counts = np.unique(sorted_codes, return_counts=True)
+        cursor[unique_codes] += unique_counts
+    positions.flush()
+    np.save(os.path.join(index_path, "offsets.npy"), offsets)
+
+    with open(os.path.join(index_path, "meta.json"), "w") as handle:
+        json.dump({"species": species, "target": target, "k": k, "names": names, "starts": starts}, handle)
+    return index_path
+
+
+class PcrIndex:
+    # Read through memory maps: opening a genome index costs nothing, pages are loaded as primers hit them
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as handle:
+            meta = json.load(handle)
+        self.species = meta["species"]
+        self.target = meta["target"]
+        self.k = meta["k"]
+        self.names = meta["names"]
+        self.starts = np.array(meta["starts"], dtype=np.int64)
+        self.sequence = np.load(os.path.join(path, "sequence.npy"), mmap_mode="r")
+        self.positions = np.load(os.path.join(path, "positions.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.codes = None
+
+    @classmethod
+    def from_sequences(cls, sequences, species=None, target="transcriptome", k=SEED):
+        # In-memory index over {name: sequence}, e.g. the variants loaded in the page. Sorted seed codes are
+        # binary searched instead of the 4^k offsets table, which would outweigh a few transcripts by far.
+        index = cls.__new__(cls)
+        index.path, index.species, index.target, index.k = None, species, target, k
+        index.names = [str(name) for name in sequences]
+        parts = [sequence_ops.to_upper(str(sequence)).encode("ascii") + b"N" for sequence in sequences.values()]
+        index.starts = np.concatenate(([0], np.cumsum([len(part) for part in parts])[:-1])).astype(np.int64)
+        index.sequence = np.frombuffer(b"".join(parts), dtype=np.uint8)
+        codes = seed_codes(index.sequence, k)
+        valid = np.flatnonzero(codes >= 0)
+        order = valid[np.argsort(codes[valid], kind="stable")]
+        index.positions, index.codes, index.offsets = order, codes[order], None
+        return index
+
+    def record_of(self, positions):
+        return np.searchsorted(self.starts, positions, side="right") - 1
+
+    def seed_hits(self, seed):
+        codes = seed_codes(np.frombuffer(seed.encode("ascii"), dtype=np.uint8), self.k)
+        if len(codes) != 1 or codes[0] < 0:
+            return np.zeros(0, dtype=np.int64)
+        if self.offsets is None:
+            first, last = np.searchsorted(self.codes, [codes[0], codes[0] + 1])
+        else:
+            first, last = self.offsets[codes[0]], self.offsets[codes[0] + 1]
+        return np.asarray(self.positions[first:last], dtype=np.int64)
+
+    def mismatches(self, starts, bases):
+        if len(bases) == 0 or len(starts) == 0:
+            return np.zeros(len(starts), dtype=np.int64)
+        window = self.sequence[starts[:, None] + np.arange(len(bases))]
+        return (window != np.frombuffer(bases.encode("ascii"), dtype=np.uint8)).sum(axis=1)
+
+    def forward_sites(self, primer, max_mismatches):
+        # Plus-strand starts where the primer reads as written: last k bases exact, the 5' part within max_mismatches
+        if len(primer) < self.k:
+            return np.zeros(0, dtype=np.int64)
+        hits = self.seed_hits(primer[-self.k:])
+        starts = hits - (len(primer) - self.k)
+        keep = (starts >= 0) & (self.record_of(np.maximum(starts, 0)) == self.record_of(hits))
+        starts = starts[keep]
+        return starts[self.mismatches(starts, primer[:-self.k]) <= max_mismatches]
+
+    def reverse_sites(self, primer, max_mismatches):
+        # Plus-strand ends (exclusive) where the reverse complement of the primer reads, 3' end exact again
+        if len(primer) < self.k:
+            return np.zeros(0, dtype=np.int64)
+        target = sequence_ops.reverse_complement(primer, upper=True)
+        starts = self.seed_hits(target[:self.k])
+        ends = starts + len(primer)
+        keep = (ends <= len(self.sequence)) & (self.record_of(np.minimum(ends - 1, len(self.sequence) - 1))
+                                                == self.record_of(starts))
+        starts, ends = starts[keep], ends[keep]
+        return ends[self.mismatches(starts + self.k, target[self.k:]) <= max_mismatches]
+
+    def pcr(self, primer_fwd, primer_rev, max_size, max_mismatches=2):
+        # Every product, whatever primer primes which strand (fwd/rev, fwd/fwd, rev/rev), like hgPcr.
+        # Records follow the hgPcr output parsed by Primer3.fetch_ucsc_pcr_results: name, size, sequence.
+        primer_fwd, primer_rev = primer_fwd.upper(), primer_rev.upper()
+        lefts = np.unique(np.concatenate([self.forward_sites(primer, max_mismatches)
+                                          for primer in (primer_fwd, primer_rev)]))
+        rights = np.unique(np.concatenate([self.reverse_sites(primer, max_mismatches)
+                                           for primer in (primer_fwd, primer_rev)]))
+
+        products = []
+        for start in lefts:
+            record = self.record_of(start)
+            record_end = self.starts[record + 1] if record + 1 < len(self.starts) else len(self.sequence)
+            first = np.searchsorted(rights, start + 1, side="left")
+            last = np.searchsorted(rights, min(start + max_size, record_end), side="right")
+            for end in rights[first:last]:
+                products.append({
+                    "name": f"{self.names[record]}:{start - self.starts[record] + 1}+{end - self.starts[record]}",
+                    "size": int(end - start),
+                    "sequence": self.sequence[start:end].tobytes().decode("ascii"),
+                })
+        return products
+
+
+def amplification_matrix(index, pairs, max_size, max_mismatches=2):
+    # {pair label: {record name: [product sizes]}} for every (label, forward, reverse), records without product left out
+    matrix = {}
+    for label, primer_fwd, primer_rev in pairs:
+        row = {}
+        for product in index.pcr(primer_fwd, primer_rev, max_size, max_mismatches):
+            row.setdefault(product["name"].rsplit(":", 1)[0], []).append(product["size"])
+        matrix[label] = row
+    return matrix
+
+
+class LocalPcr:
+    # Every index given here answers before UCSC/NCBI (LABMASTER_PCR_INDEX, paths separated by os.pathsep)
+    def __init__(self, paths=()):
+        self.indexes = []
+        self.lock = threading.Lock()
+        for path in paths:
+            self.add(path)
+
+    @classmethod
+    def from_env(cls):
+        paths = os.environ.get("LABMASTER_PCR_INDEX", "")
+        return cls([path for path in paths.split(os.pathsep) if path])
+
+    def add(self, path):
+        with self.lock:
+            self.indexes.append(PcrIndex(path))
+
+    def index_for(self, species, target):
+        # An index built without --species answers for any species
+        for index in self.indexes:
+            if index.target == target and index.species in (species, None):
+                return index
+        return None
+
+    def targets(self, species):
+        # wp_target names fetch_ucsc_pcr_results can answer locally, in the UCSC order (genome first)
+        targets = {index.target for index in self.indexes if index.species in (species, None)}
+        return [target for target in ("genome", "transcriptome") if target in targets]
+
+    def validate(self, primer_fwd, primer_rev, species, target, max_size, max_mismatches=2):
+        # (validation, products) as fetch_ucsc_pcr_results reports them, None when no local index covers the target
+        index = self.index_for(species, target)
+        if index is None:
+            return None
+        products = index.pcr(primer_fwd, primer_rev, max_size, max_mismatches)
+        sizes = [product["size"] for product in products]
+        if not sizes:
+            return "Not found", []
+        return all(size == sizes[0] for size in sizes), products
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index a transcriptome or genome FASTA for offline in-silico PCR")
+    parser.add_argument("fasta", help="FASTA file (.gz allowed)")
+    parser.add_argument("index", help="Index directory to create")
+    parser.add_argument("--species", default=None, help='Scientific name, e.g. "Homo sapiens"')
+    parser.add_argument("--target", choices=["transcriptome", "genome"], default="transcriptome",
+                        help="transcriptome answers the qPCR check, genome the genomic one")
+    args = parser.parse_args()
+    print(f"In-silico PCR index written to {build_index(args.fasta, args.index, args.species, args.target)}")
@@ -0,0 +1,238 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import AccessionCache, ResponseCache, cache_key, cacheable
+from .rate_limit import NCBI_RATE, NCBI_RATE_WITH_KEY, UCSC_RATE, TokenBucket
+from .retry import RETRY_STATUSES, RetryPolicy, circuit_breaker
+
+headers = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+NCBI_HOSTS = ("eutils.ncbi.nlm.nih.gov", "www.ncbi.nlm.nih.gov")
+UCSC_HOST = "genome.ucsc.edu"
+
+# One cache per process, shared by every NCBIdna call (LABMASTER_HTTP_CACHE=0 to disable)
+response_cache = ResponseCache(enabled=os.environ.get("LABMASTER_HTTP_CACHE", "1") != "0")
+accession_cache = AccessionCache(enabled=os.environ.get("LABMASTER_HTTP_CACHE", "1") != "0")
+
+ncbi_api_key = os.environ.get("NCBI_API_KEY") or None
+ncbi_rate_limiter = TokenBucket(NCBI_RATE_WITH_KEY if ncbi_api_key else NCBI_RATE)
+# hgPcr answers in seconds: a rate and a number of requests in flight, whatever the number of validators
+ucsc_rate_limiter = TokenBucket(float(os.environ.get("LABMASTER_UCSC_RATE", UCSC_RATE)))
+ucsc_slots = threading.BoundedSemaphore(int(os.environ.get("LABMASTER_UCSC_CONCURRENCY", 2)))
+
+rate_limiters = {host: ncbi_rate_limiter for host in NCBI_HOSTS}
+rate_limiters[UCSC_HOST] = ucsc_rate_limiter
+host_slots = {UCSC_HOST: ucsc_slots}
+
+# Bounded: one gene can never hold a worker for more than a few seconds per request
+default_retry_policy = RetryPolicy()
+
+# Workers only wait on the network, the token bucket keeps them under the NCBI ceiling
+fetch_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("LABMASTER_FETCH_WORKERS", 10)),
+                                    thread_name_prefix="labmaster-fetch")
+
+# In-silico PCR checks of designed primers (UCSC hgPcr, primer-BLAST), apart from fetch_executor: a validation
+# never waits behind a sequence download and the other way round
+VALIDATION_WORKERS = int(os.environ.get("LABMASTER_VALIDATION_WORKERS", 4))
+validation_executor = ThreadPoolExecutor(max_workers=VALIDATION_WORKERS, thread_name_prefix="labmaster-validation")
+
+
+# Keep-alive connection pools, one session per host, shared by NCBIdna and Primer3 (and every Streamlit session)
+POOL_MAXSIZE = int(os.environ.get("LABMASTER_FETCH_WORKERS", 10)) + 2
+REQUEST_TIMEOUT = (10, 120)
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(host):
+    host = host.lower()
+    with sessions_lock:
+        if host not in sessions:
+            session = requests.Session()
+            session.headers.update(headers)
+            session.headers.update({'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'})
+            # Retries are done by http_get (backoff, Retry-After, circuit breaker), not by urllib3
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            sessions[host] = session
+        return sessions[host]
+
+
+def set_api_key(api_key):
+    global ncbi_api_key
+    ncbi_api_key = api_key or None
+    ncbi_rate_limiter.set_rate(NCBI_RATE_WITH_KEY if ncbi_api_key else NCBI_RATE)
+
+
+def parallel_map(function, items):
+    return list(fetch_executor.map(function, items))
+
+
+class ErrorResponse:
+    # What http_get hands back when a host could not be reached at all, so callers keep a single status_code check
+    from_cache = False
+    headers = {}
+
+    def __init__(self, url, status_code, text):
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return {}
+
+
+class SingleFlight:
+    # Identical calls running at the same time (two sessions extracting PRKN) share one execution and its result
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.joined = 0
+
+    def do(self, key, function, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Future()
+            else:
+                self.joined += 1
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = function(*args, **kwargs)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.calls)
+
+
+request_coalescer = SingleFlight()
+
+
+def http_get(url, params=None, use_cache=True, retry_policy=None):
+    # api_key/tool/email do not split the key (cache_key), so every session joins the same request.
+    # use_cache=False calls are never shared: a primer-BLAST submission or an hgPcr query is asked by each caller.
+    if not use_cache:
+        return send_request(url, params, use_cache, retry_policy)
+    return request_coalescer.do(cache_key(url, params), send_request, url, params, use_cache, retry_policy)
+
+
+def send_request(url, params=None, use_cache=True, retry_policy=None):
+    if use_cache:
+        cached = response_cache.get(url, params)
+        if cached is not None:
+            return cached
+
+    retry_policy = retry_policy if retry_policy is not None else default_retry_policy
+    host = urlsplit(url).netloc.lower()
+    breaker = circuit_breaker(host)
+    rate_limiter = rate_limiters.get(host)
+    slots = host_slots.get(host) or nullcontext()
+    request_params = params
+    if ncbi_api_key and host == "eutils.ncbi.nlm.nih.gov":
+        request_params = dict(params or {}, api_key=ncbi_api_key)
+
+    response = None
+    for attempt in range(retry_policy.max_attempts):
+        if not breaker.allow():
+            response = ErrorResponse(url, 503, f"{host} is failing, requests are suspended for a while")
+            break
+
+        retry_after = None
+        try:
+            with slots:
+                if rate_limiter is not None:
+                    rate_limiter.acquire()
+                response = get_session(host).get(url, params=request_params, timeout=REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            breaker.record_failure()
+            response = ErrorResponse(url, 503, str(e))
+        else:
+            response.from_cache = False
+            if response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                break
+            if response.status_code == 429:
+                # Rate limited means the host is up: it must not open the breaker
+                breaker.record_success()
+                retry_after = RetryPolicy.parse_retry_after(response.headers.get("Retry-After"))
+                if rate_limiter is not None:
+                    rate_limiter.drain()
+            else:
+                breaker.record_failure()
+
+        if attempt + 1 < retry_policy.max_attempts:
+            time.sleep(retry_policy.delay(attempt, retry_after))
+
+    if response.status_code == 200:
+        if use_cache and cacheable(url, params, response.text):
+            response_cache.set(url, params, response.text)
+    elif use_cache:
+        # Offline or NCBI unreachable: an expired answer is better than no answer
+        stale = response_cache.get(url, params, allow_stale=True)
+        if stale is not None:
+            return stale
+    return response
+
+
+class SharedBudget:
+    # What every Streamlit session of this server shares: one NCBI rate budget, fetch pool, cache and coalescer
+    def __init__(self):
+        self.rate_limiter = ncbi_rate_limiter
+        self.executor = fetch_executor
+        self.cache = response_cache
+        self.coalescer = request_coalescer
+
+    def http_get(self, url, params=None, use_cache=True, retry_policy=None):
+        return http_get(url, params, use_cache, retry_policy)
+
+    def stats(self):
+        return {
+            "rate": self.rate_limiter.rate,
+            "in_flight": self.coalescer.in_flight(),
+            "joined": self.coalescer.joined,
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,99 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from . import NCBIdna
+from .checkpoint import ExtractionCheckpoint
+
+TRANSCRIPT_PREFIXES = ('XM_', 'NM_', 'XR_', 'NR_', 'YP_')
+
+
+class ExtractionPlanner:
+    # Advance tab: gene x species checkboxes -> one find_sequences_batch call per (species, seq_type, window)
+
+    @staticmethod
+    def is_gene_id(gene_id):
+        # Entrez IDs and transcript accessions do not depend on the species column
+        return gene_id.isdigit() or gene_id.upper().startswith(TRANSCRIPT_PREFIXES)
+
+    @staticmethod
+    def job_key(gene_id, species, seq_type, window):
+        gene_id = gene_id.strip().upper()
+        if gene_id.startswith(TRANSCRIPT_PREFIXES):
+            gene_id = gene_id.split('.')[0]
+        return gene_id, species, seq_type, window
+
+    @staticmethod
+    def plan(rows, species_list, seq_type="rna", upstream=0, downstream=0):
+        # rows: dicts (or namedtuples turned into dicts) with a "Gene" column and one boolean column per species.
+        # Returns {(species, seq_type, window): [gene_id, ...]}, each distinct job once, first spelling kept.
+        window = (upstream, downstream) if seq_type in ['promoter', 'terminator'] else (0, 0)
+        jobs = {}
+        for row in rows:
+            gene_id = str(row["Gene"]).strip()
+            if not gene_id:
+                continue
+
+            checked = [species for species in species_list if row.get(species)]
+            if ExtractionPlanner.is_gene_id(gene_id):
+                wanted = [None] if checked else []
+            else:
+                wanted = checked
+
+            for species in wanted:
+                key = ExtractionPlanner.job_key(gene_id, species, seq_type, window)
+                if key not in jobs:
+                    jobs[key] = gene_id
+
+        groups = {}
+        for (_, species, seq_type, window), gene_id in jobs.items():
+            groups.setdefault((species, seq_type, window), []).append(gene_id)
+        return groups
+
+    @staticmethod
+    def job_count(groups):
+        return sum(len(gene_ids) for gene_ids in groups.values())
+
+    @staticmethod
+    def run(groups, genome_version="current", all_slice_forms=None, progress=None, resume=False):
+        # Yields (gene_id, species, all_variants, message) group after group, in plan order.
+        # resume: each group is checkpointed (checkpoint.ExtractionCheckpoint), an interrupted run only extracts the
+        # genes that did not come back yet. A group's checkpoint is cleared once all its results are handed over.
+        total = ExtractionPlanner.job_count(groups)
+        offset = 0
+        for (species, seq_type, (upstream, downstream)), gene_ids in groups.items():
+            def group_progress(done, group_total, gene_id, offset=offset, species=species):
+                if progress is not None:
+                    progress(offset + done, total, gene_id, species)
+
+            checkpoint = None
+            if resume:
+                checkpoint = ExtractionCheckpoint.for_job(gene_ids, species=species, seq_type=seq_type,
+                                                          upstream=upstream, downstream=downstream,
+                                                          genome_version=genome_version,
+                                                          all_slice_forms=bool(all_slice_forms))
+            extracted = NCBIdna.find_sequences_batch(gene_ids, species, seq_type, upstream, downstream,
+                                                     genome_version, all_slice_forms, progress=group_progress,
+                                                     checkpoint=checkpoint)
+            for gene_id, (all_variants, message) in extracted.items():
+                yield gene_id, species, all_variants, message
+            if checkpoint is not None:
+                checkpoint.clear()
+            offset += len(gene_ids)
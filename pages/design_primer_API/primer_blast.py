@@ -0,0 +1,231 @@
+# Copyright (c) 2023 Minniti Julien
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files, to deal in the software
+# without restriction, including without limitation the rights to use, copy,
+# modify, merge, publish, distribute, sublicense, and/or sell copies of the
+# software, and to permit persons to whom the software is furnished to do so,
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+import html
+import re
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import parse_qsl
+
+from .network import fetch_executor, http_get
+
+PRIMER_BLAST_URL = "https://www.ncbi.nlm.nih.gov/tools/primer-blast/primertool.cgi"
+
+# Specific-primers check against refseq_mrna, same settings as the primer-BLAST web form
+PRIMER_BLAST_PARAMS = dict(parse_qsl(
+    "CMD=request&CON_ANEAL_OLIGO=50.0&CON_DNTPS=0.6&DIVA_CATIONS=1.5&EVALUE=30000"
+    "&GC_CLAMP=0&HITSIZE=50000&LOW_COMPLEXITY_FILTER=on&MAX_CANDIDATE_PRIMER=500"
+    "&MAX_INTRON_SIZE=1000000&MAX_TARGET_PER_TEMPLATE=100&MAX_TARGET_SIZE=4000"
+    "&MIN_INTRON_SIZE=1000&MISMATCH_REGION_LENGTH=5&MONO_CATIONS=50.0"
+    "&OVERLAP_3END=4&OVERLAP_5END=7&POLYX=5"
+    "&PRIMER_3END_SPECIFICITY_MISMATCH=1&PRIMER_INTERNAL_OLIGO_MAX_GC=80.0"
+    "&PRIMER_INTERNAL_OLIGO_MAX_SIZE=27&PRIMER_INTERNAL_OLIGO_MAX_TM=63.0"
+    "&PRIMER_INTERNAL_OLIGO_MIN_GC=20.0&PRIMER_INTERNAL_OLIGO_MIN_SIZE=18"
+    "&PRIMER_INTERNAL_OLIGO_MIN_TM=57.0&PRIMER_INTERNAL_OLIGO_OPT_GC_PERCENT=50"
+    "&PRIMER_INTERNAL_OLIGO_OPT_SIZE=20&PRIMER_INTERNAL_OLIGO_OPT_TM=60.0"
+    "&PRIMER_MAX_DIFF_TM=3&PRIMER_MAX_END_GC=5"
+    "&PRIMER_MAX_END_STABILITY=9&PRIMER_MAX_GC=80.0&PRIMER_MAX_HAIRPIN_TH=24.0"
+    "&PRIMER_MAX_SELF_ANY_TH=45.0&PRIMER_MAX_SELF_END_TH=35.0"
+    "&PRIMER_MAX_SIZE=25&PRIMER_MAX_TEMPLATE_MISPRIMING=12.00"
+    "&PRIMER_MAX_TEMPLATE_MISPRIMING_TH=40.00&PRIMER_MAX_TM=63.0"
+    "&PRIMER_MIN_GC=20.0&PRIMER_MIN_SIZE=15&PRIMER_MIN_TM=57.0"
+    "&PRIMER_MISPRIMING_LIBRARY=AUTO&PRIMER_NUM_RETURN=10&PRIMER_ON_SPLICE_SITE=0"
+    "&PRIMER_OPT_SIZE=20&PRIMER_OPT_TM=60.0&PRIMER_PAIR_MAX_COMPL_ANY=8.00"
+    "&PRIMER_PAIR_MAX_COMPL_ANY_TH=45.0&PRIMER_PAIR_MAX_COMPL_END=3.00"
+    "&PRIMER_PAIR_MAX_COMPL_END_TH=35.0&PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING=24.00"
+    "&PRIMER_PAIR_MAX_TEMPLATE_MISPRIMING_TH=70.00&PRIMER_PRODUCT_MAX=1000"
+    "&PRIMER_PRODUCT_MIN=70"
+    "&PRIMER_SPECIFICITY_DATABASE=refseq_mrna"
+    "&SALT_FORMULAR=1&SEARCH_SPECIFIC_PRIMER=on&SEARCHMODE=0&SELF_ANY=8.00"
+    "&SELF_END=3.00&SHOW_SVIEWER=on&SPLICE_SITE_OVERLAP_3END=4"
+    "&SPLICE_SITE_OVERLAP_3END_MAX=8&SPLICE_SITE_OVERLAP_5END=7&TM_METHOD=1"
+    "&TOTAL_MISMATCH_IGNORE=6&TOTAL_PRIMER_SPECIFICITY_MISMATCH=1&UNGAPPED_BLAST=on"
+    "&USER_TYPE=2&WORD_SIZE=7"))
+
+# Only the fragments we need, no full-page parse on every poll
+JOB_KEY_INPUT = re.compile(r'<input[^>]*name="job_key"[^>]*value="([^"]+)"|<input[^>]*value="([^"]+)"[^>]*name="job_key"')
+JOB_KEY_LINK = re.compile(r"job_key=([A-Za-z0-9_-]+)")
+RESULTS_READY = re.compile(r'<a[^>]*name="0"')
+FORWARD_HEADER = re.compile(r"<th[^>]*>\s*Forward primer\s*</th>")
+REVERSE_HEADER = re.compile(r"<th[^>]*>\s*Reverse primer\s*</th>")
+NO_RESULTS = re.compile(r"No target templates were found|No primers? (?:pairs? )?(?:were )?found", re.IGNORECASE)
+ENTRY = re.compile(r'<a[^>]*href="[^"]*viewer\.fcgi\?db=nucleotide[^"]*"[^>]*>(.*?)</a>([^<]*).*?<pre[^>]*>(.*?)</pre>',
+                   re.DOTALL)
+TAG = re.compile(r"<[^>]+>")
+
+
+class PrimerBlastError(Exception):
+    # Submission refused, no job key, timeout: the caller reports it for this pair and goes on
+    pass
+
+
+class PrimerBlastJobs:
+    # Every primer-BLAST job of the process goes through one poller: submit() returns at once with a Future, the
+    # poller checks all running jobs together, each one first after min_delay then less and less often (x backoff,
+    # up to max_delay). Dozens of pairs take about the time of the slowest job instead of the sum.
+    def __init__(self, min_delay=5, max_delay=30, backoff=1.5, timeout=600):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.timeout = timeout
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.poller = None
+
+    @staticmethod
+    def request(species, primer_fwd, primer_rev):
+        params = dict(PRIMER_BLAST_PARAMS, PRIMER_LEFT_INPUT=primer_fwd, PRIMER_RIGHT_INPUT=primer_rev)
+        if species:
+            params["ORGANISM"] = species
+
+        response = http_get(PRIMER_BLAST_URL, params=params, use_cache=False)
+        if response.status_code != 200:
+            raise PrimerBlastError(f"primer-BLAST submission failed: {response.status_code}")
+
+        match = JOB_KEY_INPUT.search(response.text)
+        if match:
+            return match.group(1) or match.group(2)
+        match = JOB_KEY_LINK.search(response.text)
+        if match:
+            return match.group(1)
+        raise PrimerBlastError("primer-BLAST did not return a job key")
+
+    def submit(self, species, primer_fwd, primer_rev):
+        future = Future()
+        try:
+            job_key = self.request(species, primer_fwd, primer_rev)
+        except Exception as e:
+            future.set_exception(e if isinstance(e, PrimerBlastError) else PrimerBlastError(str(e)))
+            return future
+
+        now = time.time()
+        with self.lock:
+            if job_key in self.jobs:
+                # Same pair asked twice at once (variants sharing exons, duplicate rows): one job, every caller answered
+                self.jobs[job_key]["futures"].append(future)
+                return future
+            self.jobs[job_key] = {"futures": [future], "submitted": now, "next_poll": now + self.min_delay,
+                                  "delay": self.min_delay}
+            if self.poller is None or not self.poller.is_alive():
+                self.poller = threading.Thread(target=self.poll_loop, name="labmaster-primer-blast", daemon=True)
+                self.poller.start()
+        self.wake.set()
+        return future
+
+    def run(self, species, primer_fwd, primer_rev):
+        return self.submit(species, primer_fwd, primer_rev).result()
+
+    def poll_loop(self):
+        while True:
+            # Cleared before the job table is read: a job submitted from here on sets it again and cuts the wait short
+            self.wake.clear()
+            with self.lock:
+                if not self.jobs:
+                    self.poller = None
+                    return
+                now = time.time()
+                due = [job_key for job_key, job in self.jobs.items() if job["next_poll"] <= now]
+                next_poll = min(job["next_poll"] for job in self.jobs.values())
+
+            if not due:
+                self.wake.wait(max(0.0, next_poll - time.time()))
+                continue
+
+            for job_key, outcome in zip(due, fetch_executor.map(self.poll, due)):
+                with self.lock:
+                    job = self.jobs[job_key]
+                    if outcome is None and time.time() - job["submitted"] > self.timeout:
+                        outcome = PrimerBlastError(f"primer-BLAST job {job_key} timed out")
+                    if outcome is None:
+                        job["delay"] = min(job["delay"] * self.backoff, self.max_delay)
+                        job["next_poll"] = time.time() + job["delay"]
+                        continue
+                    del self.jobs[job_key]
+                for future in job["futures"]:
+                    if isinstance(outcome, Exception):
+                        future.set_exception(outcome)
+                    else:
+                        future.set_result(outcome)
+
+    @staticmethod
+    def poll(job_key):
+        # None while the job runs (or NCBI did not answer this time), the parsed products when it is done
+        try:
+            response = http_get(PRIMER_BLAST_URL, params={"job_key": job_key, "CMD": "get"}, use_cache=False)
+            if response.status_code != 200:
+                return None
+
+            text = response.text
+            if RESULTS_READY.search(text) and FORWARD_HEADER.search(text) and REVERSE_HEADER.search(text):
+                return PrimerBlastJobs.parse_results(text)
+            if NO_RESULTS.search(text):
+                return []
+            return None
+        except Exception as e:
+            return PrimerBlastError(f"primer-BLAST job {job_key}: {e}")
+
+    @staticmethod
+    def parse_results(text):
+        results = []
+        for name, info, pre_block in ENTRY.findall(text):
+            pre_block = html.unescape(TAG.sub("", pre_block)).strip()
+
+            product_length_match = re.search(r"product length = (\d+)", pre_block)
+            product_length = int(product_length_match.group(1)) if product_length_match else None
+
+            forward_primer, forward_start, forward_template, forward_end = "N/A", "N/A", "N/A", "N/A"
+            reverse_primer, reverse_start, reverse_template, reverse_end = "N/A", "N/A", "N/A", "N/A"
+
+            forward_match = re.search(r"Forward primer\s+\d+\s+([A-Za-z]+)\s+\d+", pre_block)
+            reverse_match = re.search(r"Reverse primer\s+\d+\s+([A-Za-z]+)\s+\d+", pre_block)
+
+            if forward_match:
+                forward_primer = forward_match.group(1)
+            if reverse_match:
+                reverse_primer = reverse_match.group(1)
+
+            template_matches = re.findall(r"Template\s+(\d+)\s+([A-Za-z.\s]+)\s+(\d+)", pre_block)
+
+            if len(template_matches) > 0:
+                forward_start, forward_template, forward_end = template_matches[0]
+            if len(template_matches) > 1:
+                reverse_start, reverse_template, reverse_end = template_matches[1]
+
+            results.append({
+                "gene": html.unescape(info).strip() or "N/A",
+                "name": html.unescape(TAG.sub("", name)).strip(),
+                "product_length": product_length,
+                "forward_primer": forward_primer,
+                "forward_start": forward_start,
+                "forward_template": forward_template,
+                "forward_end": forward_end,
+                "reverse_primer": reverse_primer,
+                "reverse_start": reverse_start,
+                "reverse_template": reverse_template,
+                "reverse_end": reverse_end,
+            })
+        return results
+
+
+primer_blast_jobs = PrimerBlastJobs()
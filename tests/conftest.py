@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The package opens its caches at import: keep them out of ~/.labmaster and never answer from a previous run
+os.environ.setdefault("LABMASTER_CACHE_DIR", tempfile.mkdtemp(prefix="labmaster-tests-"))
+os.environ.setdefault("LABMASTER_DESIGN_CACHE", "0")
+os.environ.setdefault("LABMASTER_HTTP_CACHE", "0")
@@ -0,0 +1,129 @@
+import pytest
+
+from pages.design_primer_API.annotation import AnnotationIndex, LocalAnnotations, build_index, placement_rank
+
+
+def gff3_line(seqid, feature, start, end, strand, attributes):
+    return "\t".join([seqid, "RefSeq", feature, str(start), str(end), ".", strand, ".", attributes]) + "\n"
+
+
+GFF3 = "".join([
+    "##gff-version 3\n",
+    # Alternate locus first: the primary placement must still win
+    gff3_line("NW_003871103.3", "region", 1, 90000, "+", "ID=NW_003871103.3:1..90000;Name=Un"),
+    gff3_line("NW_003871103.3", "gene", 4000, 6200, "+", "ID=gene-XG-2;Dbxref=GeneID:7499;Name=XG;gene=XG"),
+    gff3_line("NW_003871103.3", "mRNA", 4000, 6200, "+",
+              "ID=rna-NM_001141919.2-2;Parent=gene-XG-2;transcript_id=NM_001141919.2;"
+              "product=X glycoprotein%2C transcript variant 1"),
+    gff3_line("NW_003871103.3", "exon", 5000, 5100, "+", "ID=exon-alt-1;Parent=rna-NM_001141919.2-2"),
+    gff3_line("NW_003871103.3", "exon", 6000, 6200, "+", "ID=exon-alt-2;Parent=rna-NM_001141919.2-2"),
+    gff3_line("NC_000023.11", "region", 1, 156040895, "+", "ID=NC_000023.11:1..156040895;chromosome=X"),
+    gff3_line("NC_000023.11", "gene", 1000, 2100, "+", "ID=gene-XG;Dbxref=GeneID:7499;Name=XG;gene=XG"),
+    gff3_line("NC_000023.11", "mRNA", 1000, 2100, "+",
+              "ID=rna-NM_001141919.2;Parent=gene-XG;transcript_id=NM_001141919.2;"
+              "product=X glycoprotein%2C transcript variant 1"),
+    gff3_line("NC_000023.11", "exon", 1000, 1100, "+", "ID=exon-1;Parent=rna-NM_001141919.2"),
+    gff3_line("NC_000023.11", "exon", 2000, 2100, "+", "ID=exon-2;Parent=rna-NM_001141919.2"),
+    gff3_line("NC_000023.11", "CDS", 1050, 1100, "+", "ID=cds-1;Parent=rna-NM_001141919.2"),
+    # Minus strand gene with two variants
+    gff3_line("NC_000023.11", "gene", 10000, 13000, "-", "ID=gene-ABC;Dbxref=GeneID:42;Name=ABC;gene=ABC"),
+    gff3_line("NC_000023.11", "mRNA", 10000, 13000, "-",
+              "ID=rna-NM_000002.1;Parent=gene-ABC;transcript_id=NM_000002.1;product=abc%2C transcript variant 2"),
+    gff3_line("NC_000023.11", "exon", 10000, 10200, "-", "ID=exon-3;Parent=rna-NM_000002.1"),
+    gff3_line("NC_000023.11", "exon", 12500, 13000, "-", "ID=exon-4;Parent=rna-NM_000002.1"),
+    gff3_line("NC_000023.11", "mRNA", 11000, 13000, "-",
+              "ID=rna-NM_000003.1;Parent=gene-ABC;transcript_id=NM_000003.1;product=abc%2C transcript variant 1"),
+    gff3_line("NC_000023.11", "exon", 11000, 11100, "-", "ID=exon-5;Parent=rna-NM_000003.1"),
+    gff3_line("NC_000023.11", "exon", 12500, 13000, "-", "ID=exon-6;Parent=rna-NM_000003.1"),
+])
+
+
+def gtf_line(seqid, feature, start, end, strand, attributes):
+    return "\t".join([seqid, "HAVANA", feature, str(start), str(end), ".", strand, ".", attributes]) + "\n"
+
+
+SHOX = 'gene_id "ENSG00000185960.14"; transcript_id "ENST00000381192.10"; gene_name "SHOX";'
+GTF = "".join([
+    gtf_line("chrX", "gene", 100, 900, "+", 'gene_id "ENSG00000185960.14"; gene_name "SHOX";'),
+    gtf_line("chrX", "transcript", 100, 900, "+", SHOX),
+    gtf_line("chrX", "exon", 100, 200, "+", SHOX + ' exon_number 1;'),
+    gtf_line("chrX", "exon", 800, 900, "+", SHOX + ' exon_number 2;'),
+    # Same transcript id on the chrY PAR
+    gtf_line("chrY", "transcript", 5100, 5900, "+", SHOX),
+    gtf_line("chrY", "exon", 5100, 5200, "+", SHOX + ' exon_number 1;'),
+    gtf_line("chrY", "exon", 5800, 5900, "+", SHOX + ' exon_number 2;'),
+])
+
+
+@pytest.fixture
+def gff3_index(tmp_path):
+    annotation = tmp_path / "genomic.gff"
+    annotation.write_text(GFF3)
+    index = AnnotationIndex(build_index(str(annotation), str(tmp_path / "refseq.sqlite"), "Homo sapiens"))
+    yield index
+    index.connection.close()
+
+
+@pytest.fixture
+def gtf_index(tmp_path):
+    annotation = tmp_path / "gencode.gtf"
+    annotation.write_text(GTF)
+    index = AnnotationIndex(build_index(str(annotation), str(tmp_path / "gencode.sqlite"), "Homo sapiens"))
+    yield index
+    index.connection.close()
+
+
+def test_placement_rank():
+    assert [placement_rank(seqid) for seqid in ["NC_000023.11", "chrX", "17", "MT", "chrM"]] == [0] * 5
+    assert [placement_rank(seqid) for seqid in ["NW_003871103.3", "NT_187633.1", "chr6_GL000251v2_alt", None]] == \
+        [1] * 4
+
+
+def test_primary_placement_by_symbol(gff3_index):
+    variants = gff3_index.find_variants("XG", "human")
+    assert list(variants) == ["NM_001141919"]
+    variant = variants["NM_001141919"]
+    assert variant['chraccver'] == "NC_000023.11"
+    assert variant['genomic_info'] == "Homo sapiens chromosome X"
+    assert variant['exon_coords'] == [(999, 1099), (1999, 2099)]
+    assert variant['normalized_exon_coords'] == [(0, 100), (1000, 1100)]
+    assert variant['entrez_id'] == "7499" and variant['gene_name'] == "XG" and variant['strand'] == "plus"
+
+
+def test_primary_placement_by_accession_and_entrez_id(gff3_index):
+    expected = [(999, 1099), (1999, 2099)]
+    assert gff3_index.find_variants("NM_001141919.2")["NM_001141919"]['exon_coords'] == expected
+    assert gff3_index.find_variants("7499", all_slice_forms=True)["NM_001141919"]['exon_coords'] == expected
+
+
+def test_minus_strand_and_variant_choice(gff3_index):
+    chosen = gff3_index.find_variants("ABC", "Homo sapiens")
+    assert list(chosen) == ["NM_000003"]
+    assert chosen["NM_000003"]['strand'] == "minus"
+    assert chosen["NM_000003"]['exon_coords'] == [(12999, 12499), (11099, 10999)]
+    assert chosen["NM_000003"]['normalized_exon_coords'] == [(0, 500), (1900, 2000)]
+
+    assert list(gff3_index.find_variants("ABC", all_slice_forms=True)) == ["NM_000002", "NM_000003"]
+    assert list(gff3_index.find_variants("NM_000002")) == ["NM_000002"]
+
+
+def test_unknown_gene(gff3_index):
+    assert gff3_index.find_variants("TP53") is None
+    assert gff3_index.find_variants("XG", "Mus musculus") is None
+
+
+def test_gtf_placements_stay_apart(gtf_index):
+    variants = gtf_index.find_variants("SHOX", "human", all_slice_forms=True)
+    assert list(variants) == ["ENST00000381192"]
+    assert variants["ENST00000381192"]['chraccver'] == "chrX"
+    assert variants["ENST00000381192"]['exon_coords'] == [(99, 199), (799, 899)]
+    assert variants["ENST00000381192"]['gene_name'] == "SHOX"
+    assert gtf_index.find_variants("ENST00000381192.10")["ENST00000381192"]['exon_coords'] == [(99, 199), (799, 899)]
+
+
+def test_local_annotations_tries_every_index(gff3_index, gtf_index):
+    annotations = LocalAnnotations()
+    annotations.indexes = [gff3_index, gtf_index]
+    assert list(annotations.find_variants("SHOX", "human")) == ["ENST00000381192"]
+    assert list(annotations.find_variants("XG", "human")) == ["NM_001141919"]
+    assert annotations.find_variants("TP53", "human") is None
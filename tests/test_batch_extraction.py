@@ -0,0 +1,126 @@
+import json
+import random
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import pages.design_primer_API as design_primer_API
+from pages.design_primer_API import NCBIdna
+from pages.design_primer_API.annotation import LocalAnnotations
+from pages.design_primer_API.fasta import LocalGenomes
+
+rng = random.Random(5)
+GENOME = "".join(rng.choice("ACGT") for _ in range(3000))
+
+# Entrez ID: (symbol, exons 0-based inclusive on NC_TEST.1, plus strand)
+GENES = {
+    "7157": ("TP53", [(100, 199), (400, 499)]),
+    "672": ("BRCA1", [(1000, 1099), (1500, 1649)]),
+    "999": ("TP53P1", [(2000, 2099)]),
+}
+
+
+def gene_record(entrez_id):
+    symbol, exons = GENES[entrez_id]
+    intervals = "".join(
+        f"<Seq-interval><Seq-interval_from>{start}</Seq-interval_from><Seq-interval_to>{end}</Seq-interval_to>"
+        f"<Seq-interval_strand><Na-strand value=\"plus\"/></Seq-interval_strand></Seq-interval>"
+        for start, end in exons)
+    return (f"<Entrezgene><Entrezgene_track-info><Gene-track><Gene-track_geneid>{entrez_id}</Gene-track_geneid>"
+            f"</Gene-track></Entrezgene_track-info>"
+            f"<Entrezgene_source><BioSource><BioSource_org><Org-ref><Org-ref_taxname>Homo sapiens</Org-ref_taxname>"
+            f"</Org-ref></BioSource_org></BioSource></Entrezgene_source>"
+            f"<Entrezgene_locus><Gene-commentary><Gene-commentary_accession>NC_TEST</Gene-commentary_accession>"
+            f"<Gene-commentary_products><Gene-commentary><Gene-commentary_type value=\"mRNA\">3</Gene-commentary_type>"
+            f"<Gene-commentary_label>transcript variant 1</Gene-commentary_label>"
+            f"<Gene-commentary_accession>NM_{entrez_id}</Gene-commentary_accession>"
+            f"<Gene-commentary_genomic-coords><Seq-loc><Seq-loc_mix><Seq-loc-mix>{intervals}"
+            f"</Seq-loc-mix></Seq-loc_mix></Seq-loc></Gene-commentary_genomic-coords></Gene-commentary>"
+            f"</Gene-commentary_products></Gene-commentary></Entrezgene_locus></Entrezgene>")
+
+
+def gene_summary(entrez_id):
+    symbol, exons = GENES[entrez_id]
+    return {"name": symbol, "organism": {"scientificname": "Homo sapiens"},
+            "genomicinfo": [{"chrloc": "17", "chraccver": "NC_TEST.1", "chrstart": exons[0][0],
+                             "chrstop": exons[-1][1]}]}
+
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeNCBI:
+    # E-utilities over GENES and GENOME, every request is recorded as (endpoint, db)
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def http_get(self, url, params=None, use_cache=True, retry_policy=None):
+        query = {key: values[0] for key, values in parse_qs(urlsplit(url).query).items()}
+        query.update(params or {})
+        endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+        with self.lock:
+            self.requests.append((endpoint, query["db"]))
+
+        if endpoint == "esearch.fcgi":
+            term = query["term"]
+            if " OR " in term:
+                # By relevance: a pseudogene first, then the genes whose symbol is in the batch
+                return FakeResponse(json.dumps({"esearchresult": {"count": "3", "idlist": ["999", "7157", "672"]}}))
+            # Single query: the alias is only known to the one-by-one search
+            idlist = ["7157"] if '"P53ALIAS"' in term else []
+            return FakeResponse(json.dumps({"esearchresult": {"count": str(len(idlist)), "idlist": idlist}}))
+        if endpoint == "esummary.fcgi" and query["db"] == "gene":
+            uids = query["id"].split(",")
+            return FakeResponse(json.dumps({"result": dict({"uids": uids}, **{uid: gene_summary(uid) for uid in uids})}))
+        if endpoint == "esummary.fcgi":
+            return FakeResponse(json.dumps({"result": {"uids": ["1"], "1": {"title": "Test chromosome"}}}))
+        if endpoint == "efetch.fcgi" and query["db"] == "gene":
+            return FakeResponse("<Entrezgene-Set>" + "".join(gene_record(uid) for uid in query["id"].split(","))
+                                + "</Entrezgene-Set>")
+        if endpoint == "efetch.fcgi":
+            return FakeResponse(f">{query['id']}\n" + GENOME[int(query["from"]) - 1:int(query["to"])] + "\n")
+        raise AssertionError(f"unexpected request {url}")
+
+
+@pytest.fixture
+def ncbi(monkeypatch):
+    fake = FakeNCBI()
+    monkeypatch.setattr(design_primer_API, "http_get", fake.http_get)
+    monkeypatch.setattr(design_primer_API, "local_annotations", LocalAnnotations())
+    monkeypatch.setattr(design_primer_API, "local_genomes", LocalGenomes())
+    return fake
+
+
+def test_batch_matches_symbols_and_falls_back_for_misses(ncbi):
+    calls = []
+    results = NCBIdna.find_sequences_batch(["TP53", "brca1", "P53ALIAS", "TP53"], "human",
+                                           progress=lambda done, total, gene_id: calls.append((done, total, gene_id)))
+
+    assert list(results) == ["TP53", "brca1", "P53ALIAS"]
+    assert list(results["TP53"][0]) == ["NM_7157"] and results["TP53"][1] == "OK"
+    assert list(results["brca1"][0]) == ["NM_672"]
+    assert list(results["P53ALIAS"][0]) == ["NM_7157"]
+    assert results["TP53"][0]["NM_7157"]["sequence"] == GENOME[100:500]
+    assert results["brca1"][0]["NM_672"]["sequence"] == GENOME[1000:1650]
+    assert results["brca1"][0]["NM_672"]["normalized_exon_coords"] == [(0, 99), (500, 649)]
+
+    # One batched esearch, one single esearch for the alias only, one efetch for every gene record
+    assert ncbi.requests.count(("esearch.fcgi", "gene")) == 2
+    assert ncbi.requests.count(("efetch.fcgi", "gene")) == 1
+    # The duplicate is counted once: progress ends on its total
+    assert sorted(gene_id for _, _, gene_id in calls) == ["P53ALIAS", "TP53", "brca1"]
+    assert {total for _, total, _ in calls} == {3} and calls[-1][0] == 3
+
+
+def test_unknown_gene_is_reported(ncbi):
+    results = NCBIdna.find_sequences_batch(["TP53", "NOTAGENE"], "human")
+    assert results["NOTAGENE"] == ("Error 200", "Please verify if NOTAGENE exist for human")
+    assert list(results["TP53"][0]) == ["NM_7157"]
@@ -0,0 +1,127 @@
+import os
+
+from pages.design_primer_API.cache import (DesignCache, ResponseCache, cache_key, cacheable, design_key, endpoint_of,
+                                           open_db)
+
+ESEARCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+EFETCH = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+
+
+def payload():
+    # Incompressible, so every entry weighs about the same once zlib'd
+    return os.urandom(1000).hex()
+
+
+def test_cache_key_ignores_param_order_and_api_key():
+    assert cache_key(ESEARCH, {"db": "gene", "term": "TP53"}) == \
+        cache_key(ESEARCH + "?term=TP53", {"db": "gene", "api_key": "secret"})
+    assert cache_key(ESEARCH, {"db": "gene", "term": "TP53"}) != cache_key(ESEARCH, {"db": "gene", "term": "BRCA1"})
+    assert endpoint_of(EFETCH) == "efetch.fcgi"
+
+
+def test_response_cache_round_trip():
+    cache = ResponseCache(path=":memory:")
+    assert cache.get(ESEARCH, {"term": "TP53"}) is None
+    cache.set(ESEARCH, {"term": "TP53"}, '{"esearchresult": {"idlist": ["7157"]}}')
+    response = cache.get(ESEARCH, {"term": "TP53"})
+    assert response.status_code == 200 and response.from_cache and not response.stale
+    assert response.json() == {"esearchresult": {"idlist": ["7157"]}}
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_response_cache_ttl_and_stale_answers():
+    cache = ResponseCache(path=":memory:", ttl={"esearch.fcgi": -1, "efetch.fcgi": 3600})
+    cache.set(ESEARCH, None, "expired")
+    cache.set(EFETCH, None, "fresh")
+    assert cache.get(ESEARCH) is None
+    stale = cache.get(ESEARCH, allow_stale=True)
+    assert stale.text == "expired" and stale.stale
+    assert cache.get(EFETCH).text == "fresh"
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(path=":memory:")
+    for name in "abc":
+        cache.set(ESEARCH, {"term": name}, payload())
+    cache.get(ESEARCH, {"term": "a"})
+    cache.max_bytes = cache.total_bytes
+    cache.set(ESEARCH, {"term": "d"}, payload())
+
+    assert cache.total_bytes <= cache.max_bytes
+    assert [name for name in "abcd" if cache.get(ESEARCH, {"term": name}) is not None] == ["a", "d"]
+    assert cache.evictions == 2
+
+
+def test_response_cache_replace_and_delete_keep_size_exact():
+    cache = ResponseCache(path=":memory:")
+    for _ in range(5):
+        cache.set(ESEARCH, {"term": "TP53"}, payload())
+    stored = cache.connection.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    assert cache.total_bytes == stored
+    cache.delete(ESEARCH, {"term": "TP53"})
+    assert cache.total_bytes == 0
+
+
+def test_cacheable_rejects_error_bodies():
+    assert cacheable(EFETCH, {"rettype": "fasta"}, ">NC_000017.11\nACGT\n")
+    assert not cacheable(EFETCH, {"rettype": "fasta"}, "Error: temporarily unavailable")
+    assert not cacheable(EFETCH + "?db=nuccore&rettype=fasta", None, "<html>busy</html>")
+    assert not cacheable(ESEARCH, None, "<!DOCTYPE html><html><body>Service unavailable</body></html>")
+    assert not cacheable(ESEARCH, None, '{"error": "API rate limit exceeded"}')
+    assert not cacheable(ESEARCH, None, '{"esearchresult": {"ERROR": "Invalid query"}}')
+    assert not cacheable(EFETCH, None, "<eFetchResult><ERROR>Empty id list</ERROR></eFetchResult>")
+    assert not cacheable(ESEARCH, None, "   ")
+    assert cacheable(ESEARCH, None, '{"esearchresult": {"idlist": [], "errorlist": {"phrasesnotfound": ["X"]}}}')
+
+
+def test_open_db_falls_back_to_memory(tmp_path):
+    path, connection = open_db(str(tmp_path / "sub" / "cache.sqlite"))
+    assert path.endswith("cache.sqlite") and os.path.exists(path)
+    connection.close()
+
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    path, connection = open_db(str(blocker / "cache.sqlite"))
+    assert path == ":memory:"
+    connection.execute("SELECT 1")
+
+
+def test_design_key_depends_on_every_input():
+    key = design_key("ACGT", [0, 10, 20, 10], {"PRIMER_NUM_RETURN": 3}, "2.0")
+    assert key == design_key("ACGT", [0, 10, 20, 10], {"PRIMER_NUM_RETURN": 3}, "2.0")
+    assert key != design_key("ACGA", [0, 10, 20, 10], {"PRIMER_NUM_RETURN": 3}, "2.0")
+    assert key != design_key("ACGT", [0, 10, 20, 11], {"PRIMER_NUM_RETURN": 3}, "2.0")
+    assert key != design_key("ACGT", [0, 10, 20, 10], {"PRIMER_NUM_RETURN": 4}, "2.0")
+    assert key != design_key("ACGT", [0, 10, 20, 10], {"PRIMER_NUM_RETURN": 3}, "2.1")
+
+
+def test_design_cache_round_trip_and_persistence(tmp_path):
+    path = str(tmp_path / "primer3.sqlite")
+    cache = DesignCache(path)
+    assert cache.get("k") is None
+    cache.set("k", {"PRIMER_PAIR_NUM_RETURNED": 1, "PRIMER_LEFT_0": [10, 20]})
+    assert cache.get("k") == {"PRIMER_PAIR_NUM_RETURNED": 1, "PRIMER_LEFT_0": [10, 20]}
+    assert DesignCache(path).get("k")["PRIMER_PAIR_NUM_RETURNED"] == 1
+
+    disabled = DesignCache(path, enabled=False)
+    assert disabled.get("k") is None
+
+
+def test_design_cache_replace_does_not_inflate_size():
+    cache = DesignCache(":memory:")
+    for _ in range(20):
+        cache.set("k", {"body": payload()})
+    assert cache.total_bytes == cache.connection.execute("SELECT SUM(size) FROM designs").fetchone()[0]
+    assert cache.evictions == 0
+
+
+def test_design_cache_evicts_least_recently_used():
+    cache = DesignCache(":memory:")
+    for name in "abc":
+        cache.set(name, {"body": payload()})
+    cache.get("a")
+    cache.max_bytes = cache.total_bytes
+    cache.set("d", {"body": payload()})
+
+    assert [name for name in "abcd" if cache.get(name) is not None] == ["a", "d"]
+    assert cache.evictions == 2
@@ -0,0 +1,114 @@
+import random
+import time
+
+import pytest
+
+import pages.design_primer_API as design_primer_API
+from pages.design_primer_API import NCBIdna, checkpoint
+from pages.design_primer_API.annotation import LocalAnnotations, build_index
+from pages.design_primer_API.checkpoint import ExtractionCheckpoint
+from pages.design_primer_API.fasta import LocalGenomes
+from pages.design_primer_API.planner import ExtractionPlanner
+
+GENES = ["GENE1", "GENE2", "GENE3"]
+
+
+def test_job_id_follows_genes_and_settings():
+    job = ExtractionCheckpoint.for_job(["TP53", "BRCA1"], path=":memory:", species="human", seq_type="rna")
+    assert job.job_id == ExtractionCheckpoint.for_job(["TP53", "BRCA1"], path=":memory:", seq_type="rna",
+                                                      species="human").job_id
+    assert job.job_id != ExtractionCheckpoint.for_job(["TP53", "BRCA1"], path=":memory:", species="mouse",
+                                                      seq_type="rna").job_id
+    assert job.job_id != ExtractionCheckpoint.for_job(["TP53"], path=":memory:", species="human",
+                                                      seq_type="rna").job_id
+
+
+def test_save_completed_clear(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    job = ExtractionCheckpoint.for_job(GENES, path=path, species="human")
+    other = ExtractionCheckpoint.for_job(GENES, path=path, species="mouse")
+    job.save("GENE1", {"NM_1": {"sequence": "ACGT", "exon_coords": [[1, 4]]}}, "OK")
+    other.save("GENE2", {"NM_2": {}}, "OK")
+
+    # Survives a restart, stays apart from other jobs
+    assert ExtractionCheckpoint.for_job(GENES, path=path, species="human").completed() == {
+        "GENE1": ({"NM_1": {"sequence": "ACGT", "exon_coords": [[1, 4]]}}, "OK")}
+    job.clear()
+    assert job.completed() == {}
+    assert list(other.completed()) == ["GENE2"]
+
+
+def test_old_jobs_are_dropped(tmp_path):
+    path = str(tmp_path / "checkpoints.sqlite")
+    job = ExtractionCheckpoint.for_job(GENES, path=path)
+    job.save("GENE1", {}, "OK")
+    time.sleep(0.02)
+    assert ExtractionCheckpoint(job.job_id, path, max_age=0.01).completed() == {}
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    # Three genes in a local annotation + genome: every extracted gene is one local genome read
+    rng = random.Random(8)
+    genome = "".join(rng.choice("ACGT") for _ in range(4000))
+    with open(tmp_path / "genome.fa", "w") as handle:
+        handle.write(">NC_TEST.1\n" + genome + "\n")
+    with open(tmp_path / "annotation.gtf", "w") as handle:
+        for number, gene in enumerate(GENES):
+            attributes = f'gene_id "{gene}"; transcript_id "NM_90000{number}.1"; gene_name "{gene}";'
+            first = number * 1000 + 1
+            features = [("transcript", first, first + 699), ("exon", first, first + 199),
+                        ("exon", first + 500, first + 699)]
+            for feature, start, end in features:
+                handle.write("\t".join(["NC_TEST.1", "TEST", feature, str(start), str(end), ".", "+", ".",
+                                         attributes]) + "\n")
+    annotations = LocalAnnotations()
+    annotations.add(build_index(str(tmp_path / "annotation.gtf"), str(tmp_path / "annotation.sqlite"),
+                                "Homo sapiens"))
+    genomes = LocalGenomes([str(tmp_path / "genome.fa")])
+    reads = []
+    fetch = genomes.fetch
+    genomes.fetch = lambda *args: reads.append(args) or fetch(*args)
+    monkeypatch.setattr(design_primer_API, "local_annotations", annotations)
+    monkeypatch.setattr(design_primer_API, "local_genomes", genomes)
+    monkeypatch.setattr(checkpoint, "cache_dir", str(tmp_path))
+    return reads
+
+
+def test_find_sequences_batch_skips_completed_genes(offline):
+    job = ExtractionCheckpoint.for_job(GENES, species="human")
+    first = NCBIdna.find_sequences_batch(GENES, "human", checkpoint=job)
+    assert len(offline) == 3 and set(job.completed()) == set(GENES)
+
+    offline.clear()
+    again = NCBIdna.find_sequences_batch(GENES, "human", checkpoint=job)
+    assert offline == []
+    # Saved as JSON: same sequences and messages, exon coordinates come back as lists
+    assert {gene_id: ({nm_id: data["sequence"] for nm_id, data in all_variants.items()}, message)
+            for gene_id, (all_variants, message) in again.items()} == {
+        gene_id: ({nm_id: data["sequence"] for nm_id, data in all_variants.items()}, message)
+        for gene_id, (all_variants, message) in first.items()}
+
+
+def test_planner_resumes_an_interrupted_run(offline):
+    groups = ExtractionPlanner.plan([{"Gene": gene, "human": True} for gene in GENES], ["human"])
+
+    def interrupt(done, total, gene_id, species):
+        if done == 2:
+            raise InterruptedError("Extraction cancelled")
+
+    with pytest.raises(InterruptedError):
+        list(ExtractionPlanner.run(groups, progress=interrupt, resume=True))
+    assert len(offline) == 3
+
+    offline.clear()
+    results = list(ExtractionPlanner.run(groups, resume=True))
+    assert [gene_id for gene_id, _, _, _ in results] == GENES
+    assert all(message == "OK" for _, _, _, message in results)
+    # Only the gene that was not saved before the interruption is read again
+    assert len(offline) == 1
+
+    # A finished run leaves nothing behind
+    offline.clear()
+    list(ExtractionPlanner.run(groups, resume=True))
+    assert len(offline) == 3
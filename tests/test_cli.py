@@ -0,0 +1,89 @@
+import csv
+import json
+import random
+
+import pytest
+
+import pages.design_primer_API as design_primer_API
+from pages.design_primer_API import cli
+from pages.design_primer_API.annotation import LocalAnnotations, build_index
+from pages.design_primer_API.fasta import LocalGenomes
+
+rng = random.Random(21)
+GENOME = "".join(rng.choice("ACGT") for _ in range(3000))
+# GENE1: two exons on the plus strand of NC_TEST.1 (GTF coordinates, 1-based)
+EXONS = [(501, 800), (1201, 1500)]
+GENE = 'gene_id "GENE1"; transcript_id "NM_900001.1"; gene_name "GENE1";'
+SETTINGS = {"species": "human", "seq_type": "rna",
+            "primer3": {"PRIMER_NUM_RETURN": 2, "PRIMER_PRODUCT_SIZE_RANGE": [80, 250]}}
+
+
+@pytest.fixture
+def offline(tmp_path, monkeypatch):
+    # Local annotation + local genome: the whole extraction runs without E-utilities
+    with open(tmp_path / "genome.fa", "w") as handle:
+        handle.write(">NC_TEST.1\n" + "\n".join(GENOME[i:i + 60] for i in range(0, len(GENOME), 60)) + "\n")
+    with open(tmp_path / "annotation.gtf", "w") as handle:
+        handle.write("\t".join(["NC_TEST.1", "TEST", "transcript", "501", "1500", ".", "+", ".", GENE]) + "\n")
+        for start, end in EXONS:
+            handle.write("\t".join(["NC_TEST.1", "TEST", "exon", str(start), str(end), ".", "+", ".", GENE]) + "\n")
+    annotations = LocalAnnotations()
+    annotations.add(build_index(str(tmp_path / "annotation.gtf"), str(tmp_path / "annotation.sqlite"),
+                                "Homo sapiens"))
+    monkeypatch.setattr(design_primer_API, "local_annotations", annotations)
+    monkeypatch.setattr(design_primer_API, "local_genomes", LocalGenomes([str(tmp_path / "genome.fa")]))
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("no request expected")
+
+    monkeypatch.setattr(design_primer_API, "http_get", no_network)
+
+    (tmp_path / "genes.txt").write_text("GENE1\n# comment\nGENE1\n")
+    (tmp_path / "settings.json").write_text(json.dumps(SETTINGS))
+    return tmp_path
+
+
+def test_genes_to_csv(offline):
+    output = offline / "primers.csv"
+    cli.main(["--genes", str(offline / "genes.txt"), "--settings", str(offline / "settings.json"),
+              "--output", str(output), "--workers", "1"])
+
+    with open(output, newline="") as handle:
+        rows = list(csv.DictReader(handle))
+    mrna = "".join(GENOME[start - 1:end] for start, end in EXONS)
+    assert [row["Pair"] for row in rows] == ["1", "2"]
+    for row in rows:
+        assert row["Variant"] == "NM_900001" and row["Gene"] == "GENE1"
+        assert row["For. Pr.(5'->3')"] in mrna
+        assert row["Product Seq. (5'->3')"] in mrna
+        assert int(row["Product Size (bp)"]) == len(row["Product Seq. (5'->3')"])
+        assert json.loads(row["For. Pos."])[1] - json.loads(row["For. Pos."])[0] == int(row["For. Len. (bp)"])
+
+
+def test_fasta_to_jsonl(tmp_path):
+    (tmp_path / "sequences.fa").write_text(f">GENE2 | Homo sapiens\n{GENOME[:600]}\n>GENE3\n{GENOME[1000:1600]}\n")
+    (tmp_path / "settings.json").write_text(json.dumps({"primer3": {"PRIMER_NUM_RETURN": 1}}))
+    output = tmp_path / "primers.jsonl"
+    cli.main(["--fasta", str(tmp_path / "sequences.fa"), "--settings", str(tmp_path / "settings.json"),
+              "--output", str(output), "--workers", "1"])
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(row["Variant"], row["Gene"], row["Species"]) for row in rows] == [
+        ("1", "GENE2", "Homo sapiens"), ("2", "GENE3", None)]
+    assert rows[0]["Product Seq. (5'->3')"] in GENOME[:600]
+
+
+def test_rejected_before_any_work(tmp_path, monkeypatch):
+    (tmp_path / "sequences.fa").write_text(f">GENE2\n{GENOME[:600]}\n")
+    (tmp_path / "settings.json").write_text(json.dumps({"primer3": {"PRIMER_NUM_RETUNR": 1}}))
+    monkeypatch.setattr(cli.Primer3, "design_variants", lambda *args, **kwargs: pytest.fail("design started"))
+
+    with pytest.raises(SystemExit):
+        cli.main(["--fasta", str(tmp_path / "sequences.fa"), "--settings", str(tmp_path / "settings.json"),
+                  "--output", str(tmp_path / "primers.csv")])
+    with pytest.raises(SystemExit):
+        cli.main(["--fasta", str(tmp_path / "sequences.fa"), "--output", str(tmp_path / "primers.xlsx")])
+
+    monkeypatch.setattr(cli.importlib.util, "find_spec", lambda name: None)
+    with pytest.raises(SystemExit):
+        cli.main(["--fasta", str(tmp_path / "sequences.fa"), "--output", str(tmp_path / "primers.parquet")])
@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+
+import primer3
+import pytest
+
+from pages.design_primer_API import Primer3
+
+
+def layout(seed, exon_count, exon_size=300, intron_size=100):
+    rng = random.Random(seed)
+    sequence = "".join(rng.choice("ACGT") for _ in range(exon_count * (exon_size + intron_size)))
+    exons = [(i * (exon_size + intron_size), i * (exon_size + intron_size) + exon_size - 1) for i in range(exon_count)]
+    return sequence, exons
+
+
+def baseline_order(primer3_input, primer3_params, exons, num_return, reverse_exon_order):
+    # The historical loop: every round asks primer3 again for every exon pair with PRIMER_NUM_RETURN one higher
+    exon_lengths = [end - start for start, end in exons]
+    cumulative_lengths = [0] + list(Primer3.cumsum(exon_lengths))
+    if len(exons) > 1:
+        if reverse_exon_order:
+            exon_pairs = [(j, i) for i in range(len(exons) - 1, -1, -1) for j in range(i - 1, -1, -1)]
+        else:
+            exon_pairs = [(i, j) for i in range(len(exons)) for j in range(i + 1, len(exons))]
+    else:
+        exon_pairs = [(0, 0)]
+
+    params = dict(primer3_params, PRIMER_NUM_RETURN=1)
+    primers, seen = [], set()
+    no_progress_count = 0
+    while len(primers) < num_return:
+        params['PRIMER_NUM_RETURN'] += 1
+        found = False
+        for i, j in exon_pairs:
+            if len(primers) >= num_return:
+                break
+            start1 = cumulative_lengths[i]
+            end1 = start1 + exons[i][1] - exons[i][0]
+            start2 = cumulative_lengths[j]
+            end2 = start2 + exons[j][1] - exons[j][0]
+            if end2 - start1 < 40:
+                continue
+            results = primer3.bindings.design_primers(
+                dict(primer3_input, SEQUENCE_PRIMER_PAIR_OK_REGION_LIST=[start1, end1 - start1, start2, end2 - start2]),
+                params)
+            for k in range(results.get('PRIMER_PAIR_NUM_RETURNED', 0)):
+                if len(primers) >= num_return:
+                    break
+                key = (results[f'PRIMER_LEFT_{k}_SEQUENCE'], results[f'PRIMER_RIGHT_{k}_SEQUENCE'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                primers.append(key)
+                found = True
+        no_progress_count = 0 if found else no_progress_count + 1
+        if no_progress_count >= 2:
+            break
+    return primers
+
+
+@pytest.mark.parametrize("seed, exon_count, num_return, reverse_exon_order", [
+    (1, 1, 4, False),
+    (2, 3, 6, False),
+    (3, 3, 6, True),
+    (4, 4, 5, False),
+    (5, 4, 5, True),
+])
+def test_same_order_as_baseline(monkeypatch, seed, exon_count, num_return, reverse_exon_order):
+    sequence, exons = layout(seed, exon_count)
+    calls = []
+    run_primer3 = Primer3.run_primer3
+
+    def recording_run_primer3(primer3_input, primer3_params, executor=None):
+        calls.append((dict(primer3_input), dict(primer3_params)))
+        return run_primer3(primer3_input, primer3_params, executor)
+
+    monkeypatch.setattr(Primer3, "run_primer3", staticmethod(recording_run_primer3))
+    designed = Primer3.design_primers(f"NM_{seed}", "GENE", "Homo sapiens", sequence, exons,
+                                      PRIMER_NUM_RETURN=num_return, reverse_exon_order=reverse_exon_order)
+
+    assert designed
+    primer3_input, primer3_params = calls[0]
+    primer3_input.pop('SEQUENCE_PRIMER_PAIR_OK_REGION_LIST')
+    expected = baseline_order(primer3_input, primer3_params, exons, num_return, reverse_exon_order)
+    assert [(record['left_primer']['sequence'], record['right_primer']['sequence']) for record in designed] == expected
+
+
+def test_records_describe_the_pair():
+    sequence, exons = layout(6, 2)
+    designed = Primer3.design_primers(7, "GENE", "Homo sapiens", sequence, exons, PRIMER_NUM_RETURN=2)
+    record = designed[0]
+    template = "".join(sequence[start:end + 1] for start, end in exons)
+    left, right = record['left_primer'], record['right_primer']
+    assert record['gene_name'] == "7 GENE"
+    assert template[left['position'][0]:left['position'][1]] == left['sequence']
+    assert record['amplicon_seq'] == template[left['position'][0]:right['position'][1] + 1]
+    assert record['amplicon_size'] == len(record['amplicon_seq'])
+    assert 80 <= record['amplicon_size'] <= 250
+    assert record['validation_relative'] is None and record['validation_absolute'] is None
+
+
+def slow_design(task):
+    # Later variants finish first: yielded order must still be the input order
+    variant, data, settings, executor = task
+    time.sleep(data['delay'])
+    return [f"{variant}-{settings['tag']}"]
+
+
+def test_design_variants_keeps_input_order(monkeypatch):
+    monkeypatch.setattr(Primer3, "design_variant", staticmethod(slow_design))
+    variants = [(f"NM_{number}", {'delay': (8 - number) * 0.01}) for number in range(8)]
+    progressed = []
+
+    designed = list(Primer3.design_variants(iter(variants), {'tag': "x"}, workers=2,
+                                            progress=lambda variant, data: progressed.append(variant)))
+    assert [variant for variant, _, _ in designed] == [variant for variant, _ in variants]
+    assert [primers for _, _, primers in designed] == [[f"{variant}-x"] for variant, _ in variants]
+    assert sorted(progressed) == sorted(variant for variant, _ in variants)
+
+
+def test_design_variants_stops_when_cancelled(monkeypatch):
+    monkeypatch.setattr(Primer3, "design_variant", staticmethod(slow_design))
+    read = []
+
+    def variants():
+        for number in range(20):
+            read.append(number)
+            yield f"NM_{number}", {'delay': 0.01}
+
+    cancel = threading.Event()
+    designed = []
+    for variant, data, primers in Primer3.design_variants(variants(), {'tag': "x"}, workers=2,
+                                                          cancelled=cancel.is_set):
+        designed.append(variant)
+        if len(designed) == 2:
+            cancel.set()
+
+    # What came out is still in input order, the rest of the input was never read
+    assert designed == [f"NM_{number}" for number in range(len(designed))]
+    assert len(designed) < 20 and len(read) < 20
@@ -0,0 +1,66 @@
+import random
+
+import pytest
+
+from pages.design_primer_API.fasta import IndexedFasta, LocalGenomes, build_fai
+
+random.seed(7)
+SEQUENCES = {
+    "NC_000017.11": "".join(random.choice("ACGTacgtN") for _ in range(1003)),
+    "NC_000006.12": "".join(random.choice("ACGT") for _ in range(120)),
+    "short": "ACG",
+}
+
+
+def write_fasta(path, width, newline="\n"):
+    with open(path, "w", newline="") as handle:
+        for name, sequence in SEQUENCES.items():
+            handle.write(f">{name} description{newline}")
+            for i in range(0, len(sequence), width):
+                handle.write(sequence[i:i + width] + newline)
+    return str(path)
+
+
+@pytest.mark.parametrize("width, newline", [(60, "\n"), (7, "\n"), (50, "\r\n")])
+def test_fetch_matches_slicing(tmp_path, width, newline):
+    fasta = IndexedFasta(write_fasta(tmp_path / "genome.fa", width, newline))
+    for name, sequence in SEQUENCES.items():
+        for start, end in [(1, len(sequence)), (1, 1), (len(sequence), len(sequence)), (2, 2 + width),
+                           (width, width + 1), (width + 1, 3 * width)]:
+            if end <= len(sequence):
+                assert fasta.fetch(name, start, end) == sequence[start - 1:end].upper()
+    fasta.close()
+
+
+def test_fetch_clamps_and_accepts_reversed_coordinates(tmp_path):
+    fasta = IndexedFasta(write_fasta(tmp_path / "genome.fa", 60))
+    sequence = SEQUENCES["NC_000006.12"]
+    assert fasta.fetch("NC_000006.12", 100, 20) == sequence[19:100]
+    assert fasta.fetch("NC_000006.12", -5, 10) == sequence[:10]
+    assert fasta.fetch("NC_000006.12", 100, 500) == sequence[99:]
+    assert fasta.fetch("NC_000006.12", 500, 600) == ""
+
+
+def test_fai_layout(tmp_path):
+    path = write_fasta(tmp_path / "genome.fa", 60)
+    with open(build_fai(path)) as fai:
+        rows = [line.rstrip("\n").split("\t") for line in fai]
+    assert [row[0] for row in rows] == list(SEQUENCES)
+    assert rows[0][1:] == ["1003", str(len(">NC_000017.11 description\n")), "60", "61"]
+    assert rows[2][1] == "3"
+
+
+def test_aliases(tmp_path):
+    path = write_fasta(tmp_path / "genome.fa", 60)
+    with open(path + ".aliases", "w") as handle:
+        handle.write("# alias\tname\nchr17\tNC_000017.11\n")
+    fasta = IndexedFasta(path, aliases={"6": "NC_000006.12"})
+    assert fasta.fetch("chr17", 1, 10) == SEQUENCES["NC_000017.11"][:10].upper()
+    assert fasta.fetch("6", 1, 10) == SEQUENCES["NC_000006.12"][:10]
+    assert "chr6" not in fasta
+
+
+def test_local_genomes(tmp_path):
+    genomes = LocalGenomes([write_fasta(tmp_path / "genome.fa", 60)])
+    assert genomes.fetch("short", 1, 3) == "ACG"
+    assert genomes.fetch("NC_000001.11", 1, 3) is None
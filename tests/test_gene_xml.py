@@ -0,0 +1,70 @@
+from pages.design_primer_API.gene_xml import index_gene_records
+
+
+def interval(start, end, strand):
+    return (f"<Seq-interval><Seq-interval_from>{start}</Seq-interval_from><Seq-interval_to>{end}</Seq-interval_to>"
+            f"<Seq-interval_strand><Na-strand value=\"{strand}\"/></Seq-interval_strand></Seq-interval>")
+
+
+def transcript(accession, label, exons, strand="minus"):
+    return (f"<Gene-commentary><Gene-commentary_type value=\"mRNA\">3</Gene-commentary_type>"
+            f"<Gene-commentary_label>{label}</Gene-commentary_label>"
+            f"<Gene-commentary_accession>{accession}</Gene-commentary_accession>"
+            f"<Gene-commentary_genomic-coords><Seq-loc><Seq-loc_mix><Seq-loc-mix>"
+            + "".join(interval(start, end, strand) for start, end in exons) +
+            f"</Seq-loc-mix></Seq-loc_mix></Seq-loc></Gene-commentary_genomic-coords>"
+            f"<Gene-commentary_products><Gene-commentary>"
+            f"<Gene-commentary_accession>NP_{accession[3:]}</Gene-commentary_accession>"
+            f"</Gene-commentary></Gene-commentary_products></Gene-commentary>")
+
+
+def entrezgene(gene_id, taxname, body):
+    return (f"<Entrezgene><Entrezgene_track-info><Gene-track><Gene-track_geneid>{gene_id}</Gene-track_geneid>"
+            f"</Gene-track></Entrezgene_track-info>"
+            f"<Entrezgene_source><BioSource><BioSource_org><Org-ref><Org-ref_taxname>{taxname}</Org-ref_taxname>"
+            f"</Org-ref></BioSource_org></BioSource></Entrezgene_source>{body}</Entrezgene>")
+
+
+TP53 = entrezgene("7157", "Homo sapiens", (
+    # RefSeq summary before the locus: accessions listed, no coordinates yet
+    "<Entrezgene_comments><Gene-commentary><Gene-commentary_accession>NM_000546</Gene-commentary_accession>"
+    "</Gene-commentary></Entrezgene_comments>"
+    "<Entrezgene_locus><Gene-commentary><Gene-commentary_accession>NC_000017</Gene-commentary_accession>"
+    "<Gene-commentary_products>"
+    + transcript("NM_000546", "transcript variant 1", [(7687489, 7687537), (7676520, 7676593)])
+    + transcript("NM_001126112", "transcript variant 2", [(7687376, 7687537), (7668401, 7669689)])
+    + "</Gene-commentary_products></Gene-commentary></Entrezgene_locus>"))
+
+TRNA = entrezgene("4558", "Homo sapiens", (
+    "<Entrezgene_locus><Gene-commentary><Gene-commentary_type value=\"tRNA\">8</Gene-commentary_type>"
+    "<Gene-commentary_accession>NC_012920</Gene-commentary_accession></Gene-commentary></Entrezgene_locus>"))
+
+
+def test_one_record():
+    record = index_gene_records(f"<Entrezgene-Set>{TP53}</Entrezgene-Set>")["7157"]
+    assert record['entrez_id'] == "7157"
+    assert record['species'] == "Homo sapiens"
+    assert record['chromosome'] == "NC_000017"
+    assert record['variants'] == ["NM_000546", "NM_001126112"]
+    assert record['tv'] == ["transcript variant 1", "transcript variant 2"]
+    assert not record['special']
+    # Protein products are indexed too, only transcripts are read back
+    assert {variant: record['exons'][variant] for variant in record['variants']} == {
+        "NM_000546": {'exon_coords': [(7687489, 7687537), (7676520, 7676593)], 'strand': "minus"},
+        "NM_001126112": {'exon_coords': [(7687376, 7687537), (7668401, 7669689)], 'strand': "minus"},
+    }
+
+
+def test_many_records_in_one_pass():
+    records = index_gene_records(f"<Entrezgene-Set>{TP53}{TRNA}</Entrezgene-Set>".encode("utf-8"))
+    assert list(records) == ["7157", "4558"]
+    assert records["4558"]['special']
+    assert records["4558"]['chromosome'] == "NC_012920"
+    assert records["4558"]['exons'] == {} and records["4558"]['variants'] == []
+    # Nothing leaks from one record into the next
+    assert records["7157"]['exons']["NM_000546"]['exon_coords'][0] == (7687489, 7687537)
+
+
+def test_record_without_locus():
+    record = index_gene_records(f"<Entrezgene-Set>{entrezgene('1', 'Mus musculus', '')}</Entrezgene-Set>")["1"]
+    assert record['chromosome'] == "" and record['exons'] == {} and record['species'] == "Mus musculus"
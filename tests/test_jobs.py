@@ -0,0 +1,93 @@
+import threading
+import time
+
+from pages.design_primer_API.jobs import JobRunner
+
+
+def wait(runner, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while not runner.get(job_id).is_finished():
+        assert time.time() < deadline, "job did not finish"
+        time.sleep(0.005)
+    return runner.get(job_id).snapshot()
+
+
+def genes(job, gene_ids, started, release):
+    # A worker like extraction_job: checks cancelled() between genes, results come in input order
+    job.progress(0, len(gene_ids))
+    for done, gene_id in enumerate(gene_ids, start=1):
+        if job.cancelled():
+            return
+        job.add_result(gene_id, gene_id.lower())
+        job.progress(done, message=gene_id)
+        if done == 2:
+            started.set()
+            release.wait(5)
+
+
+def test_job_runs_to_completion():
+    runner = JobRunner(max_workers=2)
+    release = threading.Event()
+    release.set()
+    job_id = runner.submit("extraction", genes, ["TP53", "BRCA1", "EGFR"], threading.Event(), release)
+    snapshot = wait(runner, job_id)
+    assert snapshot["status"] == "done"
+    assert (snapshot["done"], snapshot["total"], snapshot["message"]) == (3, 3, "EGFR")
+    assert list(snapshot["results"].items()) == [("TP53", "tp53"), ("BRCA1", "brca1"), ("EGFR", "egfr")]
+
+
+def test_cancel_mid_run_keeps_partial_results():
+    runner = JobRunner(max_workers=2)
+    started, release = threading.Event(), threading.Event()
+    job_id = runner.submit("extraction", genes, ["TP53", "BRCA1", "EGFR", "KRAS"], started, release)
+    assert started.wait(5)
+    assert runner.get(job_id).snapshot()["status"] == "running"
+    runner.cancel(job_id)
+    release.set()
+
+    snapshot = wait(runner, job_id)
+    assert snapshot["status"] == "cancelled"
+    assert list(snapshot["results"]) == ["TP53", "BRCA1"]
+    assert (snapshot["done"], snapshot["total"]) == (2, 4)
+
+
+def test_cancel_raised_from_progress_is_not_a_failure():
+    def stops_from_progress(job):
+        for done in range(1, 100):
+            if job.cancelled():
+                raise InterruptedError("Extraction cancelled")
+            job.progress(done)
+            time.sleep(0.005)
+
+    runner = JobRunner(max_workers=1)
+    job_id = runner.submit("design", stops_from_progress)
+    time.sleep(0.02)
+    runner.cancel(job_id)
+    snapshot = wait(runner, job_id)
+    assert snapshot["status"] == "cancelled" and snapshot["error"] is None
+
+
+def test_failed_job_keeps_its_error():
+    def fails(job):
+        raise ValueError("primer3 setting out of range")
+
+    runner = JobRunner(max_workers=1)
+    snapshot = wait(runner, runner.submit("design", fails))
+    assert snapshot["status"] == "failed"
+    assert snapshot["error"] == "primer3 setting out of range"
+
+
+def test_finished_jobs_are_pruned():
+    runner = JobRunner(max_workers=1, keep=0.01)
+    release = threading.Event()
+    release.set()
+    finished = runner.submit("extraction", genes, ["TP53"], threading.Event(), release)
+    wait(runner, finished)
+    time.sleep(0.02)
+
+    blocked = threading.Event()
+    running = runner.submit("extraction", genes, ["TP53", "BRCA1"], threading.Event(), blocked)
+    assert runner.get(finished) is None
+    assert runner.get(running) is not None
+    blocked.set()
+    wait(runner, running)
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from pages.design_primer_API import local_pcr
+from pages.design_primer_API.local_pcr import LocalPcr, PcrIndex, amplification_matrix, build_index
+from utils.sequence_ops import reverse_complement
+
+K = 8
+MAX_SIZE = 400
+
+random.seed(3)
+RECORDS = {f"NM_{i:06d}.1": "".join(random.choices("ACGT", k=random.randint(50, 1500))) for i in range(20)}
+RECORDS["NR_000001.1"] = "ACGTNNNN" + "".join(random.choices("ACGTN", k=500)).lower()
+# The same amplicon in two records, so one pair has two products
+RECORDS["NM_000100.1"] = RECORDS["NM_000001.1"][:300] + "".join(random.choices("ACGT", k=200))
+
+
+def brute_force_pcr(primer_fwd, primer_rev, max_size, k=K, max_mismatches=2):
+    # Every window of every record: 3' k bases exact, the rest within max_mismatches
+    def mismatches(a, b):
+        return sum(x != y for x, y in zip(a, b))
+
+    products = set()
+    for name, sequence in RECORDS.items():
+        sequence = sequence.upper()
+        lefts, rights = set(), set()
+        for primer in (primer_fwd, primer_rev):
+            target = reverse_complement(primer, upper=True)
+            for i in range(len(sequence) - len(primer) + 1):
+                window = sequence[i:i + len(primer)]
+                if window[-k:] == primer[-k:] and mismatches(window[:-k], primer[:-k]) <= max_mismatches:
+                    lefts.add(i)
+                if window[:k] == target[:k] and mismatches(window[k:], target[k:]) <= max_mismatches:
+                    rights.add(i + len(primer))
+        for start in lefts:
+            for end in rights:
+                if 0 < end - start <= max_size:
+                    products.add((f"{name}:{start + 1}+{end}", end - start, sequence[start:end]))
+    return products
+
+
+def primer_pairs(count):
+    long_records = [name for name, sequence in RECORDS.items() if len(sequence) > 250 and name.startswith("NM_")]
+    pairs = []
+    for trial in range(count):
+        sequence = RECORDS[random.choice(long_records)]
+        start = random.randint(0, len(sequence) - 200)
+        size = random.randint(60, 190)
+        primer_fwd = sequence[start:start + 20]
+        primer_rev = reverse_complement(sequence[start + size - 20:start + size], upper=True)
+        if trial % 3 == 0:
+            # 5' mismatches are tolerated
+            primer_fwd = "".join(random.choice("ACGT") if i < 3 else base for i, base in enumerate(primer_fwd))
+        pairs.append((primer_fwd, primer_rev))
+    pairs.append(("ACGTACGTACGTACGTAAAA", "TTTTGGGGCCCCAAAATTTT"))
+    return pairs
+
+
+def as_set(products):
+    assert all(product["size"] == len(product["sequence"]) for product in products)
+    return {(product["name"], product["size"], product["sequence"]) for product in products}
+
+
+@pytest.fixture(scope="module")
+def disk_index(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("pcr")
+    with open(directory / "transcripts.fa", "w") as handle:
+        for name, sequence in RECORDS.items():
+            handle.write(f">{name} description\n")
+            for i in range(0, len(sequence), 60):
+                handle.write(sequence[i:i + 60] + "\n")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # Small chunks so the build goes through several of them
+        monkeypatch.setattr(local_pcr, "CHUNK", 1000)
+        path = build_index(str(directory / "transcripts.fa"), str(directory / "index"), "Homo sapiens",
+                           "transcriptome", k=K)
+    return path
+
+
+@pytest.mark.parametrize("primer_fwd, primer_rev", primer_pairs(25))
+def test_pcr_matches_brute_force(disk_index, primer_fwd, primer_rev):
+    expected = brute_force_pcr(primer_fwd, primer_rev, MAX_SIZE)
+    assert as_set(PcrIndex(disk_index).pcr(primer_fwd, primer_rev, MAX_SIZE)) == expected
+    assert as_set(PcrIndex.from_sequences(RECORDS, k=K).pcr(primer_fwd, primer_rev, MAX_SIZE)) == expected
+
+
+def test_shared_amplicon_and_matrix():
+    index = PcrIndex.from_sequences(RECORDS, k=K)
+    primer_fwd = RECORDS["NM_000001.1"][50:70]
+    primer_rev = reverse_complement(RECORDS["NM_000001.1"][230:250], upper=True)
+    matrix = amplification_matrix(index, [("pair 1", primer_fwd, primer_rev)], MAX_SIZE)
+    assert matrix["pair 1"] == {"NM_000001.1": [200], "NM_000100.1": [200]}
+
+
+def test_primers_shorter_than_the_seed():
+    index = PcrIndex.from_sequences(RECORDS, k=K)
+    assert index.pcr("ACGT", "ACGT", MAX_SIZE) == []
+
+
+def test_local_pcr_validate(disk_index, monkeypatch):
+    monkeypatch.setenv("LABMASTER_PCR_INDEX", disk_index)
+    pcr = LocalPcr.from_env()
+    assert pcr.targets("Homo sapiens") == ["transcriptome"]
+    assert pcr.targets("Mus musculus") == []
+    assert pcr.validate("ACGT" * 5, "ACGT" * 5, "Mus musculus", "transcriptome", MAX_SIZE) is None
+    assert pcr.validate("ACGT" * 5, "ACGT" * 5, "Homo sapiens", "genome", MAX_SIZE) is None
+    assert pcr.validate("ACGTACGTACGTACGTAAAA", "TTTTGGGGCCCCAAAATTTT", "Homo sapiens", "transcriptome",
+                        MAX_SIZE) == ("Not found", [])
+
+    primer_fwd = RECORDS["NM_000001.1"][50:70]
+    primer_rev = reverse_complement(RECORDS["NM_000001.1"][230:250], upper=True)
+    validation, products = pcr.validate(primer_fwd, primer_rev, "Homo sapiens", "transcriptome", MAX_SIZE)
+    assert validation is True
+    assert {product["name"].split(":")[0] for product in products} == {"NM_000001.1", "NM_000100.1"}
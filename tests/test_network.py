@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+
+from pages.design_primer_API import network
+from pages.design_primer_API.network import SingleFlight
+
+
+def run_together(count, target):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_joiners_share_the_leader_result():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return object()
+
+    results, errors = run_together(5, lambda: flight.do("key", slow))
+    assert errors == [] and len(calls) == 1
+    assert len(results) == 5 and all(result is results[0] for result in results)
+    assert flight.joined == 4 and flight.in_flight() == 0
+
+    # Done calls are not remembered: the next one runs again
+    flight.do("key", slow)
+    assert len(calls) == 2
+
+
+def test_joiners_get_the_leader_exception():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise ValueError("NCBI down")
+
+    results, errors = run_together(3, lambda: flight.do("key", failing))
+    assert results == [] and len(errors) == 3
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flight.in_flight() == 0
+
+
+def test_different_keys_run_apart():
+    flight = SingleFlight()
+    assert [flight.do(key, lambda key=key: key * 2) for key in (1, 2)] == [2, 4]
+    assert flight.joined == 0
+
+
+@pytest.mark.parametrize("use_cache, expected_calls", [(True, 1), (False, 3)])
+def test_http_get_only_shares_cacheable_requests(monkeypatch, use_cache, expected_calls):
+    calls = []
+
+    def send_request(url, params=None, use_cache=True, retry_policy=None):
+        calls.append(url)
+        time.sleep(0.1)
+        return url
+
+    monkeypatch.setattr(network, "send_request", send_request)
+    results, errors = run_together(3, lambda: network.http_get("https://example.org/job", {"CMD": "request"},
+                                                               use_cache=use_cache))
+    assert errors == [] and results == ["https://example.org/job"] * 3
+    assert len(calls) == expected_calls
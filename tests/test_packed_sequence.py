@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from utils.packed_sequence import PackedSequence
+
+random.seed(5)
+
+
+def random_sequence(length):
+    # Mostly ACGT, with soft-masked stretches, N runs and the odd IUPAC code
+    parts = []
+    while sum(map(len, parts)) < length:
+        kind = random.random()
+        size = random.randint(1, 40)
+        if kind < 0.6:
+            parts.append("".join(random.choice("ACGT") for _ in range(size)))
+        elif kind < 0.8:
+            parts.append("".join(random.choice("acgtn") for _ in range(size)))
+        elif kind < 0.9:
+            parts.append(random.choice("Nn") * size)
+        else:
+            parts.append(random.choice("RYKMSWBDHVryk"))
+    return "".join(parts)[:length]
+
+
+@pytest.mark.parametrize("length", [0, 1, 3, 4, 5, 1000, 4099])
+def test_round_trip(length):
+    sequence = random_sequence(length)
+    packed = PackedSequence(sequence)
+    assert str(packed) == sequence
+    assert len(packed) == length
+    assert packed == sequence and packed == PackedSequence(sequence)
+
+
+def test_slices_and_indexing():
+    sequence = random_sequence(2000)
+    packed = PackedSequence(sequence)
+    for _ in range(500):
+        start, end = sorted(random.randint(-50, 2050) for _ in range(2))
+        assert packed[start:end] == sequence[start:end]
+    assert packed[::-1] == sequence[::-1]
+    assert packed[10:200:3] == sequence[10:200:3]
+    assert packed[-1] == sequence[-1] and packed[0] == sequence[0]
+    with pytest.raises(IndexError):
+        packed[2000]
+
+
+def test_bytes_input_and_preview():
+    packed = PackedSequence(b"ACGTNNNNacgt" * 10)
+    assert str(packed) == "ACGTNNNNacgt" * 10
+    assert packed.preview(12) == "ACGTNNNNacgt... (120 bp)"
+    assert PackedSequence("ACGT").preview() == "ACGT"
+
+
+def test_digest_and_hash_follow_content():
+    sequence = random_sequence(1000)
+    assert PackedSequence(sequence).digest() == PackedSequence(sequence).digest()
+    assert hash(PackedSequence(sequence)) == hash(sequence)
+    assert PackedSequence("ACGT").digest() != PackedSequence("ACGTA").digest()
+    assert PackedSequence("ACGT").digest() != PackedSequence("acgt").digest()
+    assert PackedSequence("ACNT").digest() != PackedSequence("ACRT").digest()
+
+
+def test_packing_is_smaller():
+    packed = PackedSequence("ACGT" * 10000)
+    assert packed.nbytes() < 40000 // 3
@@ -0,0 +1,61 @@
+from pages.design_primer_API import planner
+from pages.design_primer_API.planner import ExtractionPlanner
+
+SPECIES = ["human", "mouse"]
+
+
+def test_is_gene_id():
+    assert ExtractionPlanner.is_gene_id("7157")
+    assert ExtractionPlanner.is_gene_id("nm_000546.6")
+    assert not ExtractionPlanner.is_gene_id("TP53")
+
+
+def test_plan_groups_and_deduplicates():
+    rows = [
+        {"Gene": "TP53", "human": True, "mouse": True},
+        {"Gene": " tp53 ", "human": True, "mouse": False},
+        {"Gene": "BRCA1", "human": False, "mouse": True},
+        {"Gene": "NM_000546.6", "human": True, "mouse": True},
+        {"Gene": "NM_000546.5", "human": True},
+        {"Gene": "7157", "human": False, "mouse": False},
+        {"Gene": "", "human": True},
+    ]
+    groups = ExtractionPlanner.plan(rows, SPECIES)
+    assert groups == {
+        ("human", "rna", (0, 0)): ["TP53"],
+        ("mouse", "rna", (0, 0)): ["TP53", "BRCA1"],
+        (None, "rna", (0, 0)): ["NM_000546.6"],
+    }
+    assert ExtractionPlanner.job_count(groups) == 4
+
+
+def test_plan_window_only_for_promoter_and_terminator():
+    rows = [{"Gene": "TP53", "human": True}]
+    assert list(ExtractionPlanner.plan(rows, SPECIES, "promoter", 2000, 500)) == [("human", "promoter", (2000, 500))]
+    assert list(ExtractionPlanner.plan(rows, SPECIES, "gene", 2000, 500)) == [("human", "gene", (0, 0))]
+
+
+def test_run_calls_one_batch_per_group(monkeypatch):
+    calls = []
+
+    def find_sequences_batch(gene_ids, species, seq_type, upstream, downstream, genome_version, all_slice_forms,
+                             progress=None, checkpoint=None):
+        assert checkpoint is None
+        calls.append((list(gene_ids), species, seq_type, upstream, downstream, genome_version, all_slice_forms))
+        results = {}
+        for done, gene_id in enumerate(gene_ids, 1):
+            results[gene_id] = ({gene_id: {'species': species}}, f"ok {gene_id}")
+            progress(done, len(gene_ids), gene_id)
+        return results
+
+    monkeypatch.setattr(planner.NCBIdna, "find_sequences_batch", find_sequences_batch)
+    groups = {("human", "promoter", (2000, 500)): ["TP53", "BRCA1"], ("mouse", "promoter", (2000, 500)): ["Trp53"]}
+    reported = []
+    results = list(ExtractionPlanner.run(groups, "previous", True,
+                                         progress=lambda *args: reported.append(args)))
+
+    assert calls == [(["TP53", "BRCA1"], "human", "promoter", 2000, 500, "previous", True),
+                     (["Trp53"], "mouse", "promoter", 2000, 500, "previous", True)]
+    assert [(gene_id, species, message) for gene_id, species, _, message in results] == \
+        [("TP53", "human", "ok TP53"), ("BRCA1", "human", "ok BRCA1"), ("Trp53", "mouse", "ok Trp53")]
+    assert reported == [(1, 3, "TP53", "human"), (2, 3, "BRCA1", "human"), (3, 3, "Trp53", "mouse")]
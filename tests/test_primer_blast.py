@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from pages.design_primer_API import primer_blast
+from pages.design_primer_API.primer_blast import PrimerBlastError, PrimerBlastJobs
+
+SUBMITTED = '<form><input type="hidden" name="job_key" value="JSK123" /></form>'
+RUNNING = "<html>Job is running</html>"
+DONE = ('<a name="0"></a><table><tr><th>Forward primer</th><th>Reverse primer</th></tr></table>'
+        '<a href="/nuccore/viewer.fcgi?db=nucleotide&amp;id=1">NM_000546.6</a> Homo sapiens tumor protein p53'
+        '<pre>product length = 120\n'
+        'Forward primer  1    ACGTACGTACGTACGTACGT  20\n'
+        'Template        101  ....................  120\n\n'
+        'Reverse primer  1    TTGCATGCATGCATGCAAAA  20\n'
+        'Template        220  ....................  201</pre>')
+
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+
+class FakePrimerBlast:
+    # Submissions answer with one job key, polls say running `running` times before the results page
+    def __init__(self, running=1, result=DONE, submit_delay=0.0):
+        self.submissions = 0
+        self.polls = 0
+        self.running = running
+        self.result = result
+        self.submit_delay = submit_delay
+        self.lock = threading.Lock()
+
+    def http_get(self, url, params=None, use_cache=True, retry_policy=None):
+        assert use_cache is False
+        with self.lock:
+            if params.get("CMD") == "request":
+                self.submissions += 1
+            else:
+                self.polls += 1
+                polls = self.polls
+        if params.get("CMD") == "request":
+            time.sleep(self.submit_delay)
+            return FakeResponse(SUBMITTED)
+        return FakeResponse(RUNNING if polls <= self.running else self.result)
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakePrimerBlast()
+    monkeypatch.setattr(primer_blast, "http_get", fake.http_get)
+    return fake
+
+
+def test_job_is_polled_until_done(fake):
+    jobs = PrimerBlastJobs(min_delay=0.01, max_delay=0.02)
+    results = jobs.submit("Homo sapiens", "ACGTACGTACGTACGTACGT", "TTGCATGCATGCATGCAAAA").result(timeout=5)
+    assert fake.polls == 2
+    assert len(results) == 1
+    assert results[0]["name"] == "NM_000546.6"
+    assert results[0]["gene"] == "Homo sapiens tumor protein p53"
+    assert results[0]["product_length"] == 120
+    assert results[0]["forward_primer"] == "ACGTACGTACGTACGTACGT"
+    assert results[0]["forward_start"] == "101" and results[0]["reverse_end"] == "201"
+
+
+def test_same_job_key_submitted_twice_at_once(fake):
+    # Both submissions come back with the same job key, as when two identical requests are answered together
+    fake.submit_delay = 0.05
+    jobs = PrimerBlastJobs(min_delay=0.01, max_delay=0.02)
+    futures = []
+    threads = [threading.Thread(target=lambda: futures.append(jobs.submit("Danio rerio", "ACGT" * 5, "TTGC" * 5)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [len(future.result(timeout=5)) for future in futures] == [1, 1]
+    assert jobs.jobs == {}
+
+
+def test_no_results_and_timeout(fake):
+    fake.result = "<p>No target templates were found in selected database</p>"
+    assert PrimerBlastJobs(min_delay=0.01, max_delay=0.02).run(None, "ACGT" * 5, "TTGC" * 5) == []
+
+    fake.running = 10 ** 6
+    future = PrimerBlastJobs(min_delay=0.01, max_delay=0.02, timeout=0.05).submit(None, "ACGT" * 5, "TTGC" * 5)
+    with pytest.raises(PrimerBlastError, match="timed out"):
+        future.result(timeout=5)
+
+
+def test_refused_submission(monkeypatch):
+    monkeypatch.setattr(primer_blast, "http_get", lambda *args, **kwargs: FakeResponse("busy", 503))
+    with pytest.raises(PrimerBlastError, match="503"):
+        PrimerBlastJobs().submit(None, "ACGT" * 5, "TTGC" * 5).result(timeout=5)
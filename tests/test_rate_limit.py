@@ -0,0 +1,53 @@
+import threading
+import time
+
+from pages.design_primer_API.rate_limit import TokenBucket
+
+
+def timed(function):
+    start = time.monotonic()
+    function()
+    return time.monotonic() - start
+
+
+def test_first_token_is_immediate():
+    bucket = TokenBucket(rate=1)
+    assert timed(bucket.acquire) < 0.05
+
+
+def test_requests_are_spaced_at_the_rate():
+    bucket = TokenBucket(rate=20)
+    elapsed = timed(lambda: [bucket.acquire() for _ in range(6)])
+    assert 0.2 <= elapsed < 0.5
+
+
+def test_capacity_allows_a_burst():
+    bucket = TokenBucket(rate=1, capacity=5)
+    assert timed(lambda: [bucket.acquire() for _ in range(5)]) < 0.05
+
+
+def test_rate_is_shared_between_threads():
+    bucket = TokenBucket(rate=20)
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(2)]) for _ in range(4)]
+
+    def run():
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert timed(run) >= 0.3
+
+
+def test_drain_pauses_everyone():
+    bucket = TokenBucket(rate=50)
+    bucket.drain(seconds=0.2)
+    assert timed(bucket.acquire) >= 0.2
+
+
+def test_set_rate():
+    bucket = TokenBucket(rate=1)
+    bucket.acquire()
+    bucket.set_rate(50)
+    assert bucket.rate == 50
+    assert timed(bucket.acquire) < 0.2
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from pages.design_primer_API import NCBIdna
+
+rng = random.Random(13)
+CHROMOSOMES = {
+    "NC_A.1": "".join(rng.choice("ACGT") for _ in range(40000)),
+    "NC_B.1": "".join(rng.choice("ACGT") for _ in range(5000)),
+}
+
+
+@pytest.fixture
+def regions(monkeypatch):
+    # fetch_region over CHROMOSOMES, clipped at the chromosome start like efetch; every request is recorded
+    requests = []
+
+    def fetch_region(gene_name, chraccver, start, end, max_attempts=3):
+        start, end = min(start, end), max(start, end)
+        requests.append((chraccver, start, end))
+        return CHROMOSOMES[chraccver][max(start, 1) - 1:end]
+
+    monkeypatch.setattr(NCBIdna, "fetch_region", staticmethod(fetch_region))
+    return requests
+
+
+# gene: (chraccver, chrstart, chrstop, seq_type), chrstop < chrstart on the minus strand
+GENES = {
+    "NEAR_START": ("NC_A.1", 500, 1500, "promoter"),
+    "PLUS": ("NC_A.1", 3000, 4000, "promoter"),
+    "MINUS": ("NC_A.1", 9000, 7000, "promoter"),
+    "MINUS_END": ("NC_A.1", 9000, 7000, "terminator"),
+    "FAR": ("NC_A.1", 30000, 31000, "terminator"),
+    "OTHER": ("NC_B.1", 2500, 2000, "promoter"),
+}
+
+
+def windows(upstream=2000, downstream=200):
+    # What fetch_sequences builds for promoters and terminators
+    result = {}
+    for gene, (chraccver, chrstart, chrstop, seq_type) in GENES.items():
+        start, end = NCBIdna.dna_window(chrstart, chrstop, seq_type, upstream, downstream)
+        result[gene] = (gene, chraccver, start, end, chrstop < chrstart)
+    return result
+
+
+def one_by_one(upstream=2000, downstream=200):
+    return {gene: NCBIdna.get_dna_sequence(gene, chraccver, chrstart, chrstop, seq_type, upstream, downstream)
+            for gene, (chraccver, chrstart, chrstop, seq_type) in GENES.items()}
+
+
+def test_windows_match_one_request_per_window(regions):
+    expected = one_by_one()
+    regions.clear()
+    assert dict(NCBIdna.fetch_windows(windows())) == expected
+    # NC_A.1 up to MINUS_END in one region, FAR is more than WINDOW_MERGE_GAP away, NC_B.1 apart
+    assert sorted(regions) == [("NC_A.1", 1, 11001), ("NC_A.1", 29001, 31200), ("NC_B.1", 2302, 4501)]
+
+
+def test_window_clipped_at_chromosome_start(regions):
+    sequences = dict(NCBIdna.fetch_windows(windows()))
+    # 2000 bp upstream of position 500 starts before the chromosome: the window starts at base 1
+    assert sequences["NEAR_START"] == CHROMOSOMES["NC_A.1"][:700]
+    # Minus strand: 2000 bp above chrstart, read on the other strand
+    assert sequences["MINUS"] == NCBIdna.reverse_complement(CHROMOSOMES["NC_A.1"][8801:11001])
+
+
+def test_regions_are_split_past_max_region(regions):
+    expected = one_by_one()
+    regions.clear()
+    assert dict(NCBIdna.fetch_windows(windows(), max_region=3000)) == expected
+    assert all(end - start < 3000 + 2200 for _, start, end in regions)
+    assert len(regions) > 3
+
+
+def exon_by_exon(chraccver, exon_coords):
+    # One request per exon, spliced, reverse complemented on the minus strand
+    exons = sorted((min(start, end) + 1, max(start, end) + 1) for start, end in exon_coords)
+    mrna = "".join(NCBIdna.fetch_region("GENE", chraccver, start, end) for start, end in exons)
+    return NCBIdna.reverse_complement(mrna) if exon_coords[-1][1] < exon_coords[0][0] else mrna
+
+
+# exon_coords as build_variants gives them: 0-based, listed from the highest coordinate on the minus strand
+TRANSCRIPTS = {
+    "close": [(100, 199), (400, 499), (900, 1099)],
+    "far": [(100, 199), (15000, 15099), (15300, 15399)],
+    "minus": [(15399, 15300), (15099, 15000), (199, 100)],
+}
+
+
+@pytest.mark.parametrize("name, requests", [("close", 1), ("far", 2), ("minus", 2)])
+def test_mrna_matches_one_request_per_exon(regions, name, requests):
+    exon_coords = TRANSCRIPTS[name]
+    expected = exon_by_exon("NC_A.1", exon_coords)
+    regions.clear()
+    assert NCBIdna.get_mrna_sequence("GENE", "NC_A.1", exon_coords) == expected
+    # Exons closer than EXON_MERGE_GAP share one request, introns are never in the result
+    assert len(regions) == requests
+    assert len(expected) == sum(abs(end - start) + 1 for start, end in exon_coords)
+
+
+def test_minus_strand_mrna(regions):
+    genome = CHROMOSOMES["NC_A.1"]
+    plus = genome[100:200] + genome[15000:15100] + genome[15300:15400]
+    assert NCBIdna.get_mrna_sequence("GENE", "NC_A.1", TRANSCRIPTS["minus"]) == NCBIdna.reverse_complement(plus)
+    assert NCBIdna.get_mrna_sequence("GENE", "NC_A.1", TRANSCRIPTS["far"]) == plus
+
+
+def test_mrna_fails_with_one_region(monkeypatch, regions):
+    fetch_region = NCBIdna.fetch_region
+    monkeypatch.setattr(NCBIdna, "fetch_region", staticmethod(
+        lambda gene_name, chraccver, start, end, max_attempts=3:
+        None if start > 10000 else fetch_region(gene_name, chraccver, start, end, max_attempts)))
+    assert NCBIdna.get_mrna_sequence("GENE", "NC_A.1", TRANSCRIPTS["far"]) is None
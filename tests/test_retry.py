@@ -0,0 +1,118 @@
+import time
+from email.utils import formatdate
+
+import pytest
+import requests
+
+from pages.design_primer_API import NCBIdna, network, retry
+from pages.design_primer_API.retry import CircuitBreaker, RetryPolicy, circuit_breaker
+
+
+def test_delay_is_bounded_exponential_backoff():
+    policy = RetryPolicy(base_delay=0.5, max_delay=4.0)
+    for attempt in range(10):
+        for _ in range(50):
+            assert 0 <= policy.delay(attempt) <= min(4.0, 0.5 * 2 ** attempt)
+
+
+def test_delay_honours_retry_after_up_to_a_cap():
+    policy = RetryPolicy(base_delay=0.1, max_delay=0.2, max_retry_after=10.0)
+    assert policy.delay(0, retry_after=3.0) == 3.0
+    assert policy.delay(0, retry_after=120.0) == 10.0
+
+
+def test_parse_retry_after():
+    assert RetryPolicy.parse_retry_after(None) is None
+    assert RetryPolicy.parse_retry_after("") is None
+    assert RetryPolicy.parse_retry_after("7") == 7.0
+    assert RetryPolicy.parse_retry_after("-3") == 0.0
+    assert RetryPolicy.parse_retry_after("soon") is None
+    assert 25 <= RetryPolicy.parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+    assert RetryPolicy.parse_retry_after(formatdate(time.time() - 30, usegmt=True)) == 0.0
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow() and breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_lets_a_single_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_failed_trial_opens_again():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+
+def test_one_breaker_per_host():
+    assert circuit_breaker("example.org") is circuit_breaker("example.org")
+    assert circuit_breaker("example.org") is not circuit_breaker("example.com")
+
+
+class FailingSession:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.urls.append(url)
+        response = requests.Response()
+        response.status_code = 503
+        response._content = b"Service unavailable"
+        return response
+
+
+@pytest.fixture
+def failing_ncbi(monkeypatch):
+    session = FailingSession()
+    monkeypatch.setattr(network, "get_session", lambda host: session)
+    monkeypatch.setattr(network, "default_retry_policy", RetryPolicy(max_attempts=4, base_delay=0.001))
+    monkeypatch.setattr(network, "rate_limiters", {})
+    monkeypatch.setattr(retry, "circuit_breakers", {})
+    return session
+
+
+def test_a_failing_request_is_sent_max_attempts_times(failing_ncbi):
+    response = network.http_get("https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi", {"term": "TP53"})
+    assert response.status_code == 503
+    assert len(failing_ncbi.urls) == 4
+
+
+@pytest.mark.parametrize("call", [
+    lambda: NCBIdna.fetch_region("TP53", "NC_000017.11", 7668402, 7687550),
+    lambda: NCBIdna.get_mrna_sequence("TP53", "NC_000017.11", [(7687489, 7687537), (7676520, 7676593)]),
+    lambda: NCBIdna.transcripts_to_gene_ids(["NM_000546"]),
+    lambda: NCBIdna.convert_gene_to_entrez_id("TP53", "Homo sapiens"),
+    lambda: NCBIdna.gene_summaries(["7157"]),
+    lambda: NCBIdna.gene_records(["7157"]),
+    lambda: NCBIdna.all_variant("7157"),
+])
+def test_callers_do_not_retry_on_top_of_http_get(failing_ncbi, call):
+    call()
+    assert len(failing_ncbi.urls) == 4
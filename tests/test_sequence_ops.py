@@ -0,0 +1,57 @@
+import random
+
+from Bio.Seq import Seq
+
+from utils import sequence_ops
+
+random.seed(11)
+IUPAC = "ACGTRYSWKMBDHVNacgtryswkmbdhvn"
+
+
+def random_sequence(alphabet, length):
+    return "".join(random.choice(alphabet) for _ in range(length))
+
+
+def test_reverse_complement_matches_biopython():
+    for length in (0, 1, 17, 1000):
+        sequence = random_sequence(IUPAC, length)
+        assert sequence_ops.reverse_complement(sequence) == str(Seq(sequence).reverse_complement())
+        assert sequence_ops.complement(sequence) == str(Seq(sequence).complement())
+        assert sequence_ops.reverse_complement(sequence, upper=True) == \
+            str(Seq(sequence).reverse_complement()).upper()
+
+
+def test_accepts_bytes():
+    assert sequence_ops.reverse_complement(b"AACG") == "CGTT"
+    assert sequence_ops.to_upper(bytearray(b"acgtn")) == "ACGTN"
+
+
+def test_is_valid_dna():
+    assert sequence_ops.is_valid_dna("ACGTacgt")
+    assert sequence_ops.is_valid_dna("")
+    assert not sequence_ops.is_valid_dna("ACGTN")
+    assert sequence_ops.is_valid_dna("ACGTN", sequence_ops.ACGTN)
+    assert sequence_ops.is_valid_dna("RYKM", sequence_ops.IUPAC)
+    assert not sequence_ops.is_valid_dna("ACGT ", sequence_ops.IUPAC)
+    assert not sequence_ops.is_valid_dna("ACGTé")
+
+
+def test_invalid_bases():
+    assert sequence_ops.invalid_bases("ACGTNXX-") == ["-", "N", "X"]
+    assert sequence_ops.invalid_bases("acgt") == []
+
+
+def test_to_upper_only_touches_nucleotides():
+    assert sequence_ops.to_upper("acgtnryx") == "ACGTNRYx"
+
+
+def test_composition_and_gc_content():
+    sequence = random_sequence("ACGTNacgtn", 5000)
+    counts = sequence_ops.composition(sequence)
+    assert counts == {base: sequence.upper().count(base) for base in "ACGTN"}
+    assert sum(counts.values()) == len(sequence)
+
+    expected = sum(sequence.upper().count(base) for base in "GC") * 100 / len(sequence)
+    assert abs(sequence_ops.gc_content(sequence) - expected) < 1e-9
+    assert sequence_ops.gc_content("GGSS") == 100.0
+    assert sequence_ops.gc_content("") == 0.0
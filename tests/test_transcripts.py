@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import pages.design_primer_API as design_primer_API
+from pages.design_primer_API import NCBIdna
+from pages.design_primer_API.annotation import LocalAnnotations
+
+# nuccore UID: (caption, linked Entrez gene ID or None)
+NUCCORE = {
+    "1": ("NM_000546", "7157"),
+    "2": ("NM_007294", "672"),
+    "3": ("NR_999999", None),
+}
+
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class FakeEutils:
+    # esummary nuccore (accessions -> UIDs) and elink nuccore -> gene, `failing` endpoints answer 503
+    def __init__(self, failing=()):
+        self.failing = failing
+        self.requests = []
+
+    def http_get(self, url, params=None, use_cache=True, retry_policy=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.requests.append(endpoint)
+        if endpoint in self.failing:
+            return FakeResponse("Service Unavailable", 503)
+        if endpoint == "esummary.fcgi":
+            # Captions come back upper case and without version, whatever was asked
+            asked = {accession.split(".")[0].upper() for accession in params["id"].split(",")}
+            uids = [uid for uid, (caption, _) in NUCCORE.items() if caption in asked]
+            result = dict({"uids": uids}, **{uid: {"caption": NUCCORE[uid][0]} for uid in uids})
+            return FakeResponse(json.dumps({"result": result}))
+        if endpoint == "elink.fcgi":
+            linksets = [{"ids": [int(uid)],
+                         "linksetdbs": [{"linkname": "nuccore_gene", "links": [NUCCORE[uid][1]]}]
+                         if NUCCORE[uid][1] else []} for uid in params["id"]]
+            return FakeResponse(json.dumps({"linksets": linksets}))
+        raise AssertionError(f"unexpected request {url}")
+
+
+def use(monkeypatch, fake):
+    monkeypatch.setattr(design_primer_API, "http_get", fake.http_get)
+    monkeypatch.setattr(design_primer_API, "local_annotations", LocalAnnotations())
+    return fake
+
+
+def test_versioned_and_lower_case_accessions(monkeypatch):
+    fake = use(monkeypatch, FakeEutils())
+    assert NCBIdna.transcripts_to_gene_ids(["NM_000546.6", "nm_007294", "NR_999999.1", "XM_000001", "NM_000546.5"]) == {
+        "NM_000546": "7157",
+        "nm_007294": "672",
+        "NR_999999": "UIDs not founds",
+        "XM_000001": "UIDs not founds",
+    }
+    # One request pair for the whole list
+    assert fake.requests == ["esummary.fcgi", "elink.fcgi"]
+    assert NCBIdna.XMNM_to_gene_ID("nm_000546.6") == "7157"
+
+
+@pytest.mark.parametrize("failing", ["esummary.fcgi", "elink.fcgi"])
+def test_ncbi_failure_is_not_a_missing_accession(monkeypatch, failing):
+    use(monkeypatch, FakeEutils(failing=(failing,)))
+    gene_ids = NCBIdna.transcripts_to_gene_ids(["NM_000546.6", "XM_000001"])
+    assert gene_ids["NM_000546"] == "NCBI did not answer"
+    # Without esummary nothing is known, without elink an accession esummary did not find is still not found
+    assert gene_ids["XM_000001"] == ("NCBI did not answer" if failing == "esummary.fcgi" else "UIDs not founds")
+
+    message = "NCBI did not answer for NM_000546, please try again later"
+    assert NCBIdna.find_sequences_batch(["NM_000546.6"], "human")["NM_000546.6"] == ("Error 200", message)
+    assert NCBIdna("NM_000546.6", "human").find_sequences() == ("Error 200", message)
+
+
+def test_missing_accession_asks_to_verify_it(monkeypatch):
+    use(monkeypatch, FakeEutils())
+    assert NCBIdna.find_sequences_batch(["NR_999999.1"], "human")["NR_999999.1"] == (
+        "Error 200", "Please verify NR_999999 variant")
+    assert NCBIdna("NR_999999.1", "human").find_sequences() == ("Error 200", "Please verify NR_999999 variant")
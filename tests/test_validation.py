@@ -0,0 +1,86 @@
+import random
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+import pages.design_primer_API as design_primer_API
+from pages.design_primer_API import Primer3
+from pages.design_primer_API.primer_blast import PrimerBlastError
+
+PRODUCT = {"gene": "Homo sapiens tumor protein p53", "name": "NM_000546.6", "product_length": 120,
+           "forward_primer": "ACGT", "forward_start": "101", "forward_template": "....", "forward_end": "120",
+           "reverse_primer": "TTGC", "reverse_start": "220", "reverse_template": "....", "reverse_end": "201"}
+GENOME = [{"name": "chr17:7676520+7676640", "size": 121, "sequence": "ACGT"}]
+
+
+class FakeJobs:
+    def __init__(self, outcome):
+        self.outcome = outcome
+        self.submitted = []
+
+    def submit(self, species, primer_fwd, primer_rev):
+        self.submitted.append((species, primer_fwd, primer_rev))
+        future = Future()
+        # Answered from another thread, like the poller does
+        threading.Timer(0.02, lambda: future.set_exception(self.outcome) if isinstance(self.outcome, Exception)
+                        else future.set_result(self.outcome)).start()
+        return future
+
+
+@pytest.fixture
+def ucsc(monkeypatch):
+    # hgPcr found the genomic product, not the transcript one: primer-BLAST is asked
+    answers = {"results": (None, True, [], GENOME)}
+    monkeypatch.setattr(Primer3, "ucsc_pcr_results", staticmethod(lambda *args: answers["results"]))
+    return answers
+
+
+def test_primer_blast_answers_the_transcript_check(monkeypatch, ucsc):
+    jobs = FakeJobs([PRODUCT])
+    monkeypatch.setattr(design_primer_API, "primer_blast_jobs", jobs)
+    validation = Primer3.validate_pair("ACGT", "TTGC", "Homo sapiens", "Human", "hg38", ["genome", "hg38KgSeqV48"],
+                                       121, 250).result(timeout=5)
+    validation_relative, validation_absolute, sequence_relative, sequence_absolute = validation
+    assert jobs.submitted == [("Homo sapiens", "ACGT", "TTGC")]
+    assert validation_relative is True and validation_absolute is True
+    assert [product["size"] for product in sequence_relative] == [120]
+    assert sequence_relative[0]["gene"] == "NM_000546.6 Homo sapiens tumor protein p53"
+    assert sequence_absolute == GENOME
+
+
+def test_primer_blast_failure_is_reported_for_the_pair(monkeypatch, ucsc):
+    monkeypatch.setattr(design_primer_API, "primer_blast_jobs", FakeJobs(PrimerBlastError("job timed out")))
+    validation = Primer3.validate_pair("ACGT", "TTGC", "Homo sapiens", "Human", "hg38", ["genome", "hg38KgSeqV48"],
+                                       121, 250).result(timeout=5)
+    assert validation == ("Error job timed out", True, [], GENOME)
+
+
+def test_ucsc_answer_is_enough(monkeypatch, ucsc):
+    ucsc["results"] = (True, True, [{"size": 120}], GENOME)
+    jobs = FakeJobs([PRODUCT])
+    monkeypatch.setattr(design_primer_API, "primer_blast_jobs", jobs)
+    assert Primer3.validate_pair("ACGT", "TTGC", "Homo sapiens", "Human", "hg38",
+                                 ["genome", "hg38KgSeqV48"]).result(timeout=5)[0] is True
+    assert jobs.submitted == []
+
+
+def test_ucsc_error_fails_the_future(monkeypatch):
+    def unreachable(*args):
+        raise ConnectionError("genome.ucsc.edu")
+
+    monkeypatch.setattr(Primer3, "ucsc_pcr_results", staticmethod(unreachable))
+    with pytest.raises(ConnectionError):
+        Primer3.validate_pair("ACGT", "TTGC", "Homo sapiens", "Human", "hg38", ["genome"]).result(timeout=5)
+
+
+def test_design_keeps_pairs_whose_validation_never_answers(monkeypatch):
+    monkeypatch.setattr(design_primer_API, "VALIDATION_TIMEOUT", 0.05)
+    monkeypatch.setattr(Primer3, "validate_pair", staticmethod(lambda *args: Future()))
+    rng = random.Random(6)
+    sequence = "".join(rng.choice("ACGT") for _ in range(800))
+    designed = Primer3.design_primers("NM_1", "GENE", "Homo sapiens", sequence, [(0, 299), (400, 699)],
+                                      PRIMER_NUM_RETURN=2, ucsc_validation=True)
+    assert len(designed) == 2
+    assert all(record['validation_relative'] is None and record['validation_absolute'] is None
+               for record in designed)
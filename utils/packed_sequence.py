@@ -0,0 +1,116 @@
+import hashlib
+
+import numpy as np
+
+# A=0 C=1 G=2 T=3, four bases per byte. Anything else (N, IUPAC codes) goes to a run table, lowercase (soft-masked)
+# stretches to another one, so the decoded sequence is exactly the input.
+CODES = np.zeros(256, dtype=np.uint8)
+for code, base in enumerate(b"ACGT"):
+    CODES[base] = code
+    CODES[base + 32] = code
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+IS_ACGT = np.zeros(256, dtype=bool)
+IS_ACGT[list(b"ACGTacgt")] = True
+IS_LOWER = np.zeros(256, dtype=bool)
+IS_LOWER[list(range(ord("a"), ord("z") + 1))] = True
+SHIFTS = np.array([6, 4, 2, 0], dtype=np.uint8)
+
+
+def runs(mask):
+    # [start, end) of every stretch of True
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+    return edges[0::2], edges[1::2]
+
+
+class PackedSequence:
+    # 2 bits per base with lazy, range-only decoding: seq[a:b] only unpacks the bytes covering a..b.
+    # Slices, str() and len() behave like the original str, so Primer3.design_primers takes it as is.
+    def __init__(self, sequence):
+        values = np.frombuffer(sequence.encode("ascii") if isinstance(sequence, str) else bytes(sequence),
+                               dtype=np.uint8)
+        self.length = len(values)
+
+        codes = CODES[values]
+        padded = np.zeros(-(-self.length // 4) * 4, dtype=np.uint8)
+        padded[:self.length] = codes
+        self.packed = np.bitwise_or.reduce(padded.reshape(-1, 4) << SHIFTS, axis=1).astype(np.uint8).tobytes()
+
+        # Non-ACGT runs of a same character (case aside): start, end, uppercase byte
+        upper = np.where(IS_LOWER[values], values & 0xDF, values)
+        key = np.where(IS_ACGT[values], 0, upper).astype(np.uint8)
+        bounds = np.concatenate(([0], np.flatnonzero(key[1:] != key[:-1]) + 1, [self.length])).astype(np.int64)
+        starts, ends = bounds[:-1], bounds[1:]
+        keep = key[starts] != 0 if self.length else np.zeros(0, dtype=bool)
+        self.other_starts, self.other_ends = starts[keep], ends[keep]
+        self.other_bases = key[self.other_starts]
+
+        self.mask_starts, self.mask_ends = [array.astype(np.int64) for array in runs(IS_LOWER[values])]
+
+    def __len__(self):
+        return self.length
+
+    def decode(self, start, end):
+        start, end = max(0, start), min(self.length, end)
+        if end <= start:
+            return ""
+
+        first, last = start // 4, (end - 1) // 4 + 1
+        packed = np.frombuffer(self.packed, dtype=np.uint8)[first:last]
+        codes = ((packed[:, None] >> SHIFTS) & 3).reshape(-1)[start - first * 4:end - first * 4]
+        decoded = BASES[codes]
+
+        for starts, ends, value in ((self.other_starts, self.other_ends, self.other_bases),
+                                    (self.mask_starts, self.mask_ends, None)):
+            for i in range(np.searchsorted(ends, start, side="right"), np.searchsorted(starts, end)):
+                run_start, run_end = max(starts[i], start) - start, min(ends[i], end) - start
+                if value is None:
+                    decoded[run_start:run_end] |= 0x20
+                else:
+                    decoded[run_start:run_end] = value[i]
+
+        return decoded.tobytes().decode("ascii")
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.length)
+            if step == 1:
+                return self.decode(start, stop)
+            return self.decode(0, self.length)[item]
+        if item < 0:
+            item += self.length
+        if not 0 <= item < self.length:
+            raise IndexError("PackedSequence index out of range")
+        return self.decode(item, item + 1)
+
+    def __str__(self):
+        return self.decode(0, self.length)
+
+    def __repr__(self):
+        return f"PackedSequence({self.preview()!r})"
+
+    def __eq__(self, other):
+        if isinstance(other, PackedSequence):
+            other = str(other)
+        return isinstance(other, str) and str(self) == other
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def preview(self, size=50):
+        # What the pages show instead of the full sequence
+        if self.length <= size:
+            return str(self)
+        return f"{self.decode(0, size)}... ({self.length:,} bp)"
+
+    def digest(self):
+        # Content hash without decoding: equal for two PackedSequence of the same text
+        content = hashlib.sha256(self.length.to_bytes(8, "little"))
+        for part in (self.packed, self.other_starts, self.other_ends, self.other_bases, self.mask_starts,
+                     self.mask_ends):
+            content.update(len(part).to_bytes(8, "little"))
+            content.update(bytes(part))
+        return content.hexdigest()
+
+    def nbytes(self):
+        return (len(self.packed) + self.other_starts.nbytes + self.other_ends.nbytes + self.other_bases.nbytes
+                + self.mask_starts.nbytes + self.mask_ends.nbytes)
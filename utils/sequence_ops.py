@@ -0,0 +1,57 @@
+import numpy as np
+
+# Everything works on bytes: str.encode("ascii") once, then C-level translate/bincount instead of per-character Python
+ACGT = b"ACGTacgt"
+ACGTN = b"ACGTNacgtn"
+IUPAC = b"ACGTURYSWKMBDHVNacgturyswkmbdhvn"
+
+# Complement keeps the case, IUPAC ambiguity codes included (R <-> Y, K <-> M, B <-> V, D <-> H, S, W and N unchanged)
+COMPLEMENT = bytes.maketrans(b"ACGTURYSWKMBDHVNacgturyswkmbdhvn", b"TGCAAYRSWMKVHDBNtgcaayrswmkvhdbn")
+UPPER = bytes.maketrans(b"acgturyswkmbdhvn", b"ACGTURYSWKMBDHVN")
+
+# 1 for G/C (and S, strong) in both cases: one table lookup per base
+GC_TABLE = np.zeros(256, dtype=np.uint8)
+GC_TABLE[list(b"GCgcSs")] = 1
+
+
+def as_bytes(sequence):
+    if isinstance(sequence, (bytes, bytearray, memoryview)):
+        return bytes(sequence)
+    return str(sequence).encode("ascii", errors="replace")
+
+
+def is_valid_dna(sequence, alphabet=ACGT):
+    # Deleting every allowed byte leaves nothing behind for a valid sequence
+    return not as_bytes(sequence).translate(None, alphabet)
+
+
+def invalid_bases(sequence, alphabet=ACGT):
+    return sorted(set(as_bytes(sequence).translate(None, alphabet).decode("ascii", errors="replace")))
+
+
+def complement(sequence):
+    return as_bytes(sequence).translate(COMPLEMENT).decode("ascii")
+
+
+def reverse_complement(sequence, upper=False):
+    data = as_bytes(sequence).translate(COMPLEMENT)[::-1]
+    return (data.translate(UPPER) if upper else data).decode("ascii")
+
+
+def to_upper(sequence):
+    return as_bytes(sequence).translate(UPPER).decode("ascii")
+
+
+def composition(sequence, bases="ACGTN"):
+    # Case-insensitive base counts
+    counts = np.bincount(np.frombuffer(as_bytes(sequence).translate(UPPER), dtype=np.uint8), minlength=256)
+    return {base: int(counts[ord(base)]) for base in bases}
+
+
+def gc_content(sequence):
+    # Percent G+C (S counted as G/C), over the whole length like primer3
+    data = as_bytes(sequence)
+    if not data:
+        return 0.0
+    return float(GC_TABLE[np.frombuffer(data, dtype=np.uint8)].sum()) * 100 / len(data)
+